@@ -1,10 +1,24 @@
+import itertools
+import json
 import mysql.connector
 import os
 import logging
+import queue
+import sys
+import threading
+import time
+import weakref
+from collections import OrderedDict
+from datetime import datetime
+from functools import lru_cache
 from hashlib import sha256
 from contextlib import contextmanager
 from getpass import getpass
 
+import instrumentation
+from instrumentation import InstrumentedCursor
+from schema import FIELDS, is_valid_date, row_type
+
 # Configure logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 
@@ -12,303 +26,547 @@ logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(
 TABLE_APARTMENT_UNIT = "ApartmentUnit"
 TABLE_TENANT_OWNER = "TenantOwner"
 TABLE_PARKING = "Parking"
+TABLE_CHANGE_LOG = "ChangeLog"
+TABLE_CHANGE_SEQUENCE = "ChangeSequence"
+
+# Primary keys used for keyset pagination
+PRIMARY_KEYS = {
+    TABLE_APARTMENT_UNIT: "unit_number",
+    TABLE_TENANT_OWNER: "tenant_id",
+    TABLE_PARKING: "parking_id",
+}
+
+# Columns that apartment searches can filter and sort on
+SEARCH_COLUMNS = ("floor_number", "bedrooms", "bathrooms", "square_footage", "occupancy_status")
+
+# Rows fetched per page when streaming a table
+DEFAULT_PAGE_SIZE = int(os.environ.get("APARTMENT_PAGE_SIZE", "500"))
+
+# Database credentials, overridable from the environment
+DB_CONFIG = {
+    "host": os.environ.get("APARTMENT_DB_HOST", "localhost"),
+    "port": int(os.environ.get("APARTMENT_DB_PORT", "3306")),
+    "user": os.environ.get("APARTMENT_DB_USER", "root"),
+    "password": os.environ.get("APARTMENT_DB_PASSWORD", "#Quantum123"),
+    "database": os.environ.get("APARTMENT_DB_NAME", "Apartment"),
+}
+
+# Connection pool settings
+POOL_SIZE = int(os.environ.get("APARTMENT_POOL_SIZE", "5"))
+CONNECT_RETRIES = int(os.environ.get("APARTMENT_CONNECT_RETRIES", "3"))
+CONNECT_BACKOFF = float(os.environ.get("APARTMENT_CONNECT_BACKOFF", "0.5"))
+
+# Read cache settings; a TTL of 0 disables caching
+CACHE_TTL = float(os.environ.get("APARTMENT_CACHE_TTL", "30"))
+CACHE_MAX_ENTRIES = int(os.environ.get("APARTMENT_CACHE_MAX_ENTRIES", "1024"))
+CACHE_MAX_BYTES = int(os.environ.get("APARTMENT_CACHE_MAX_BYTES", str(64 * 1024 * 1024)))
+# Rows measured per page when estimating its cached size
+CACHE_SIZE_SAMPLE = 16
+
+# Statements a unit of work runs before committing on its own; 0 commits only at the end
+UNIT_OF_WORK_FLUSH_EVERY = int(os.environ.get("APARTMENT_FLUSH_EVERY", "0"))
+
+# Prepared statements kept open per connection, and distinct SQL statements remembered
+PREPARED_CACHE_SIZE = int(os.environ.get("APARTMENT_PREPARED_CACHE_SIZE", "64"))
+STATEMENT_REGISTRY_SIZE = 256
+
+# When set, insert/update/delete_record (and the parking, bulk import and
+# ledger writes) also append change events to the ChangeLog table (created by
+# `python audit.py setup`) in the same transaction
+AUDIT_ENABLED = os.environ.get("APARTMENT_AUDIT", "0") == "1"
 
 # Admin password hash (replace this with the hashed password for production)
 ADMIN_PASSWORD_HASH = sha256("admin123".encode()).hexdigest()
 
-@contextmanager
-def connect_to_database():
-    try:
-        connection = mysql.connector.connect(
-            host="localhost",
-            user="root",
-            password="#Quantum123",
-            database="Apartment"
-        )
-        yield connection
-    except mysql.connector.Error as e:
-        logging.error(f"Error connecting to database: {e}")
-        yield None
-    finally:
-        if connection and connection.is_connected():
+# Pool that opened each live connection
+_connection_pools = weakref.WeakKeyDictionary()
+
+class ConnectionPool:
+    def __init__(self, size=POOL_SIZE, retries=CONNECT_RETRIES, backoff=CONNECT_BACKOFF, scope=None, **config):
+        self.size = size
+        self.retries = retries
+        self.backoff = backoff
+        self.config = config or DB_CONFIG
+        # Pools with the same scope serve the same data and share cached reads
+        self.scope = scope or f"{self.config.get('host')}:{self.config.get('port')}/{self.config.get('database')}"
+        self._idle = queue.LifoQueue()
+        self._slots = threading.BoundedSemaphore(size)
+
+    def _connect(self):
+        delay = self.backoff
+        for attempt in range(1, self.retries + 1):
+            try:
+                connection = mysql.connector.connect(**self.config)
+                _connection_pools[connection] = self
+                return connection
+            except mysql.connector.Error as e:
+                if attempt == self.retries:
+                    raise
+                logging.warning(f"Connection attempt {attempt} failed ({e}); retrying in {delay:.1f}s")
+                time.sleep(delay)
+                delay *= 2
+
+    def _is_healthy(self, connection):
+        try:
+            connection.ping(reconnect=False)
+            return True
+        except mysql.connector.Error:
+            return False
+
+    def _discard(self, connection):
+        try:
             connection.close()
+        except mysql.connector.Error:
+            pass
 
-@contextmanager
-def get_cursor(connection):
-    try:
-        cursor = connection.cursor()
-        yield cursor
-    except mysql.connector.Error as e:
-        logging.error(f"Error with cursor: {e}")
-    finally:
-        cursor.close()
+    def acquire(self, timeout=None):
+        started = time.perf_counter()
+        if not self._slots.acquire(timeout=timeout):
+            raise mysql.connector.errors.PoolError("Timed out waiting for a pooled connection")
+        try:
+            while True:
+                try:
+                    connection = self._idle.get_nowait()
+                except queue.Empty:
+                    connection = self._connect()
+                    break
+                if self._is_healthy(connection):
+                    break
+                self._discard(connection)
+            instrumentation.note_connection_wait(time.perf_counter() - started)
+            return connection
+        except BaseException:
+            self._slots.release()
+            raise
 
-def validate_input(prompt, validator, error_message):
-    while True:
-        user_input = input(prompt).strip()
-        if validator(user_input):
-            return user_input
-        else:
-            print(error_message)
+    def release(self, connection):
+        try:
+            if connection.is_connected():
+                if connection.in_transaction:
+                    connection.rollback()
+                self._idle.put(connection)
+            else:
+                self._discard(connection)
+        except mysql.connector.Error:
+            self._discard(connection)
+        finally:
+            self._slots.release()
 
-def is_valid_integer(value):
-    return value.isdigit()
+    @contextmanager
+    def connection(self, timeout=None):
+        connection = self.acquire(timeout)
+        try:
+            yield connection
+        finally:
+            self.release(connection)
 
-def is_valid_date(value):
-    try:
-        datetime.strptime(value, '%Y-%m-%d')
-        return True
-    except ValueError:
-        return False
+    def close(self):
+        while True:
+            try:
+                self._discard(self._idle.get_nowait())
+            except queue.Empty:
+                return
 
-def secure_admin_login():
-    password = getpass("Enter admin password: ")
-    return sha256(password.encode()).hexdigest() == ADMIN_PASSWORD_HASH
+class PreparedStatementCache:
+    def __init__(self, max_statements=PREPARED_CACHE_SIZE):
+        self.max_statements = max_statements
+        self.prepares = 0
+        self.reuses = 0
+        self._by_connection = weakref.WeakKeyDictionary()
+        self._lock = threading.Lock()
 
-def display_menu(options):
-    for i, option in enumerate(options, 1):
-        print(f"{i}. {option}")
-    return validate_input("Enter your choice: ", is_valid_integer, "Invalid choice. Please enter a number.")
+    def _statements(self, connection):
+        # A reconnect gives the session a new id and drops its server-side
+        # statements, so the cached cursors are abandoned and re-prepared.
+        connection_id = getattr(connection, "connection_id", None)
+        entry = self._by_connection.get(connection)
+        if entry is None or entry[0] != connection_id:
+            entry = (connection_id, OrderedDict())
+            self._by_connection[connection] = entry
+        return entry[1]
 
-def execute_query(connection, query, data=None):
-    with get_cursor(connection) as cursor:
-        cursor.execute(query, data)
-        connection.commit()
-        return cursor
+    def cursor(self, connection, query):
+        with self._lock:
+            statements = self._statements(connection)
+            cursor = statements.get(query)
+            if cursor is not None:
+                statements.move_to_end(query)
+                self.reuses += 1
+                return cursor
+            cursor = connection.cursor(prepared=True)
+            statements[query] = cursor
+            self.prepares += 1
+            while len(statements) > self.max_statements:
+                _, evicted = statements.popitem(last=False)
+                self._close(evicted)
+            return cursor
 
-def view_table(connection, table_name):
-    query = f"SELECT * FROM {table_name}"
-    with get_cursor(connection) as cursor:
-        cursor.execute(query)
-        rows = cursor.fetchall()
-        if rows:
-            for row in rows:
-                print(row)
-        else:
-            print(f"No data found in {table_name}.")
+    def discard(self, connection, query):
+        with self._lock:
+            cursor = self._statements(connection).pop(query, None)
+        if cursor is not None:
+            self._close(cursor)
 
-def search_apartments(connection):
-    filters = {
-        "1": ("floor_number", "Enter floor number: "),
-        "2": ("bedrooms", "Enter number of bedrooms: "),
-        "3": ("bathrooms", "Enter number of bathrooms: "),
-        "4": ("square_footage", "Enter square footage: "),
-        "5": ("occupancy_status", "Enter occupancy status: ")
-    }
+    @staticmethod
+    def _close(cursor):
+        try:
+            cursor.close()
+        except mysql.connector.Error:
+            pass
 
-    choice = display_menu([
-        "By Floor Number", 
-        "By Number of Bedrooms", 
-        "By Number of Bathrooms", 
-        "By Square Footage", 
-        "By Occupancy Status", 
-        "Cancel"
-    ])
+    def stats(self):
+        return {"prepares": self.prepares, "reuses": self.reuses}
 
-    if choice == "6":
-        return
+prepared_statements = PreparedStatementCache()
 
-    column, prompt = filters.get(choice, (None, None))
-    if column:
-        value = validate_input(prompt, str.isdigit if column != "occupancy_status" else str.isalnum, "Invalid input.")
-        query = f"SELECT * FROM {TABLE_APARTMENT_UNIT} WHERE {column} = %s"
-        with get_cursor(connection) as cursor:
-            cursor.execute(query, (value,))
-            apartments = cursor.fetchall()
-            for apartment in apartments:
-                print(apartment)
-    else:
-        print("Invalid choice. Please try again.")
+_pool = None
+_pool_lock = threading.Lock()
 
-def add_details(connection, table_name, fields):
-    data = []
-    for field, prompt, validator, error_msg in fields:
-        value = validate_input(prompt, validator, error_msg)
-        data.append(value)
-    placeholders = ", ".join(["%s"] * len(data))
-    columns = ", ".join([field for field, _, _, _ in fields])
-    query = f"INSERT INTO {table_name} ({columns}) VALUES ({placeholders})"
-    execute_query(connection, query, tuple(data))
-    print(f"{table_name[:-1]} details added successfully.")
+def get_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ConnectionPool()
+        return _pool
 
-def update_details(connection, table_name, primary_key, primary_value, fields):
-    choice = display_menu([f"Update {field}" for field, _, _, _ in fields])
-    field, prompt, validator, error_msg = fields[int(choice) - 1]
-    new_value = validate_input(prompt, validator, error_msg)
-    query = f"UPDATE {table_name} SET {field} = %s WHERE {primary_key} = %s"
-    execute_query(connection, query, (new_value, primary_value))
-    print(f"{field} updated successfully.")
+def pool_of(source):
+    # The pool a data source draws from: the pool itself, the default pool for
+    # None, or the pool that opened a connection (None if it came from elsewhere)
+    if source is None:
+        return get_pool()
+    if isinstance(source, ConnectionPool):
+        return source
+    return _connection_pools.get(source)
 
-def delete_details(connection, table_name, primary_key):
-    primary_value = validate_input(f"Enter {primary_key} of the record to delete: ", str.isdigit, "Invalid input.")
-    query = f"DELETE FROM {table_name} WHERE {primary_key} = %s"
-    execute_query(connection, query, (primary_value,))
-    print(f"Record deleted from {table_name}.")
+def cache_scope(source):
+    pool = pool_of(source)
+    return pool.scope if pool is not None else None
 
-def main():
-    with connect_to_database() as connection:
-        if connection:
-            while True:
-                user_choice = display_menu(["Regular User", "Admin", "Exit"])
-
-                if user_choice == "1":
-                    while True:
-                        choice = display_menu(["View Apartment Details", "View Tenant Details", "View Parking Details", "Search Apartments", "Exit"])
-                        if choice == "1":
-                            view_table(connection, TABLE_APARTMENT_UNIT)
-                        elif choice == "2":
-                            view_table(connection, TABLE_TENANT_OWNER)
-                        elif choice == "3":
-                            view_table(connection, TABLE_PARKING)
-                        elif choice == "4":
-                            search_apartments(connection)
-                        elif choice == "5":
-                            break
-                        else:
-                            print("Invalid choice. Please try again.")
-
-                elif user_choice == "2":
-                    if secure_admin_login():
-                        while True:
-                            choice = display_menu([
-                                "View Apartment Details", "View Tenant Details", 
-                                "View Parking Details", "Search Apartments", 
-                                "Add Apartment Details", "Add Tenant Details", 
-                                "Add Parking Details", "Update Apartment Details", 
-                                "Update Tenant Details", "Update Parking Details", 
-                                "Delete Apartment Details", "Delete Tenant Details", 
-                                "Delete Parking Details", "Exit"
-                            ])
-
-                            if choice == "1":
-                                view_table(connection, TABLE_APARTMENT_UNIT)
-                            elif choice == "2":
-                                view_table(connection, TABLE_TENANT_OWNER)
-                            elif choice == "3":
-                                view_table(connection, TABLE_PARKING)
-                            elif choice == "4":
-                                search_apartments(connection)
-                            elif choice == "5":
-                                fields = [
-                                    ("unit_number", "Enter unit number: ", str.isdigit, "Invalid unit number."),
-                                    ("floor_number", "Enter floor number: ", str.isdigit, "Invalid floor number."),
-                                    ("bedrooms", "Enter number of bedrooms: ", str.isdigit, "Invalid number."),
-                                    ("bathrooms", "Enter number of bathrooms: ", str.isdigit, "Invalid number."),
-                                    ("square_footage", "Enter square footage: ", str.isdigit, "Invalid square footage."),
-                                    ("rent_ownership_details", "Enter rent/ownership details: ", str.isalnum, "Invalid details."),
-                                    ("occupancy_status", "Enter occupancy status: ", str.isalnum, "Invalid status.")
-                                ]
-                                add_details(connection, TABLE_APARTMENT_UNIT, fields)
-                            elif choice == "6":
-                                fields = [
-                                    ("name", "Enter tenant name: ", str.isalnum, "Invalid name."),
-                                    ("contact_info", "Enter contact information: ", str.isdigit, "Invalid contact info."),
-                                    ("lease_start_date", "Enter lease start date (YYYY-MM-DD): ", is_valid_date, "Invalid date format."),
-                                    ("lease_end_date", "Enter lease end date (YYYY-MM-DD): ", is_valid_date, "Invalid date format."),
-                                    ("emergency_contact", "Enter emergency contact: ", str.isalnum, "Invalid contact."),
-                                    ("rent_payment_history", "Enter rent/payment history: ", str.isalnum, "Invalid history.")
-                                ]
-                                add_details(connection, TABLE_TENANT_OWNER, fields)
-                            elif choice == "7":
-                                fields = [
-                                    ("parking_space_number", "Enter parking space number: ", str.isdigit, "Invalid number."),
-                                    ("vehicle_details", "Enter vehicle details: ", str.isalnum, "Invalid details."),
-                                    ("availability_status", "Enter availability status: ", str.isalnum, "Invalid status.")
-                                ]
-                                add_details(connection, TABLE_PARKING, fields)
-                            elif choice == "8":
-                                primary_value = validate_input("Enter unit number to update: ", str.isdigit, "Invalid unit number.")
-                                fields = [
-                                    ("floor_number", "Enter new floor number: ", str.isdigit, "Invalid floor number."),
-                                    ("bedrooms", "Enter new number of bedrooms: ", str.isdigit, "Invalid number."),
-                                    ("bathrooms", "Enter new number of bathrooms: ", str.isdigit, "Invalid number."),
-                                    ("square_footage", "Enter new square footage: ", str.isdigit, "Invalid square footage."),
-                                    ("rent_ownership_details", "Enter new rent/ownership details: ", str.isalnum, "Invalid details."),
-                                    ("occupancy_status", "Enter new occupancy status: ", str.isalnum, "Invalid status.")
-                                ]
-                                update_details(connection, TABLE_APARTMENT_UNIT, "unit_number", primary_value, fields)
-                            elif choice == "9":
-                                primary_value = validate_input("Enter tenant ID to update: ", str.isdigit, "Invalid tenant ID.")
-                                fields = [
-                                    ("name", "Enter new tenant name: ", str.isalnum, "Invalid name."),
-                                    ("contact_info", "Enter new contact information: ", str.isdigit, "Invalid contact info."),
-                                    ("lease_start_date", "Enter new lease start date (YYYY-MM-DD): ", is_valid_date, "Invalid date format."),
-                                    ("lease_end_date", "Enter new lease end date (YYYY-MM-DD): ", is_valid_date, "Invalid date format."),
-                                    ("emergency_contact", "Enter new emergency contact: ", str.isalnum, "Invalid contact."),
-                                    ("rent_payment_history", "Enter new rent/payment history: ", str.isalnum, "Invalid history.")
-                                ]
-                                update_details(connection, TABLE_TENANT_OWNER, "tenant_id", primary_value, fields)
-                            elif choice == "10":
-                                primary_value = validate_input("Enter parking ID to update: ", str.isdigit, "Invalid parking ID.")
-                                fields = [
-                                    ("parking_space_number", "Enter new parking space number: ", str.isdigit, "Invalid number."),
-                                    ("vehicle_details", "Enter new vehicle details: ", str.isalnum, "Invalid details."),
-                                    ("availability_status", "Enter new availability status: ", str.isalnum, "Invalid status.")
-                                ]
-                                update_details(connection, TABLE_PARKING, "parking_id", primary_value, fields)
-                            elif choice == "11":
-                                delete_details(connection, TABLE_APARTMENT_UNIT, "unit_number")
-                            elif choice == "12":
-                                delete_details(connection, TABLE_TENANT_OWNER, "tenant_id")
-                            elif choice == "13":
-                                delete_details(connection, TABLE_PARKING, "parking_id")
-                            elif choice == "14":
-                                break
-                            else:
-                                print("Invalid choice. Please try again.")
-                    else:
-                        print("Invalid password. Access denied.")
-                elif user_choice == "3":
-                    break
-                else:
-                    print("Invalid choice. Please try again.")
+class QueryCache:
+    def __init__(self, ttl=CACHE_TTL, max_entries=CACHE_MAX_ENTRIES, max_bytes=CACHE_MAX_BYTES):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+        self.size = 0
+        self._entries = OrderedDict()
+        self._keys_by_table = {}
+        # Bumped by every invalidate, so a page read before a write cannot be
+        # cached after the write's invalidation
+        self._generations = {}
+        self._lock = threading.Lock()
 
-if __name__ == "__main__":
-    main()
-import mysql.connector
-import os
-import logging
-from hashlib import sha256
-from contextlib import contextmanager
-from getpass import getpass
+    @staticmethod
+    def _estimate_size(rows):
+        # Extrapolated from evenly spaced sample rows, so sizing costs the same for any page
+        sample = rows[::max(1, len(rows) // CACHE_SIZE_SAMPLE)]
+        if not sample:
+            return sys.getsizeof(rows)
+        sample_size = sum(sys.getsizeof(row) + sum(sys.getsizeof(value) for value in row) for row in sample)
+        return sys.getsizeof(rows) + sample_size * len(rows) // len(sample)
 
-# Configure logging
-logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    def _remove(self, key):
+        _, _, size, _ = self._entries.pop(key)
+        self.size -= size
+        self._keys_by_table[key[0]].discard(key)
 
-# Constants for table and column names
-TABLE_APARTMENT_UNIT = "ApartmentUnit"
-TABLE_TENANT_OWNER = "TenantOwner"
-TABLE_PARKING = "Parking"
+    def get(self, table_name, query, params):
+        if self.ttl <= 0:
+            return None
+        key = (table_name, query, params)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[3] < time.monotonic():
+                if entry is not None:
+                    self._remove(key)
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0], entry[1]
 
-# Admin password hash (replace this with the hashed password for production)
-ADMIN_PASSWORD_HASH = sha256("admin123".encode()).hexdigest()
+    def generation(self, table_name):
+        # Read before the query whose page is later passed to put
+        with self._lock:
+            return self._generations.get(table_name, 0)
+
+    def put(self, table_name, query, params, column_names, rows, generation):
+        if self.ttl <= 0:
+            return
+        key = (table_name, query, params)
+        size = self._estimate_size(rows)
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            if self._generations.get(table_name, 0) != generation:
+                return
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = (column_names, rows, size, time.monotonic() + self.ttl)
+            self._keys_by_table.setdefault(table_name, set()).add(key)
+            self.size += size
+            while len(self._entries) > self.max_entries or self.size > self.max_bytes:
+                self._remove(next(iter(self._entries)))
+                self.evictions += 1
+
+    def invalidate(self, table_name):
+        with self._lock:
+            self._generations[table_name] = self._generations.get(table_name, 0) + 1
+            for key in list(self._keys_by_table.get(table_name, ())):
+                self._remove(key)
+                self.invalidations += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._keys_by_table.clear()
+            self.size = 0
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 3) if lookups else 0.0,
+                "evictions": self.evictions,
+                "invalidations": self.invalidations,
+                "entries": len(self._entries),
+                "bytes": self.size,
+            }
+
+query_cache = QueryCache()
+
+# Callbacks run with the table name whenever a write to that table commits
+table_change_listeners = [query_cache.invalidate]
+
+# Callbacks run with (table name, primary key value) for each committed
+# record write; the key is None when the rows written are not known
+record_change_listeners = []
+
+# Callbacks run with the connection after each commit, in the committing thread
+commit_listeners = []
+
+def fire_commit_listeners(connection):
+    for listener in commit_listeners:
+        listener(connection)
+
+def fire_change_listeners(table_name, keys):
+    for listener in table_change_listeners:
+        listener(table_name)
+    for key in keys:
+        for listener in record_change_listeners:
+            listener(table_name, key)
+
+def notify_table_changed(table_name, key=None):
+    # Inside a unit of work the change is only visible once the transaction commits
+    unit = current_unit_of_work()
+    if unit is not None:
+        unit.changed_tables.setdefault(table_name, []).append(key)
+        return
+    fire_change_listeners(table_name, [key])
 
 @contextmanager
-def connect_to_database():
+def connect_to_database(pool=None):
+    pool = pool or get_pool()
     try:
-        connection = mysql.connector.connect(
-            host="localhost",
-            user="root",
-            password="#Quantum123",
-            database="Apartment"
-        )
-        yield connection
+        connection = pool.acquire()
     except mysql.connector.Error as e:
         logging.error(f"Error connecting to database: {e}")
         yield None
+        return
+    try:
+        yield connection
     finally:
-        if connection and connection.is_connected():
-            connection.close()
+        pool.release(connection)
 
 @contextmanager
-def get_cursor(connection):
-    try:
-        cursor = connection.cursor()
-        yield cursor
-    except mysql.connector.Error as e:
-        logging.error(f"Error with cursor: {e}")
-    finally:
-        cursor.close()
+def borrow_connection(source=None):
+    # Data-access functions accept either a live connection or a pool (None
+    # meaning the default pool); pools lend a connection for one operation.
+    # Reads and writes in a thread with an open unit of work share its
+    # transaction when they go through the unit's pool (or the default).
+    if source is not None and not isinstance(source, ConnectionPool):
+        yield source
+        return
+    unit = current_unit_for(source)
+    if unit is not None:
+        yield unit.connection
+        return
+    with (source or get_pool()).connection() as connection:
+        yield connection
+
+@contextmanager
+def get_cursor(connection, commit=False, prepared=None, **options):
+    # With prepared=<statement> the cursor comes from the per-connection
+    # prepared-statement cache and stays open for the next execution.
+    # Errors, including failing to get a connection, reach the caller: reads
+    # raise them and the write functions log them and return None.
+    with borrow_connection(connection) as connection:
+        unit = current_unit_of_work()
+        if unit is not None and unit.connection is connection:
+            commit = False
+        if prepared is not None:
+            cursor = InstrumentedCursor(prepared_statements.cursor(connection, prepared))
+        else:
+            cursor = InstrumentedCursor(connection.cursor(**options))
+        try:
+            yield cursor
+            if commit:
+                connection.commit()
+                fire_commit_listeners(connection)
+        except mysql.connector.Error:
+            if commit:
+                connection.rollback()
+            if prepared is not None:
+                prepared_statements.discard(connection, prepared)
+            raise
+        finally:
+            if prepared is None:
+                cursor.close()
+            else:
+                cursor.finish()
+
+class UnitOfWork:
+    def __init__(self, connection, flush_every=UNIT_OF_WORK_FLUSH_EVERY):
+        self.connection = connection
+        self.flush_every = flush_every
+        self.pending = 0
+        self.changed_tables = {}
+        self.pending_changes = []
+        self._savepoint_depth = 0
+
+    def execute(self, query, data=None):
+        cursor = InstrumentedCursor(prepared_statements.cursor(self.connection, query))
+        try:
+            cursor.execute(query, data)
+        except mysql.connector.Error:
+            cursor.finish()
+            prepared_statements.discard(self.connection, query)
+            raise
+        # A result set is recorded once the caller has fetched it, so its
+        # rows and bytes are counted. Anything else returns a WriteResult: the
+        # prepared cursor is reused by the next run of the same statement.
+        if cursor.description is None:
+            result = WriteResult(cursor.rowcount, cursor.lastrowid)
+            cursor.finish()
+        else:
+            result = cursor
+        self._executed()
+        return result
+
+    def _executed(self):
+        self.pending += 1
+        if self.flush_every and self.pending >= self.flush_every and not self._savepoint_depth:
+            self.flush()
+
+    def execute_many(self, query, rows):
+        # A plain cursor, not a prepared one: the text protocol sends an INSERT
+        # batch as one multi-row statement, where a prepared executemany makes
+        # a round trip per row
+        cursor = InstrumentedCursor(self.connection.cursor())
+        try:
+            cursor.executemany(query, rows)
+            result = WriteResult(cursor.rowcount, cursor.lastrowid)
+        finally:
+            cursor.close()
+        self._executed()
+        return result
+
+    def _write_changes(self):
+        # change_ids come from the ChangeSequence row, which stays locked until
+        # the commit that follows, so ids become visible in commit order with
+        # no gaps: a reader never sees an id while a lower one is in flight.
+        changes, self.pending_changes = self.pending_changes, []
+        cursor = InstrumentedCursor(self.connection.cursor())
+        try:
+            cursor.execute(CHANGE_SEQUENCE_ADVANCE, (len(changes),))
+            if cursor.rowcount != 1:
+                raise RuntimeError(f"{TABLE_CHANGE_SEQUENCE} is not set up; run `python audit.py setup`")
+            cursor.execute(CHANGE_SEQUENCE_READ)
+            (last_id,) = cursor.fetchall()[0]
+            first_id = last_id - len(changes) + 1
+            cursor.executemany(CHANGE_LOG_INSERT, [(first_id + index,) + change for index, change in enumerate(changes)])
+        finally:
+            cursor.close()
+
+    def flush(self):
+        if self.pending_changes:
+            self._write_changes()
+        self.connection.commit()
+        fire_commit_listeners(self.connection)
+        self.pending = 0
+        changed_tables, self.changed_tables = self.changed_tables, {}
+        for table_name, keys in changed_tables.items():
+            fire_change_listeners(table_name, dict.fromkeys(keys))
+
+    def rollback(self):
+        self.connection.rollback()
+        self.pending = 0
+        self.changed_tables.clear()
+        self.pending_changes.clear()
+
+    @contextmanager
+    def savepoint(self):
+        self._savepoint_depth += 1
+        name = f"uow_savepoint_{self._savepoint_depth}"
+        queued = len(self.pending_changes)
+        cursor = InstrumentedCursor(self.connection.cursor())
+        try:
+            cursor.execute(f"SAVEPOINT {name}")
+            try:
+                yield self
+            except BaseException:
+                cursor.execute(f"ROLLBACK TO SAVEPOINT {name}")
+                del self.pending_changes[queued:]
+                raise
+            cursor.execute(f"RELEASE SAVEPOINT {name}")
+        finally:
+            cursor.close()
+            self._savepoint_depth -= 1
+
+_local = threading.local()
+
+def current_unit_of_work():
+    return getattr(_local, "unit", None)
+
+def current_unit_for(source):
+    # The open unit of work that statements against source belong to: the
+    # default source, the unit's own connection, or the pool it came from
+    unit = current_unit_of_work()
+    if unit is None or source is None or source is unit.connection:
+        return unit
+    if isinstance(source, ConnectionPool) and _connection_pools.get(unit.connection) is source:
+        return unit
+    return None
+
+@contextmanager
+def unit_of_work(connection=None, flush_every=UNIT_OF_WORK_FLUSH_EVERY):
+    # Groups every execute_query/execute_many in this thread into one transaction.
+    # A nested unit of work becomes a savepoint inside the outer one.
+    unit = current_unit_of_work()
+    if unit is not None:
+        if connection is not None and connection is not unit.connection \
+                and pool_of(connection) is not pool_of(unit.connection):
+            raise ValueError("A unit of work is already open on another database")
+        with unit.savepoint():
+            yield unit
+        return
+    with borrow_connection(connection) as connection:
+        unit = UnitOfWork(connection, flush_every)
+        _local.unit = unit
+        try:
+            yield unit
+            unit.flush()
+        except BaseException as e:
+            logging.error(f"Rolling back unit of work: {e}")
+            unit.rollback()
+            raise
+        finally:
+            _local.unit = None
 
 def validate_input(prompt, validator, error_message):
     while True:
@@ -321,12 +579,47 @@ def validate_input(prompt, validator, error_message):
 def is_valid_integer(value):
     return value.isdigit()
 
-def is_valid_date(value):
-    try:
-        datetime.strptime(value, '%Y-%m-%d')
-        return True
-    except ValueError:
-        return False
+def prompt_fields(table_name, new=False):
+    # (column, prompt, validator, error message) for each field of a table.
+    # Update prompts ask for new values and never change the primary key.
+    return [(column, f"Enter {'new ' if new else ''}{label}: ", validator, error_msg)
+            for column, label, validator, error_msg in FIELDS[table_name]
+            if not (new and column == PRIMARY_KEYS[table_name])]
+
+# Fields prompted for when adding a record
+APARTMENT_FIELDS = prompt_fields(TABLE_APARTMENT_UNIT)
+TENANT_FIELDS = prompt_fields(TABLE_TENANT_OWNER)
+PARKING_FIELDS = prompt_fields(TABLE_PARKING)
+
+TABLE_FIELDS = {
+    TABLE_APARTMENT_UNIT: APARTMENT_FIELDS,
+    TABLE_TENANT_OWNER: TENANT_FIELDS,
+    TABLE_PARKING: PARKING_FIELDS,
+}
+
+def validate_values(table_name, values, partial=False):
+    # Applies the add-menu validators to a {column: value} mapping; partial
+    # mappings (updates) only need the columns they contain.
+    fields = {field: (validator, error_msg) for field, _, validator, error_msg in TABLE_FIELDS[table_name]}
+    unknown = set(values) - set(fields)
+    if unknown:
+        raise ValueError(f"Unknown fields for {table_name}: {', '.join(sorted(unknown))}")
+    if not partial:
+        missing = set(fields) - set(values)
+        if missing:
+            raise ValueError(f"Missing fields for {table_name}: {', '.join(sorted(missing))}")
+    cleaned = {}
+    for field, value in values.items():
+        value = "" if value is None else str(value).strip()
+        validator, error_msg = fields[field]
+        if not validator(value):
+            raise ValueError(f"{field}: {error_msg}")
+        cleaned[field] = value
+    # chk_lease_dates; an update of one date is left to the database
+    if cleaned.get("lease_start_date") and cleaned.get("lease_end_date") and \
+            cleaned["lease_end_date"] < cleaned["lease_start_date"]:
+        raise ValueError("lease_end_date: The lease cannot end before it starts.")
+    return cleaned
 
 def secure_admin_login():
     password = getpass("Enter admin password: ")
@@ -337,199 +630,471 @@ def display_menu(options):
         print(f"{i}. {option}")
     return validate_input("Enter your choice: ", is_valid_integer, "Invalid choice. Please enter a number.")
 
+class WriteResult:
+    # A write's rowcount and lastrowid, captured while the connection is still
+    # borrowed: the prepared cursor stays with the connection, and whoever
+    # borrows it next overwrites both when it runs the same statement
+    def __init__(self, rowcount, lastrowid):
+        self.rowcount = rowcount
+        self.lastrowid = lastrowid
+
+# Writes return a WriteResult, or None if the statement (or getting a
+# connection for it) failed. Inside a unit of work errors are raised instead,
+# so the unit rolls back.
 def execute_query(connection, query, data=None):
-    with get_cursor(connection) as cursor:
-        cursor.execute(query, data)
-        connection.commit()
-        return cursor
+    unit = current_unit_for(connection)
+    if unit is not None:
+        return unit.execute(query, data)
+    try:
+        with get_cursor(connection, commit=True, prepared=query) as cursor:
+            cursor.execute(query, data)
+            result = WriteResult(cursor.rowcount, cursor.lastrowid)
+        return result
+    except mysql.connector.Error as e:
+        logging.error(f"Error executing query: {e}")
+        return None
 
-def view_table(connection, table_name):
-    query = f"SELECT * FROM {table_name}"
+def execute_many(connection, query, rows):
+    # One multi-row INSERT and a single commit for the whole batch (see
+    # UnitOfWork.execute_many for why the cursor is not prepared)
+    unit = current_unit_for(connection)
+    if unit is not None:
+        return unit.execute_many(query, rows)
+    try:
+        with get_cursor(connection, commit=True) as cursor:
+            cursor.executemany(query, rows)
+            result = WriteResult(cursor.rowcount, cursor.lastrowid)
+        return result
+    except mysql.connector.Error as e:
+        logging.error(f"Error executing query: {e}")
+        return None
+
+@lru_cache(maxsize=STATEMENT_REGISTRY_SIZE)
+def page_statement(table_name, where, order_by, descending, after_key, offset):
+    # One statement per page shape; repeated pages reuse the same prepared handle
+    primary_key = PRIMARY_KEYS[table_name]
+    order_columns = [order_by, primary_key] if order_by and order_by != primary_key else [primary_key]
+    direction = "DESC" if descending else "ASC"
+    comparison = "<" if descending else ">"
+    conditions = [f"({where})"] if where else []
+    if after_key:
+        if len(order_columns) == 1:
+            conditions.append(f"{primary_key} {comparison} %s")
+        else:
+            conditions.append(f"({order_by} {comparison} %s OR ({order_by} = %s AND {primary_key} {comparison} %s))")
+    clause = f" WHERE {' AND '.join(conditions)}" if conditions else ""
+    order = ", ".join(f"{column} {direction}" for column in order_columns)
+    query = f"SELECT * FROM {table_name}{clause} ORDER BY {order} LIMIT %s"
+    if offset:
+        query += " OFFSET %s"
+    return sys.intern(query)
+
+def iter_table_pages(connection, table_name, where="", params=(), page_size=DEFAULT_PAGE_SIZE,
+                     order_by=None, descending=False, offset=0, after=None, cached_pages=1):
+    # Keyset pagination on (order_by, primary key) keeps each query bounded to
+    # one page, so memory stays constant no matter how large the table grows.
+    # after resumes past a key: (primary key,) or (order_by value, primary key).
+    # Only the first cached_pages pages go through query_cache: those are the
+    # reads that repeat, while every page of a full-table stream would just
+    # evict them; exports and other one-off streams pass 0.
+    primary_key = PRIMARY_KEYS[table_name]
+    order_columns = [order_by, primary_key] if order_by and order_by != primary_key else [primary_key]
+    last_key = tuple(after) if after is not None else None
+    for page_number in itertools.count():
+        page_params = list(params)
+        if last_key is not None:
+            page_params.extend(last_key if len(last_key) == 1 else [last_key[0], last_key[0], last_key[1]])
+        page_params.append(page_size)
+        page_offset = offset if last_key is None else 0
+        if page_offset:
+            page_params.append(page_offset)
+        query = page_statement(table_name, where, order_by if len(order_columns) > 1 else None,
+                               descending, last_key is not None, bool(page_offset))
+        page_params = tuple(page_params)
+        # Pages read inside a unit of work may include uncommitted rows, so skip the cache
+        use_cache = page_number < cached_pages and current_unit_for(connection) is None
+        # Cached pages are keyed by the database they came from as well
+        cache_params = (cache_scope(connection),) + page_params
+        cached = query_cache.get(table_name, query, cache_params) if use_cache else None
+        if cached is not None:
+            column_names, rows = cached
+        else:
+            generation = query_cache.generation(table_name)
+            # A failed read raises here; it must never look like the end of the data
+            with get_cursor(connection, prepared=query) as cursor:
+                cursor.execute(query, page_params)
+                column_names = cursor.column_names
+                rows = cursor.fetchall()
+                # Decoded once here, so cached pages are handed out without per-row work
+                decode = row_type(table_name, column_names)
+                if decode is not None:
+                    rows = list(map(decode._make, rows))
+                if use_cache:
+                    query_cache.put(table_name, query, cache_params, column_names, rows, generation)
+        if not rows:
+            return
+        yield rows
+        if len(rows) < page_size:
+            return
+        last_key = tuple(rows[-1][column_names.index(column)] for column in order_columns)
+
+def get_table_columns(connection, table_name):
     with get_cursor(connection) as cursor:
-        cursor.execute(query)
-        rows = cursor.fetchall()
-        if rows:
-            for row in rows:
-                print(row)
+        cursor.execute(f"SELECT * FROM {table_name} LIMIT 0")
+        cursor.fetchall()
+        return cursor.column_names
+
+def iter_table_rows(connection, table_name, where="", params=(), page_size=DEFAULT_PAGE_SIZE, cached_pages=1):
+    for page in iter_table_pages(connection, table_name, where, params, page_size, cached_pages=cached_pages):
+        yield from page
+
+def show_rows(rows, empty_message):
+    found = False
+    for row in rows:
+        print(row)
+        found = True
+    if not found:
+        print(empty_message)
+
+def view_table(connection, table_name, page_size=DEFAULT_PAGE_SIZE):
+    try:
+        show_rows(iter_table_rows(connection, table_name, page_size=page_size), f"No data found in {table_name}.")
+    except mysql.connector.Error as e:
+        logging.error(f"Error reading {table_name}: {e}")
+        print(f"Could not read {table_name}; please try again.")
+
+def build_search_filter(filters):
+    # Each filter value is an exact match, a (low, high) tuple for an inclusive
+    # range (either bound may be None) or a list/set for an IN-list.
+    conditions = []
+    params = []
+    for column, value in filters.items():
+        if column not in SEARCH_COLUMNS:
+            raise ValueError(f"Cannot search on {column}.")
+        if isinstance(value, tuple):
+            low, high = value
+            if low is not None:
+                conditions.append(f"{column} >= %s")
+                params.append(low)
+            if high is not None:
+                conditions.append(f"{column} <= %s")
+                params.append(high)
+        elif isinstance(value, (list, set, frozenset)):
+            values = sorted(value)
+            if not values:
+                conditions.append("1 = 0")
+            else:
+                conditions.append(f"{column} IN ({', '.join(['%s'] * len(values))})")
+                params.extend(values)
         else:
-            print(f"No data found in {table_name}.")
+            conditions.append(f"{column} = %s")
+            params.append(value)
+    return " AND ".join(conditions), tuple(params)
 
-def search_apartments(connection):
+def check_page_window(limit, offset=0):
+    # limit (None for no limit) and offset as ints; a limit below 1 or a
+    # negative offset is a ValueError here rather than a bad LIMIT/OFFSET at
+    # the database
+    limit = None if limit is None else int(limit)
+    offset = int(offset)
+    if limit is not None and limit < 1:
+        raise ValueError("limit must be at least 1")
+    if offset < 0:
+        raise ValueError("offset cannot be negative")
+    return limit, offset
+
+def find_apartments(connection, filters=None, order_by=None, descending=False, limit=None, offset=0,
+                    page_size=DEFAULT_PAGE_SIZE, cached=True):
+    limit, offset = check_page_window(limit, offset)
+    if order_by is not None and order_by not in SEARCH_COLUMNS + (PRIMARY_KEYS[TABLE_APARTMENT_UNIT],):
+        raise ValueError(f"Cannot sort on {order_by}.")
+    where, params = build_search_filter(filters or {})
+    # A search with a limit is bounded, so all of its pages may be cached;
+    # an open-ended one only caches its first page, and cached=False none
+    cached_pages = 1 if cached else 0
+    if limit is not None:
+        page_size = min(page_size, limit)
+        if cached:
+            cached_pages = -(-limit // page_size) if page_size else 1
+    remaining = limit
+    for page in iter_table_pages(connection, TABLE_APARTMENT_UNIT, where, params, page_size,
+                                 order_by, descending, offset, cached_pages=cached_pages):
+        if remaining is not None:
+            page = page[:remaining]
+            remaining -= len(page)
+        yield from page
+        if remaining == 0:
+            return
+
+def is_valid_search_value(column, value):
+    # "3-8" is an inclusive range and "2,3" an IN-list; anything else is an exact match
+    validator = str.isalnum if column == "occupancy_status" else str.isdigit
+    if column != "occupancy_status" and value.count("-") == 1:
+        return all(validator(bound) for bound in value.split("-"))
+    return all(validator(item.strip()) for item in value.split(","))
+
+def parse_search_value(column, value):
+    if column != "occupancy_status" and "-" in value:
+        low, high = value.split("-")
+        return (int(low), int(high))
+    items = [item.strip() for item in value.split(",")]
+    if column != "occupancy_status":
+        items = [int(item) for item in items]
+    return items if len(items) > 1 else items[0]
+
+def prompt_search_criteria():
+    # The filters picked from the search menu, or None if the search was cancelled
     filters = {
-        "1": ("floor_number", "Enter floor number: "),
-        "2": ("bedrooms", "Enter number of bedrooms: "),
-        "3": ("bathrooms", "Enter number of bathrooms: "),
-        "4": ("square_footage", "Enter square footage: "),
-        "5": ("occupancy_status", "Enter occupancy status: ")
+        "1": ("floor_number", "Enter floor number (e.g. 3, 3-8 or 3,5): "),
+        "2": ("bedrooms", "Enter number of bedrooms (e.g. 2, 2-4 or 1,3): "),
+        "3": ("bathrooms", "Enter number of bathrooms (e.g. 1, 1-2 or 1,3): "),
+        "4": ("square_footage", "Enter square footage (e.g. 900 or 900-1200): "),
+        "5": ("occupancy_status", "Enter occupancy status (e.g. Vacant or Vacant,Reserved): ")
     }
+    criteria = {}
+
+    while True:
+        choice = display_menu([
+            "By Floor Number", 
+            "By Number of Bedrooms", 
+            "By Number of Bathrooms", 
+            "By Square Footage", 
+            "By Occupancy Status", 
+            "Run Search",
+            "Cancel"
+        ])
 
-    choice = display_menu([
-        "By Floor Number", 
-        "By Number of Bedrooms", 
-        "By Number of Bathrooms", 
-        "By Square Footage", 
-        "By Occupancy Status", 
-        "Cancel"
-    ])
+        if choice == "6":
+            break
+        if choice == "7":
+            return None
+
+        column, prompt = filters.get(choice, (None, None))
+        if column:
+            value = validate_input(prompt, lambda text: is_valid_search_value(column, text), "Invalid input.")
+            criteria[column] = parse_search_value(column, value)
+        else:
+            print("Invalid choice. Please try again.")
+    return criteria
 
-    if choice == "6":
+def search_apartments(connection):
+    criteria = prompt_search_criteria()
+    if criteria is None:
         return
+    try:
+        show_rows(find_apartments(connection, criteria), "No apartments match your search.")
+    except mysql.connector.Error as e:
+        logging.error(f"Error searching {TABLE_APARTMENT_UNIT}: {e}")
+        print("Could not run the search; please try again.")
 
-    column, prompt = filters.get(choice, (None, None))
-    if column:
-        value = validate_input(prompt, str.isdigit if column != "occupancy_status" else str.isalnum, "Invalid input.")
-        query = f"SELECT * FROM {TABLE_APARTMENT_UNIT} WHERE {column} = %s"
-        with get_cursor(connection) as cursor:
-            cursor.execute(query, (value,))
-            apartments = cursor.fetchall()
-            for apartment in apartments:
-                print(apartment)
+def build_insert_query(table_name, columns):
+    return build_statement(table_name, "insert", tuple(columns))
+
+@lru_cache(maxsize=STATEMENT_REGISTRY_SIZE)
+def build_statement(table_name, operation, columns=(), primary_key=None):
+    # Each (table, operation, column set) statement is built once and the same
+    # string object is returned every time, which the prepared-statement cache relies on.
+    if operation == "insert":
+        placeholders = ", ".join(["%s"] * len(columns))
+        query = f"INSERT INTO {table_name} ({', '.join(columns)}) VALUES ({placeholders})"
+    elif operation == "update":
+        assignments = ", ".join(f"{column} = %s" for column in columns)
+        query = f"UPDATE {table_name} SET {assignments} WHERE {primary_key} = %s"
+    elif operation == "delete":
+        query = f"DELETE FROM {table_name} WHERE {primary_key} = %s"
+    elif operation == "select":
+        query = f"SELECT * FROM {table_name} WHERE {primary_key} = %s"
+    elif operation == "lock":
+        query = f"SELECT * FROM {table_name} WHERE {primary_key} = %s FOR UPDATE"
     else:
-        print("Invalid choice. Please try again.")
+        raise ValueError(f"Unknown operation: {operation}")
+    return sys.intern(query)
+
+CHANGE_LOG_INSERT = sys.intern(
+    f"INSERT INTO {TABLE_CHANGE_LOG} (change_id, table_name, primary_key, operation, before_values, after_values, "
+    "changed_at) VALUES (%s, %s, %s, %s, %s, %s, %s)"
+)
+CHANGE_SEQUENCE_ADVANCE = f"UPDATE {TABLE_CHANGE_SEQUENCE} SET last_id = last_id + %s WHERE sequence_id = 1"
+CHANGE_SEQUENCE_READ = f"SELECT last_id FROM {TABLE_CHANGE_SEQUENCE} WHERE sequence_id = 1"
+
+def queue_change(table_name, key, operation, before=None, after=None):
+    # Queues a ChangeLog event on the open unit of work; it is written, and
+    # given its change_id, when the unit commits and dropped if it rolls back
+    unit = current_unit_of_work()
+    if unit is None:
+        raise RuntimeError("Change events can only be queued inside a unit of work")
+    unit.pending_changes.append((
+        table_name, str(key), operation,
+        json.dumps(before, default=str) if before else None,
+        json.dumps(after, default=str) if after else None,
+        datetime.now(),
+    ))
+
+def select_records(unit, table_name, column, value, lock=False):
+    query = build_statement(table_name, "lock" if lock else "select", primary_key=column)
+    cursor = unit.execute(query, (value,))
+    return [dict(zip(cursor.column_names, row)) for row in cursor.fetchall()]
+
+def audited_write(connection, table_name, operation, column, value, query, data):
+    # The write, its before/after images and the ChangeLog rows share one
+    # transaction (a savepoint inside an outer unit of work), so an event is
+    # recorded exactly when the change commits. column/value locate the rows
+    # for updates and deletes and the new row for inserts.
+    outer = current_unit_of_work()
+    try:
+        with unit_of_work(connection, flush_every=0) as unit:
+            primary_key = PRIMARY_KEYS[table_name]
+            # Locking the rows first keeps the before image exact under concurrent writers
+            before = select_records(unit, table_name, column, value, lock=True) if operation != "insert" else []
+            result = unit.execute(query, data)
+            changed, lastrowid = result.rowcount, result.lastrowid
+            if operation == "insert":
+                keys = [value if value is not None else lastrowid]
+            else:
+                keys = [row[primary_key] for row in before]
+            for index, key in enumerate(keys if changed else ()):
+                after = select_records(unit, table_name, primary_key, key) if operation != "delete" else []
+                queue_change(table_name, key, operation, before[index] if before else None, after[0] if after else None)
+            return WriteResult(changed, lastrowid)
+    except mysql.connector.Error as e:
+        if outer is not None:
+            raise
+        logging.error(f"Error writing to {table_name}: {e}")
+        return None
+
+def write_record(connection, table_name, operation, column, value, query, data):
+    if AUDIT_ENABLED:
+        return audited_write(connection, table_name, operation, column, value, query, data)
+    return execute_query(connection, query, data)
+
+# Non-interactive writes; each returns a WriteResult, or None if the statement failed
+def insert_record(connection, table_name, values):
+    query = build_insert_query(table_name, tuple(values))
+    primary_key = PRIMARY_KEYS[table_name]
+    result = write_record(connection, table_name, "insert", primary_key, values.get(primary_key),
+                          query, tuple(values.values()))
+    if result is not None:
+        notify_table_changed(table_name, values.get(primary_key) or result.lastrowid or None)
+    return result
+
+def update_record(connection, table_name, primary_key, primary_value, values):
+    query = build_statement(table_name, "update", tuple(values), primary_key)
+    result = write_record(connection, table_name, "update", primary_key, primary_value,
+                          query, tuple(values.values()) + (primary_value,))
+    if result is not None:
+        notify_table_changed(table_name, primary_value if primary_key == PRIMARY_KEYS[table_name] else None)
+    return result
+
+def delete_record(connection, table_name, primary_key, primary_value):
+    query = build_statement(table_name, "delete", primary_key=primary_key)
+    result = write_record(connection, table_name, "delete", primary_key, primary_value, query, (primary_value,))
+    if result is not None:
+        notify_table_changed(table_name, primary_value if primary_key == PRIMARY_KEYS[table_name] else None)
+    return result
 
 def add_details(connection, table_name, fields):
-    data = []
+    values = {}
     for field, prompt, validator, error_msg in fields:
-        value = validate_input(prompt, validator, error_msg)
-        data.append(value)
-    placeholders = ", ".join(["%s"] * len(data))
-    columns = ", ".join([field for field, _, _, _ in fields])
-    query = f"INSERT INTO {table_name} ({columns}) VALUES ({placeholders})"
-    execute_query(connection, query, tuple(data))
-    print(f"{table_name[:-1]} details added successfully.")
+        values[field] = validate_input(prompt, validator, error_msg)
+    if insert_record(connection, table_name, values) is not None:
+        print(f"{table_name[:-1]} details added successfully.")
 
 def update_details(connection, table_name, primary_key, primary_value, fields):
     choice = display_menu([f"Update {field}" for field, _, _, _ in fields])
     field, prompt, validator, error_msg = fields[int(choice) - 1]
     new_value = validate_input(prompt, validator, error_msg)
-    query = f"UPDATE {table_name} SET {field} = %s WHERE {primary_key} = %s"
-    execute_query(connection, query, (new_value, primary_value))
-    print(f"{field} updated successfully.")
+    if update_record(connection, table_name, primary_key, primary_value, {field: new_value}) is not None:
+        print(f"{field} updated successfully.")
 
 def delete_details(connection, table_name, primary_key):
     primary_value = validate_input(f"Enter {primary_key} of the record to delete: ", str.isdigit, "Invalid input.")
-    query = f"DELETE FROM {table_name} WHERE {primary_key} = %s"
-    execute_query(connection, query, (primary_value,))
-    print(f"Record deleted from {table_name}.")
+    if delete_record(connection, table_name, primary_key, primary_value) is not None:
+        print(f"Record deleted from {table_name}.")
 
 def main():
-    with connect_to_database() as connection:
-        if connection:
+    # Each operation borrows from the pool, so a connection dropped by the
+    # server between menu picks is replaced instead of ending the session.
+    pool = get_pool()
+    instrumentation.install_dump_signal()
+    with connect_to_database(pool) as connection:
+        if not connection:
+            # Browsing still works, read-only, from the last local snapshot
+            from snapshot import browse_offline
+            browse_offline()
+            return
+    while True:
+        user_choice = display_menu(["Regular User", "Admin", "Exit"])
+
+        if user_choice == "1":
             while True:
-                user_choice = display_menu(["Regular User", "Admin", "Exit"])
-
-                if user_choice == "1":
-                    while True:
-                        choice = display_menu(["View Apartment Details", "View Tenant Details", "View Parking Details", "Search Apartments", "Exit"])
-                        if choice == "1":
-                            view_table(connection, TABLE_APARTMENT_UNIT)
-                        elif choice == "2":
-                            view_table(connection, TABLE_TENANT_OWNER)
-                        elif choice == "3":
-                            view_table(connection, TABLE_PARKING)
-                        elif choice == "4":
-                            search_apartments(connection)
-                        elif choice == "5":
-                            break
-                        else:
-                            print("Invalid choice. Please try again.")
-
-                elif user_choice == "2":
-                    if secure_admin_login():
-                        while True:
-                            choice = display_menu([
-                                "View Apartment Details", "View Tenant Details", 
-                                "View Parking Details", "Search Apartments", 
-                                "Add Apartment Details", "Add Tenant Details", 
-                                "Add Parking Details", "Update Apartment Details", 
-                                "Update Tenant Details", "Update Parking Details", 
-                                "Delete Apartment Details", "Delete Tenant Details", 
-                                "Delete Parking Details", "Exit"
-                            ])
-
-                            if choice == "1":
-                                view_table(connection, TABLE_APARTMENT_UNIT)
-                            elif choice == "2":
-                                view_table(connection, TABLE_TENANT_OWNER)
-                            elif choice == "3":
-                                view_table(connection, TABLE_PARKING)
-                            elif choice == "4":
-                                search_apartments(connection)
-                            elif choice == "5":
-                                fields = [
-                                    ("unit_number", "Enter unit number: ", str.isdigit, "Invalid unit number."),
-                                    ("floor_number", "Enter floor number: ", str.isdigit, "Invalid floor number."),
-                                    ("bedrooms", "Enter number of bedrooms: ", str.isdigit, "Invalid number."),
-                                    ("bathrooms", "Enter number of bathrooms: ", str.isdigit, "Invalid number."),
-                                    ("square_footage", "Enter square footage: ", str.isdigit, "Invalid square footage."),
-                                    ("rent_ownership_details", "Enter rent/ownership details: ", str.isalnum, "Invalid details."),
-                                    ("occupancy_status", "Enter occupancy status: ", str.isalnum, "Invalid status.")
-                                ]
-                                add_details(connection, TABLE_APARTMENT_UNIT, fields)
-                            elif choice == "6":
-                                fields = [
-                                    ("name", "Enter tenant name: ", str.isalnum, "Invalid name."),
-                                    ("contact_info", "Enter contact information: ", str.isdigit, "Invalid contact info."),
-                                    ("lease_start_date", "Enter lease start date (YYYY-MM-DD): ", is_valid_date, "Invalid date format."),
-                                    ("lease_end_date", "Enter lease end date (YYYY-MM-DD): ", is_valid_date, "Invalid date format."),
-                                    ("emergency_contact", "Enter emergency contact: ", str.isalnum, "Invalid contact."),
-                                    ("rent_payment_history", "Enter rent/payment history: ", str.isalnum, "Invalid history.")
-                                ]
-                                add_details(connection, TABLE_TENANT_OWNER, fields)
-                            elif choice == "7":
-                                fields = [
-                                    ("parking_space_number", "Enter parking space number: ", str.isdigit, "Invalid number."),
-                                    ("vehicle_details", "Enter vehicle details: ", str.isalnum, "Invalid details."),
-                                    ("availability_status", "Enter availability status: ", str.isalnum, "Invalid status.")
-                                ]
-                                add_details(connection, TABLE_PARKING, fields)
-                            elif choice == "8":
-                                primary_value = validate_input("Enter unit number to update: ", str.isdigit, "Invalid unit number.")
-                                fields = [
-                                    ("floor_number", "Enter new floor number: ", str.isdigit, "Invalid floor number."),
-                                    ("bedrooms", "Enter new number of bedrooms: ", str.isdigit, "Invalid number."),
-                                    ("bathrooms", "Enter new number of bathrooms: ", str.isdigit, "Invalid number."),
-                                    ("square_footage", "Enter new square footage: ", str.isdigit, "Invalid square footage."),
-                                    ("rent_ownership_details", "Enter new rent/ownership details: ", str.isalnum, "Invalid details."),
-                                    ("occupancy_status", "Enter new occupancy status: ", str.isalnum, "Invalid status.")
-                                ]
-                                update_details(connection, TABLE_APARTMENT_UNIT, "unit_number", primary_value, fields)
-                            elif choice == "9":
-                                primary_value = validate_input("Enter tenant ID to update: ", str.isdigit, "Invalid tenant ID.")
-                                fields = [
-                                    ("name", "Enter new tenant name: ", str.isalnum, "Invalid name."),
-                                    ("contact_info", "Enter new contact information: ", str.isdigit, "Invalid contact info."),
-                                    ("lease_start_date", "Enter new lease start date (YYYY-MM-DD): ", is_valid_date, "Invalid date format."),
-                                    ("lease_end_date", "Enter new lease end date (YYYY-MM-DD): ", is_valid_date, "Invalid date format."),
-                                    ("emergency_contact", "Enter new emergency contact: ", str.isalnum, "Invalid contact."),
-                                    ("rent_payment_history", "Enter new rent/payment history: ", str.isalnum, "Invalid history.")
-                                ]
-                                update_details(connection, TABLE_TENANT_OWNER, "tenant_id", primary_value, fields)
-                            elif choice == "10":
-                                primary_value = validate_input("Enter parking ID to update: ", str.isdigit, "Invalid parking ID.")
-                                fields = [
-                                    ("parking_space_number", "Enter new parking space number: ", str.isdigit, "Invalid number."),
-                                    ("vehicle_details", "Enter new vehicle details: ", str.isalnum, "Invalid details."),
-                                    ("availability_status", "Enter new availability status: ", str.isalnum, "Invalid status.")
-                                ]
-                                update_details(connection, TABLE_PARKING, "parking_id", primary_value, fields)
-                            elif choice == "11":
-                                delete_details(connection, TABLE_APARTMENT_UNIT, "unit_number")
-                            elif choice == "12":
-                                delete_details(connection, TABLE_TENANT_OWNER, "tenant_id")
-                            elif choice == "13":
-                                delete_details(connection, TABLE_PARKING, "parking_id")
-                            elif choice == "14":
-                                break
-                            else:
-                                print("Invalid choice. Please try again.")
-                    else:
-                        print("Invalid password. Access denied.")
-                elif user_choice == "3":
+                choice = display_menu(["View Apartment Details", "View Tenant Details", "View Parking Details", "Search Apartments", "Exit"])
+                if choice == "1":
+                    view_table(pool, TABLE_APARTMENT_UNIT)
+                elif choice == "2":
+                    view_table(pool, TABLE_TENANT_OWNER)
+                elif choice == "3":
+                    view_table(pool, TABLE_PARKING)
+                elif choice == "4":
+                    search_apartments(pool)
+                elif choice == "5":
                     break
                 else:
                     print("Invalid choice. Please try again.")
 
+        elif user_choice == "2":
+            if secure_admin_login():
+                while True:
+                    choice = display_menu([
+                        "View Apartment Details", "View Tenant Details", 
+                        "View Parking Details", "Search Apartments", 
+                        "Add Apartment Details", "Add Tenant Details", 
+                        "Add Parking Details", "Update Apartment Details", 
+                        "Update Tenant Details", "Update Parking Details", 
+                        "Delete Apartment Details", "Delete Tenant Details", 
+                        "Delete Parking Details", "Exit"
+                    ])
+
+                    if choice == "1":
+                        view_table(pool, TABLE_APARTMENT_UNIT)
+                    elif choice == "2":
+                        view_table(pool, TABLE_TENANT_OWNER)
+                    elif choice == "3":
+                        view_table(pool, TABLE_PARKING)
+                    elif choice == "4":
+                        search_apartments(pool)
+                    elif choice == "5":
+                        add_details(pool, TABLE_APARTMENT_UNIT, APARTMENT_FIELDS)
+                    elif choice == "6":
+                        add_details(pool, TABLE_TENANT_OWNER, TENANT_FIELDS)
+                    elif choice == "7":
+                        add_details(pool, TABLE_PARKING, PARKING_FIELDS)
+                    elif choice == "8":
+                        primary_value = validate_input("Enter unit number to update: ", str.isdigit, "Invalid unit number.")
+                        update_details(pool, TABLE_APARTMENT_UNIT, "unit_number", primary_value, prompt_fields(TABLE_APARTMENT_UNIT, new=True))
+                    elif choice == "9":
+                        primary_value = validate_input("Enter tenant ID to update: ", str.isdigit, "Invalid tenant ID.")
+                        update_details(pool, TABLE_TENANT_OWNER, "tenant_id", primary_value, prompt_fields(TABLE_TENANT_OWNER, new=True))
+                    elif choice == "10":
+                        primary_value = validate_input("Enter parking ID to update: ", str.isdigit, "Invalid parking ID.")
+                        update_details(pool, TABLE_PARKING, "parking_id", primary_value, prompt_fields(TABLE_PARKING, new=True))
+                    elif choice == "11":
+                        delete_details(pool, TABLE_APARTMENT_UNIT, "unit_number")
+                    elif choice == "12":
+                        delete_details(pool, TABLE_TENANT_OWNER, "tenant_id")
+                    elif choice == "13":
+                        delete_details(pool, TABLE_PARKING, "parking_id")
+                    elif choice == "14":
+                        break
+                    else:
+                        print("Invalid choice. Please try again.")
+            else:
+                print("Invalid password. Access denied.")
+        elif user_choice == "3":
+            logging.info(f"Query cache stats: {query_cache.stats()}")
+            instrumentation.dump_metrics()
+            break
+        else:
+            print("Invalid choice. Please try again.")
+
 if __name__ == "__main__":
     main()
-
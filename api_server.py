@@ -0,0 +1,362 @@
+# HTTP/JSON API over the data-access functions.
+#
+#     GET    /tables/<table>?after=<key>&limit=<n>   one page; "next" is the after= for the next page
+#     GET    /tables/<table>/<id>
+#     POST   /tables/<table>                         JSON object of column values
+#     PATCH  /tables/<table>/<id>                    JSON object of the columns to change
+#     DELETE /tables/<table>/<id>
+#     GET    /apartments/search?bedrooms=2-3&occupancy_status=Vacant&order_by=square_footage&descending=1
+#     GET    /metrics                                Prometheus text for this worker
+#     GET    /health
+#
+# GET responses carry a weak ETag and answer If-None-Match with 304, and
+# bodies over COMPRESS_MIN_BYTES are gzipped for clients that accept it.
+# Reads bypass apartment.query_cache: it is private to each worker process,
+# so a page cached before another worker's write would go out under the
+# newer ETag of that write.
+import argparse
+import gzip
+import hashlib
+import json
+import logging
+import os
+import re
+import signal
+import socket
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+from apartment import (
+    AUDIT_ENABLED,
+    DEFAULT_PAGE_SIZE,
+    PRIMARY_KEYS,
+    TABLE_APARTMENT_UNIT,
+    TABLE_CHANGE_LOG,
+    build_statement,
+    check_page_window,
+    delete_record,
+    find_apartments,
+    get_cursor,
+    get_pool,
+    get_table_columns,
+    insert_record,
+    iter_table_pages,
+    table_change_listeners,
+    update_record,
+    validate_values,
+)
+from export import parse_search_criteria
+from instrumentation import metrics
+
+MAX_PAGE_SIZE = int(os.environ.get("APARTMENT_API_MAX_PAGE_SIZE", "1000"))
+COMPRESS_MIN_BYTES = 1024
+
+# How long a table version read from ChangeLog is trusted before re-reading;
+# writes made by this worker bump the version immediately
+VERSION_TTL = float(os.environ.get("APARTMENT_API_VERSION_TTL", "1"))
+
+TABLE_PATH = re.compile(r"^/tables/(\w+)(?:/(\d+))?$")
+
+class TableVersions:
+    # Per-table version counters for ETags. With auditing on, a table's
+    # version is its newest ChangeLog change_id, which every process writing
+    # through the record functions advances, so a 304 can be answered without
+    # reading the table. This worker's own writes also bump a local counter
+    # through table_change_listeners.
+    def __init__(self, source):
+        self.source = source
+        self._local = dict.fromkeys(PRIMARY_KEYS, 0)
+        self._logged = {}
+        self._lock = threading.Lock()
+        table_change_listeners.append(self.bump)
+
+    def bump(self, table_name):
+        if table_name in self._local:
+            with self._lock:
+                self._local[table_name] += 1
+                self._logged.pop(table_name, None)
+
+    def get(self, table_name):
+        # None when the version cannot be known without reading the data
+        if not AUDIT_ENABLED:
+            return None
+        now = time.monotonic()
+        with self._lock:
+            cached = self._logged.get(table_name)
+        if cached is None or now - cached[1] > VERSION_TTL:
+            with get_cursor(self.source) as cursor:
+                cursor.execute(f"SELECT MAX(change_id) FROM {TABLE_CHANGE_LOG} WHERE table_name = %s", (table_name,))
+                rows = cursor.fetchall()
+            cached = (rows[0][0] or 0, now)
+            with self._lock:
+                self._logged[table_name] = cached
+        return f"{cached[0]}.{self._local[table_name]}"
+
+class ApiError(Exception):
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+class ApiHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    server_version = "ApartmentAPI/1.0"
+
+    def log_message(self, format, *args):
+        logging.debug(f"{self.address_string()} {format % args}")
+
+    def send_body(self, status, body, content_type="application/json", etag=None):
+        if isinstance(body, str):
+            body = body.encode()
+        self.send_response(status)
+        if etag:
+            self.send_header("ETag", etag)
+            self.send_header("Cache-Control", "no-cache")
+        if len(body) >= COMPRESS_MIN_BYTES and "gzip" in self.headers.get("Accept-Encoding", ""):
+            body = gzip.compress(body, compresslevel=5)
+            self.send_header("Content-Encoding", "gzip")
+        self.send_header("Vary", "Accept-Encoding")
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        if self.command != "HEAD":
+            self.wfile.write(body)
+
+    def send_json(self, status, payload, etag=None):
+        self.send_body(status, json.dumps(payload, default=str, separators=(",", ":")), etag=etag)
+
+    def not_modified(self, etag):
+        if etag and etag in self.headers.get("If-None-Match", ""):
+            self.send_response(304)
+            self.send_header("ETag", etag)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return True
+        return False
+
+    def read_json(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        try:
+            payload = json.loads(self.rfile.read(length) or b"{}")
+        except ValueError:
+            raise ApiError(400, "Request body must be JSON")
+        if not isinstance(payload, dict):
+            raise ApiError(400, "Request body must be a JSON object")
+        return payload
+
+    def dispatch(self, method):
+        started = time.perf_counter()
+        status = 500
+        try:
+            url = urlsplit(self.path)
+            query = {key: values[-1] for key, values in parse_qs(url.query).items()}
+            status = method(url.path, query)
+        except ApiError as e:
+            status = e.status
+            self.send_json(status, {"error": str(e)})
+        except ValueError as e:
+            status = 400
+            self.send_json(status, {"error": str(e)})
+        except Exception:
+            logging.exception(f"Error handling {self.command} {self.path}")
+            self.send_json(status, {"error": "Internal server error"})
+        finally:
+            metrics.observe("http_request_ms", (time.perf_counter() - started) * 1000,
+                            method=self.command, status=status)
+
+    def do_GET(self):
+        self.dispatch(self.handle_get)
+
+    def do_HEAD(self):
+        self.dispatch(self.handle_get)
+
+    def do_POST(self):
+        self.dispatch(self.handle_post)
+
+    def do_PATCH(self):
+        self.dispatch(self.handle_patch)
+
+    def do_DELETE(self):
+        self.dispatch(self.handle_delete)
+
+    def route_table(self, path, with_id=None):
+        # Returns (table, id or None); with_id requires the id to be present or absent
+        match = TABLE_PATH.match(path)
+        if not match or match.group(1) not in PRIMARY_KEYS:
+            raise ApiError(404, f"No route for {path}")
+        record_id = int(match.group(2)) if match.group(2) else None
+        if with_id is not None and with_id != (record_id is not None):
+            raise ApiError(405, f"{self.command} is not supported on {path}")
+        return match.group(1), record_id
+
+    def conditional(self, table_name, query, build):
+        # With a known table version the ETag is decided before any data is
+        # read; otherwise it is a digest of the body, which still saves the transfer
+        version = self.server.versions.get(table_name)
+        if version is not None:
+            digest = hashlib.sha1(f"{version}|{query}".encode()).hexdigest()[:20]
+            etag = f'W/"{digest}"'
+            if self.not_modified(etag):
+                return 304
+            self.send_json(200, build(), etag)
+            return 200
+        body = json.dumps(build(), default=str, separators=(",", ":"))
+        etag = f'W/"{hashlib.sha1(body.encode()).hexdigest()[:20]}"'
+        if self.not_modified(etag):
+            return 304
+        self.send_body(200, body, etag=etag)
+        return 200
+
+    def handle_get(self, path, query):
+        source = self.server.source
+        if path == "/health":
+            self.send_json(200, {"status": "ok"})
+            return 200
+        if path == "/metrics":
+            self.send_body(200, metrics.render_prometheus(), "text/plain; version=0.0.4")
+            return 200
+        if path == "/apartments/search":
+            return self.search(query)
+        table_name, record_id = self.route_table(path)
+        columns = self.server.columns(table_name)
+        if record_id is not None:
+            def build():
+                statement = build_statement(table_name, "select", primary_key=PRIMARY_KEYS[table_name])
+                with get_cursor(source, prepared=statement) as cursor:
+                    cursor.execute(statement, (record_id,))
+                    rows = cursor.fetchall()
+                if not rows:
+                    raise ApiError(404, f"No {table_name} with {PRIMARY_KEYS[table_name]} {record_id}")
+                return dict(zip(columns, rows[0]))
+            return self.conditional(table_name, path, build)
+
+        limit, _ = check_page_window(query.get("limit", DEFAULT_PAGE_SIZE))
+        limit = min(limit, MAX_PAGE_SIZE)
+        after = int(query["after"]) if "after" in query else None
+        def build():
+            pages = iter_table_pages(source, table_name, page_size=limit, after=None if after is None else (after,),
+                                     cached_pages=0)
+            try:
+                rows = next(pages, [])
+            finally:
+                pages.close()
+            primary_index = columns.index(PRIMARY_KEYS[table_name])
+            next_key = rows[-1][primary_index] if rows and len(rows) == limit else None
+            return {"rows": [dict(zip(columns, row)) for row in rows], "next": next_key}
+        return self.conditional(table_name, f"{path}?after={after}&limit={limit}", build)
+
+    def search(self, query):
+        order_by = query.pop("order_by", None)
+        descending = query.pop("descending", "0") not in ("0", "false", "")
+        limit, offset = check_page_window(query.pop("limit", DEFAULT_PAGE_SIZE), query.pop("offset", 0))
+        limit = min(limit, MAX_PAGE_SIZE)
+        criteria = parse_search_criteria(f"{column}={value}" for column, value in sorted(query.items()))
+        columns = self.server.columns(TABLE_APARTMENT_UNIT)
+        def build():
+            rows = find_apartments(self.server.source, criteria, order_by, descending, limit, offset, cached=False)
+            return {"rows": [dict(zip(columns, row)) for row in rows]}
+        key = f"{sorted(query.items())}|{order_by}|{descending}|{limit}|{offset}"
+        return self.conditional(TABLE_APARTMENT_UNIT, key, build)
+
+    def handle_post(self, path, query):
+        table_name, _ = self.route_table(path, with_id=False)
+        values = validate_values(table_name, self.read_json())
+        result = insert_record(self.server.source, table_name, values)
+        if result is None:
+            raise ApiError(500, "Insert failed")
+        self.send_json(201, {"id": values.get(PRIMARY_KEYS[table_name]) or result.lastrowid})
+        return 201
+
+    def handle_patch(self, path, query):
+        table_name, record_id = self.route_table(path, with_id=True)
+        values = validate_values(table_name, self.read_json(), partial=True)
+        if not values:
+            raise ApiError(400, "Nothing to update")
+        result = update_record(self.server.source, table_name, PRIMARY_KEYS[table_name], record_id, values)
+        if result is None:
+            raise ApiError(500, "Update failed")
+        status = 200 if result.rowcount else 404
+        self.send_json(status, {"updated": result.rowcount})
+        return status
+
+    def handle_delete(self, path, query):
+        table_name, record_id = self.route_table(path, with_id=True)
+        result = delete_record(self.server.source, table_name, PRIMARY_KEYS[table_name], record_id)
+        if result is None:
+            raise ApiError(500, "Delete failed")
+        status = 200 if result.rowcount else 404
+        self.send_json(status, {"deleted": result.rowcount})
+        return status
+
+class ApiServer(ThreadingHTTPServer):
+    daemon_threads = True
+    request_queue_size = 128
+
+    def __init__(self, address, source=None, bind_and_activate=True):
+        super().__init__(address, ApiHandler, bind_and_activate)
+        self.source = source or get_pool()
+        self.versions = TableVersions(self.source)
+        self._columns = {}
+
+    def columns(self, table_name):
+        # get_table_columns raises when the lookup fails, and only a non-empty
+        # result is kept, so a failure is retried by the next request
+        columns = self._columns.get(table_name)
+        if columns is None:
+            columns = get_table_columns(self.source, table_name)
+            if columns:
+                self._columns[table_name] = columns
+        return columns
+
+def serve(host, port, workers):
+    # Pre-fork model: the listening socket is bound once and every worker
+    # process accepts from it with its own threads and connection pool, so
+    # request handling scales across cores without sharing a GIL.
+    # SIGTERM stops the server the same way Ctrl-C does, in the parent and in every worker
+    signal.signal(signal.SIGTERM, signal.default_int_handler)
+    listener = socket.create_server((host, port), backlog=ApiServer.request_queue_size)
+    children = []
+    if workers > 1 and hasattr(os, "fork"):
+        for _ in range(workers):
+            pid = os.fork()
+            if pid == 0:
+                run_worker(listener)
+                os._exit(0)
+            children.append(pid)
+        logging.info(f"API listening on {host}:{port} with {workers} workers")
+        try:
+            for pid in children:
+                os.waitpid(pid, 0)
+        except KeyboardInterrupt:
+            for pid in children:
+                os.kill(pid, signal.SIGTERM)
+            for pid in children:
+                os.waitpid(pid, 0)
+        return
+    logging.info(f"API listening on {host}:{port}")
+    run_worker(listener)
+
+def run_worker(listener):
+    # The pool is created here, after the fork, so workers never share connections
+    server = ApiServer(listener.getsockname(), bind_and_activate=False)
+    server.socket.close()
+    server.socket = listener
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+def main():
+    parser = argparse.ArgumentParser(description="HTTP/JSON API for apartments, tenants and parking.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1,
+                        help="worker processes (default: one per CPU)")
+    args = parser.parse_args()
+    serve(args.host, args.port, args.workers)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,183 @@
+import argparse
+import asyncio
+import functools
+import json
+import logging
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+from apartment import (
+    DEFAULT_PAGE_SIZE,
+    PRIMARY_KEYS,
+    TABLE_APARTMENT_UNIT,
+    check_page_window,
+    delete_record,
+    find_apartments,
+    get_pool,
+    get_table_columns,
+    insert_record,
+    iter_table_pages,
+    update_record,
+    validate_values,
+)
+
+# Requests allowed to wait on or use the database at once, and per-request deadline
+MAX_CONCURRENT_REQUESTS = int(os.environ.get("APARTMENT_ASYNC_CONCURRENCY", "200"))
+REQUEST_TIMEOUT = float(os.environ.get("APARTMENT_ASYNC_TIMEOUT", "30"))
+
+class AsyncApartmentService:
+    # The blocking data-access functions run on a thread pool no larger than
+    # the connection pool, so one event loop can hold hundreds of requests
+    # while only pool-size queries are actually in flight.
+    def __init__(self, pool=None, max_concurrency=MAX_CONCURRENT_REQUESTS, timeout=REQUEST_TIMEOUT):
+        self.pool = pool or get_pool()
+        self.timeout = timeout
+        self._limit = asyncio.Semaphore(max_concurrency)
+        self._executor = ThreadPoolExecutor(max_workers=self.pool.size, thread_name_prefix="apartment-db")
+        self._columns = {}
+
+    async def _run(self, func, *args):
+        # Cancelling or timing out abandons the result; the worker thread
+        # finishes its statement and returns the connection to the pool.
+        async with self._limit:
+            loop = asyncio.get_running_loop()
+            return await asyncio.wait_for(
+                loop.run_in_executor(self._executor, functools.partial(func, *args)), self.timeout
+            )
+
+    async def columns(self, table_name):
+        # A failed lookup raises, so it is retried by the next request rather than cached
+        if table_name not in self._columns:
+            self._columns[table_name] = await self._run(get_table_columns, self.pool, table_name)
+        return self._columns[table_name]
+
+    async def view_table(self, table_name, after=None, limit=DEFAULT_PAGE_SIZE):
+        limit, _ = check_page_window(limit)
+        def first_page():
+            pages = iter_table_pages(self.pool, table_name, page_size=limit,
+                                     after=None if after is None else (after,))
+            try:
+                return next(pages, [])
+            finally:
+                pages.close()
+        columns = await self.columns(table_name)
+        rows = await self._run(first_page)
+        primary_index = columns.index(PRIMARY_KEYS[table_name])
+        next_key = rows[-1][primary_index] if rows and len(rows) == limit else None
+        return {"rows": [dict(zip(columns, row)) for row in rows], "next": next_key}
+
+    async def search_apartments(self, filters, order_by=None, descending=False, limit=DEFAULT_PAGE_SIZE, offset=0):
+        limit, offset = check_page_window(limit, offset)
+        def search():
+            return list(find_apartments(self.pool, filters, order_by, descending, limit, offset))
+        columns = await self.columns(TABLE_APARTMENT_UNIT)
+        rows = await self._run(search)
+        return {"rows": [dict(zip(columns, row)) for row in rows]}
+
+    async def add_details(self, table_name, values):
+        values = validate_values(table_name, values)
+        result = await self._run(insert_record, self.pool, table_name, values)
+        if result is None:
+            raise RuntimeError("Insert failed")
+        return {"id": result.lastrowid or values.get(PRIMARY_KEYS[table_name])}
+
+    async def update_details(self, table_name, primary_value, values):
+        values = validate_values(table_name, values, partial=True)
+        result = await self._run(update_record, self.pool, table_name, PRIMARY_KEYS[table_name], primary_value, values)
+        if result is None:
+            raise RuntimeError("Update failed")
+        return {"updated": result.rowcount}
+
+    async def delete_details(self, table_name, primary_value):
+        result = await self._run(delete_record, self.pool, table_name, PRIMARY_KEYS[table_name], primary_value)
+        if result is None:
+            raise RuntimeError("Delete failed")
+        return {"deleted": result.rowcount}
+
+    async def handle(self, request):
+        if not isinstance(request, dict):
+            raise ValueError("A request must be a JSON object")
+        op = request.get("op")
+        table_name = request.get("table", TABLE_APARTMENT_UNIT)
+        if table_name not in PRIMARY_KEYS:
+            raise ValueError(f"Unknown table: {table_name}")
+        if op == "view":
+            return await self.view_table(table_name, request.get("after"), request.get("limit", DEFAULT_PAGE_SIZE))
+        if op == "search":
+            # {"min": 3, "max": 8} is a range and a JSON list an IN-list
+            filters = request.get("filters", {})
+            if not isinstance(filters, dict):
+                raise ValueError("filters must be a JSON object")
+            filters = {column: (value.get("min"), value.get("max")) if isinstance(value, dict) else value
+                       for column, value in filters.items()}
+            return await self.search_apartments(filters, request.get("order_by"), request.get("descending", False),
+                                                request.get("limit", DEFAULT_PAGE_SIZE), request.get("offset", 0))
+        if op == "add":
+            return await self.add_details(table_name, request["values"])
+        if op == "update":
+            return await self.update_details(table_name, request["id"], request["values"])
+        if op == "delete":
+            return await self.delete_details(table_name, request["id"])
+        raise ValueError(f"Unknown operation: {op}")
+
+    def close(self):
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+async def respond(service, writer, line):
+    response = {}
+    try:
+        request = json.loads(line)
+        if isinstance(request, dict):
+            response["id"] = request.get("id")
+        response["result"] = await service.handle(request)
+    except asyncio.TimeoutError:
+        response["error"] = "Request timed out"
+    except (ValueError, KeyError, RuntimeError) as e:
+        response["error"] = str(e)
+    except Exception as e:
+        # Every request gets a reply; otherwise the client waits on it forever
+        logging.exception(f"Error handling request {line[:200]!r}")
+        response["error"] = f"{type(e).__name__}: {e}"
+    writer.write((json.dumps(response, default=str) + "\n").encode())
+    await writer.drain()
+
+async def serve_client(service, reader, writer):
+    # One JSON request per line; requests on a connection run concurrently and
+    # responses carry the request id since they may complete out of order.
+    tasks = set()
+    try:
+        while line := await reader.readline():
+            if line.strip():
+                task = asyncio.create_task(respond(service, writer, line))
+                tasks.add(task)
+                task.add_done_callback(tasks.discard)
+        if tasks:
+            await asyncio.gather(*tasks, return_exceptions=True)
+    finally:
+        for task in tasks:
+            task.cancel()
+        writer.close()
+
+async def serve(host, port, max_concurrency=MAX_CONCURRENT_REQUESTS):
+    service = AsyncApartmentService(max_concurrency=max_concurrency)
+    server = await asyncio.start_server(functools.partial(serve_client, service), host, port)
+    logging.info(f"Async apartment service listening on {host}:{port}")
+    try:
+        async with server:
+            await server.serve_forever()
+    finally:
+        service.close()
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve apartment operations as JSON lines over TCP.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--max-concurrency", type=int, default=MAX_CONCURRENT_REQUESTS)
+    args = parser.parse_args()
+    try:
+        asyncio.run(serve(args.host, args.port, args.max_concurrency))
+    except KeyboardInterrupt:
+        pass
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,163 @@
+import argparse
+import json
+import logging
+import time
+from datetime import datetime
+
+import mysql.connector
+
+from apartment import (
+    DEFAULT_PAGE_SIZE,
+    TABLE_CHANGE_LOG,
+    TABLE_CHANGE_SEQUENCE,
+    connect_to_database,
+    execute_query,
+    get_cursor,
+    get_pool,
+)
+
+TABLE_CHANGE_CONSUMER = "ChangeConsumer"
+
+# change_ids are drawn from ChangeSequence as a transaction commits (see
+# UnitOfWork._write_changes), so the log only ever grows by a contiguous run
+# of ids above everything already visible
+AUDIT_DDL = {
+    TABLE_CHANGE_LOG: f"""
+        CREATE TABLE IF NOT EXISTS {TABLE_CHANGE_LOG} (
+            change_id BIGINT PRIMARY KEY,
+            table_name VARCHAR(64) NOT NULL,
+            primary_key VARCHAR(64) NOT NULL,
+            operation VARCHAR(8) NOT NULL,
+            before_values TEXT,
+            after_values TEXT,
+            changed_at DATETIME(6) NOT NULL,
+            INDEX idx_changelog_table (table_name, change_id)
+        )""",
+    TABLE_CHANGE_CONSUMER: f"""
+        CREATE TABLE IF NOT EXISTS {TABLE_CHANGE_CONSUMER} (
+            consumer VARCHAR(64) PRIMARY KEY,
+            last_change_id BIGINT NOT NULL,
+            updated_at DATETIME NOT NULL
+        )""",
+    TABLE_CHANGE_SEQUENCE: f"""
+        CREATE TABLE IF NOT EXISTS {TABLE_CHANGE_SEQUENCE} (
+            sequence_id TINYINT PRIMARY KEY,
+            last_id BIGINT NOT NULL
+        )""",
+}
+
+def create_audit_tables(connection):
+    cursor = connection.cursor()
+    try:
+        for ddl in AUDIT_DDL.values():
+            cursor.execute(ddl)
+        # Existing logs continue from their highest id
+        cursor.execute(f"INSERT IGNORE INTO {TABLE_CHANGE_SEQUENCE} (sequence_id, last_id) "
+                       f"SELECT 1, COALESCE(MAX(change_id), 0) FROM {TABLE_CHANGE_LOG}")
+        connection.commit()
+    finally:
+        cursor.close()
+
+def read_changes(connection, after=0, limit=DEFAULT_PAGE_SIZE, table_name=None):
+    # One indexed range read past the offset: the primary key for all tables,
+    # idx_changelog_table for one. No transaction can still commit an id at
+    # or below one already visible, so a read past after, filtered by table
+    # or not, never skips a change that shows up later.
+    where = "change_id > %s"
+    params = (after,)
+    if table_name:
+        where += " AND table_name = %s"
+        params += (table_name,)
+    with get_cursor(connection) as cursor:
+        cursor.execute(f"SELECT change_id, table_name, primary_key, operation, before_values, after_values, changed_at "
+                       f"FROM {TABLE_CHANGE_LOG} WHERE {where} ORDER BY change_id LIMIT %s", params + (limit,))
+        rows = cursor.fetchall()
+    return [{
+        "change_id": change_id,
+        "table": table,
+        "key": key,
+        "operation": operation,
+        "before": json.loads(before) if before else None,
+        "after": json.loads(after_values) if after_values else None,
+        "changed_at": changed_at,
+    } for change_id, table, key, operation, before, after_values, changed_at in rows]
+
+def tail(connection, after=0, table_name=None, follow=False, poll_interval=1.0):
+    # Yields changes in change_id order; with follow=True it keeps polling for new ones
+    while True:
+        changes = read_changes(connection, after, DEFAULT_PAGE_SIZE, table_name)
+        yield from changes
+        if changes:
+            after = changes[-1]["change_id"]
+        if len(changes) < DEFAULT_PAGE_SIZE:
+            if not follow:
+                return
+            time.sleep(poll_interval)
+
+def get_offset(connection, consumer):
+    with get_cursor(connection) as cursor:
+        cursor.execute(f"SELECT last_change_id FROM {TABLE_CHANGE_CONSUMER} WHERE consumer = %s", (consumer,))
+        rows = cursor.fetchall()
+    return rows[0][0] if rows else 0
+
+def commit_offset(connection, consumer, change_id):
+    # Offsets only move forward, so a slow duplicate consumer cannot rewind one
+    execute_query(connection, f"""
+        INSERT INTO {TABLE_CHANGE_CONSUMER} (consumer, last_change_id, updated_at) VALUES (%s, %s, %s)
+        ON DUPLICATE KEY UPDATE last_change_id = GREATEST(last_change_id, VALUES(last_change_id)),
+                                updated_at = VALUES(updated_at)""",
+                  (consumer, change_id, datetime.now().replace(microsecond=0)))
+
+def consume(connection, consumer, handler, table_name=None, limit=DEFAULT_PAGE_SIZE):
+    # Passes the changes after the consumer's stored offset to handler(change)
+    # and then advances the offset; returns how many were handled. A handler
+    # error leaves the offset at the last change that was fully handled.
+    after = get_offset(connection, consumer)
+    handled = 0
+    try:
+        for change in read_changes(connection, after, limit, table_name):
+            handler(change)
+            after = change["change_id"]
+            handled += 1
+    finally:
+        if handled:
+            commit_offset(connection, consumer, after)
+    return handled
+
+def main():
+    parser = argparse.ArgumentParser(description="Change log of every record write.")
+    commands = parser.add_subparsers(dest="command", required=True)
+    commands.add_parser("setup", help="create the ChangeLog, ChangeConsumer and ChangeSequence tables")
+    tail_command = commands.add_parser("tail", help="print changes as JSON lines")
+    tail_command.add_argument("--after", type=int, help="start after this change_id (default: the consumer offset or 0)")
+    tail_command.add_argument("--table", help="only changes to this table")
+    tail_command.add_argument("--follow", action="store_true", help="keep polling for new changes")
+    tail_command.add_argument("--consumer", help="resume from and record this consumer's offset")
+    args = parser.parse_args()
+
+    pool = get_pool()
+    try:
+        if args.command == "setup":
+            with connect_to_database(pool) as connection:
+                if connection:
+                    create_audit_tables(connection)
+            return
+        after = args.after
+        if after is None:
+            after = get_offset(pool, args.consumer) if args.consumer else 0
+        last_change_id = None
+        try:
+            for count, change in enumerate(tail(pool, after, args.table, args.follow), 1):
+                print(json.dumps(change, default=str), flush=True)
+                last_change_id = change["change_id"]
+                if args.consumer and count % DEFAULT_PAGE_SIZE == 0:
+                    commit_offset(pool, args.consumer, last_change_id)
+        finally:
+            if args.consumer and last_change_id is not None:
+                commit_offset(pool, args.consumer, last_change_id)
+    except mysql.connector.Error as e:
+        logging.error(e)
+        raise SystemExit(1)
+
+if __name__ == "__main__":
+    main()
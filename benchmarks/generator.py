@@ -0,0 +1,58 @@
+# Synthetic building data for ApartmentUnit, TenantOwner and Parking.
+# Rows are generated lazily from a seeded RNG, so any scale is reproducible
+# and never has to fit in memory.
+import random
+from datetime import date, timedelta
+
+from apartment import TABLE_APARTMENT_UNIT, TABLE_FIELDS, TABLE_PARKING, TABLE_TENANT_OWNER
+
+UNITS_PER_FLOOR = 20
+OCCUPANCY_STATUSES = ("Occupied", "Occupied", "Occupied", "Vacant", "Reserved")
+AVAILABILITY_STATUSES = ("Available", "Occupied", "Occupied")
+
+def apartment_rows(count, seed=0):
+    rng = random.Random(seed)
+    for unit_number in range(1, count + 1):
+        bedrooms = rng.randint(0, 4)
+        yield (
+            unit_number,
+            (unit_number - 1) // UNITS_PER_FLOOR + 1,
+            bedrooms,
+            rng.randint(1, max(1, bedrooms)),
+            400 + bedrooms * 300 + rng.randint(0, 400),
+            rng.choice(("Rent", "Owned")),
+            rng.choice(OCCUPANCY_STATUSES),
+        )
+
+def tenant_rows(count, seed=0):
+    rng = random.Random(seed + 1)
+    epoch = date(2015, 1, 1)
+    for tenant in range(1, count + 1):
+        start = epoch + timedelta(days=rng.randint(0, 3650))
+        yield (
+            f"Tenant{tenant}",
+            str(rng.randint(2000000000, 9999999999)),
+            start.isoformat(),
+            (start + timedelta(days=rng.choice((180, 365, 730)))).isoformat(),
+            f"Contact{rng.randint(1, count)}",
+            rng.choice(("Current", "Late", "Paid")),
+        )
+
+def parking_rows(count, seed=0):
+    rng = random.Random(seed + 2)
+    for space in range(1, count + 1):
+        status = rng.choice(AVAILABILITY_STATUSES)
+        yield (
+            space,
+            f"Plate{rng.randint(100000, 999999)}" if status == "Occupied" else "None",
+            status,
+        )
+
+GENERATORS = {
+    TABLE_APARTMENT_UNIT: apartment_rows,
+    TABLE_TENANT_OWNER: tenant_rows,
+    TABLE_PARKING: parking_rows,
+}
+
+def table_columns(table_name):
+    return [field for field, _, _, _ in TABLE_FIELDS[table_name]]
@@ -0,0 +1,99 @@
+# Load generator for api_server.py.
+#
+#     python api_server.py --workers 4 &
+#     python -m benchmarks.load_test --url http://127.0.0.1:8080 --concurrency 32 --duration 20
+#
+# Each client thread keeps one HTTP/1.1 connection open and cycles through
+# PATHS. With --conditional it replays the ETag it last saw for a path, which
+# measures the 304 path instead of full responses.
+import argparse
+import http.client
+import json
+import statistics
+import threading
+import time
+from urllib.parse import urlsplit
+
+PATHS = (
+    "/tables/ApartmentUnit?limit=50",
+    "/tables/TenantOwner?limit=50",
+    "/tables/Parking?limit=50",
+    "/apartments/search?occupancy_status=Vacant&bedrooms=2-3&limit=50",
+    "/apartments/search?floor_number=3&limit=50",
+)
+
+def client(host, port, paths, deadline, conditional, results):
+    connection = http.client.HTTPConnection(host, port, timeout=30)
+    etags = {}
+    latencies = []
+    statuses = {}
+    sent = received = 0
+    index = 0
+    while time.perf_counter() < deadline:
+        path = paths[index % len(paths)]
+        index += 1
+        headers = {"Accept-Encoding": "gzip"}
+        if conditional and path in etags:
+            headers["If-None-Match"] = etags[path]
+        started = time.perf_counter()
+        try:
+            connection.request("GET", path, headers=headers)
+            response = connection.getresponse()
+            body = response.read()
+        except (OSError, http.client.HTTPException):
+            statuses["error"] = statuses.get("error", 0) + 1
+            connection.close()
+            connection = http.client.HTTPConnection(host, port, timeout=30)
+            continue
+        latencies.append(time.perf_counter() - started)
+        statuses[response.status] = statuses.get(response.status, 0) + 1
+        sent += 1
+        received += len(body)
+        if response.getheader("ETag"):
+            etags[path] = response.getheader("ETag")
+    connection.close()
+    results.append((latencies, statuses, sent, received))
+
+def run(url, concurrency, duration, conditional, paths=PATHS):
+    parts = urlsplit(url)
+    results = []
+    deadline = time.perf_counter() + duration
+    threads = [threading.Thread(target=client, args=(parts.hostname, parts.port or 80, paths, deadline, conditional, results))
+               for _ in range(concurrency)]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+
+    latencies = sorted(latency for result in results for latency in result[0])
+    statuses = {}
+    for _, counts, _, _ in results:
+        for status, count in counts.items():
+            statuses[str(status)] = statuses.get(str(status), 0) + count
+    requests = sum(result[2] for result in results)
+    def percentile(fraction):
+        return round(latencies[min(len(latencies) - 1, int(fraction * len(latencies)))] * 1000, 3) if latencies else 0.0
+    return {
+        "requests": requests,
+        "requests_per_sec": round(requests / elapsed, 1) if elapsed else 0.0,
+        "p50_ms": percentile(0.50),
+        "p95_ms": percentile(0.95),
+        "p99_ms": percentile(0.99),
+        "mean_ms": round(statistics.fmean(latencies) * 1000, 3) if latencies else 0.0,
+        "bytes_received": sum(result[3] for result in results),
+        "statuses": statuses,
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure api_server.py requests/sec.")
+    parser.add_argument("--url", default="http://127.0.0.1:8080")
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--duration", type=float, default=10)
+    parser.add_argument("--conditional", action="store_true", help="send If-None-Match with the last ETag seen")
+    args = parser.parse_args()
+    print(json.dumps(run(args.url, args.concurrency, args.duration, args.conditional), indent=2))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,60 @@
+# Compares text-protocol statements rebuilt per call (the old add/update/delete/search
+# path) with the cached prepared-statement path, against the configured database.
+#
+#     python -m benchmarks.prepared_statements --iterations 5000
+import argparse
+import time
+
+from apartment import (
+    PRIMARY_KEYS,
+    TABLE_APARTMENT_UNIT,
+    build_statement,
+    connect_to_database,
+    get_cursor,
+    prepared_statements,
+)
+
+# Each iteration reads one unit and writes its occupancy_status back unchanged
+def run_text(connection, keys, primary_key):
+    for key in keys:
+        status = None
+        with get_cursor(connection) as cursor:
+            cursor.execute(f"SELECT occupancy_status FROM {TABLE_APARTMENT_UNIT} WHERE {primary_key} = %s", (key,))
+            for (status,) in cursor.fetchall():
+                pass
+        with get_cursor(connection, commit=True) as cursor:
+            cursor.execute(f"UPDATE {TABLE_APARTMENT_UNIT} SET occupancy_status = %s WHERE {primary_key} = %s", (status, key))
+
+def run_prepared(connection, keys, primary_key):
+    select = build_statement(TABLE_APARTMENT_UNIT, "select", primary_key=primary_key)
+    update = build_statement(TABLE_APARTMENT_UNIT, "update", ("occupancy_status",), primary_key)
+    for key in keys:
+        status = None
+        with get_cursor(connection, prepared=select) as cursor:
+            cursor.execute(select, (key,))
+            for row in cursor.fetchall():
+                status = row[cursor.column_names.index("occupancy_status")]
+        with get_cursor(connection, commit=True, prepared=update) as cursor:
+            cursor.execute(update, (status, key))
+
+def main():
+    parser = argparse.ArgumentParser(description="Text vs prepared statement micro-benchmark.")
+    parser.add_argument("--iterations", type=int, default=2000)
+    args = parser.parse_args()
+    primary_key = PRIMARY_KEYS[TABLE_APARTMENT_UNIT]
+    with connect_to_database() as connection:
+        if not connection:
+            return
+        with get_cursor(connection) as cursor:
+            cursor.execute(f"SELECT {primary_key} FROM {TABLE_APARTMENT_UNIT} LIMIT 1000")
+            sample = [key for (key,) in cursor.fetchall()] or [0]
+        keys = [sample[i % len(sample)] for i in range(args.iterations)]
+        for name, runner in (("text", run_text), ("prepared", run_prepared)):
+            started = time.perf_counter()
+            runner(connection, keys, primary_key)
+            elapsed = time.perf_counter() - started
+            print(f"{name:>8}: {args.iterations / elapsed:10.1f} lookup+update pairs/sec ({elapsed:.3f}s)")
+        print(f"prepared statement cache: {prepared_statements.stats()}")
+
+if __name__ == "__main__":
+    main()
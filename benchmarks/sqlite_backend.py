@@ -0,0 +1,155 @@
+# Embedded stand-in for MySQL: wraps sqlite3 in the small part of the
+# mysql.connector connection/cursor API that apartment.py uses, so the
+# benchmarks and tests can run without a database server.
+import re
+import sqlite3
+from decimal import Decimal
+
+import mysql.connector
+
+from apartment import POOL_SIZE, ConnectionPool, _connection_pools
+from schema import SEARCH_INDEXES, TABLE_DDL
+
+PLACEHOLDER = re.compile(r"%s")
+
+# The MySQL spellings the application's statements use, in SQLite's
+# dialect. SQLite locks the whole database on write, so row locks are implied.
+DIALECT = (
+    (re.compile(r" ON DUPLICATE KEY UPDATE "), " ON CONFLICT DO UPDATE SET "),
+    (re.compile(r"\bVALUES\((\w+)\)"), r"excluded.\1"),
+    (re.compile(r"\bINSERT IGNORE\b"), "INSERT OR IGNORE"),
+    (re.compile(r"\bGREATEST\("), "MAX("),
+    (re.compile(r"\bLEAST\("), "MIN("),
+    (re.compile(r" FOR UPDATE\b"), ""),
+)
+
+CREATE_TABLE = re.compile(r"^\s*CREATE TABLE IF NOT EXISTS (\w+)")
+AUTO_INCREMENT_KEY = re.compile(r"\b(?:BIG)?INT AUTO_INCREMENT PRIMARY KEY")
+INLINE_INDEX = re.compile(r",\s*INDEX (\w+) \(([^)]*)\)")
+
+sqlite3.register_adapter(Decimal, str)
+
+# The mysql.connector class MySQL raises for the same kind of failure; an
+# sqlite3.OperationalError is mostly a missing table or column
+ERRORS = (
+    (sqlite3.IntegrityError, mysql.connector.IntegrityError),
+    (sqlite3.DataError, mysql.connector.DataError),
+    (sqlite3.OperationalError, mysql.connector.ProgrammingError),
+)
+
+def database_error(error):
+    for sqlite_class, mysql_class in ERRORS:
+        if isinstance(error, sqlite_class):
+            return mysql_class(msg=str(error))
+    return mysql.connector.Error(msg=str(error))
+
+def translate(query):
+    query = PLACEHOLDER.sub("?", query)
+    for pattern, replacement in DIALECT:
+        query = pattern.sub(replacement, query)
+    return query
+
+def translate_ddl(ddl):
+    # A MySQL CREATE TABLE as SQLite statements: the table, then one CREATE
+    # INDEX per inline INDEX clause
+    table_name = CREATE_TABLE.match(ddl).group(1)
+    indexes = INLINE_INDEX.findall(ddl)
+    table = INLINE_INDEX.sub("", AUTO_INCREMENT_KEY.sub("INTEGER PRIMARY KEY AUTOINCREMENT", ddl))
+    return [table] + [f"CREATE INDEX IF NOT EXISTS {name} ON {table_name} ({columns})" for name, columns in indexes]
+
+class SQLiteCursor:
+    def __init__(self, connection):
+        self._cursor = connection.db.cursor()
+
+    def execute(self, query, params=None):
+        try:
+            if CREATE_TABLE.match(query):
+                for statement in translate_ddl(query):
+                    self._cursor.execute(statement)
+            else:
+                self._cursor.execute(translate(query), tuple(params or ()))
+        except sqlite3.Error as e:
+            raise database_error(e) from e
+
+    def executemany(self, query, rows):
+        try:
+            self._cursor.executemany(translate(query), rows)
+        except sqlite3.Error as e:
+            raise database_error(e) from e
+
+    @property
+    def column_names(self):
+        return tuple(column[0] for column in self._cursor.description or ())
+
+    @property
+    def description(self):
+        return self._cursor.description
+
+    @property
+    def rowcount(self):
+        return self._cursor.rowcount
+
+    @property
+    def lastrowid(self):
+        return self._cursor.lastrowid
+
+    def fetchone(self):
+        return self._cursor.fetchone()
+
+    def fetchmany(self, size=1):
+        return self._cursor.fetchmany(size)
+
+    def fetchall(self):
+        return self._cursor.fetchall()
+
+    def close(self):
+        self._cursor.close()
+
+class SQLiteConnection:
+    connection_id = 0
+
+    def __init__(self, path=":memory:"):
+        self.db = sqlite3.connect(path, check_same_thread=False)
+        self.db.execute("PRAGMA journal_mode = WAL")
+        self.db.execute("PRAGMA synchronous = NORMAL")
+
+    def cursor(self, **options):
+        # buffered/prepared/dictionary options have no SQLite equivalent and are ignored
+        return SQLiteCursor(self)
+
+    def commit(self):
+        self.db.commit()
+
+    def rollback(self):
+        self.db.rollback()
+
+    @property
+    def in_transaction(self):
+        return self.db.in_transaction
+
+    def is_connected(self):
+        return True
+
+    def ping(self, reconnect=False, attempts=1, delay=0):
+        pass
+
+    def close(self):
+        self.db.close()
+
+class SQLitePool(ConnectionPool):
+    # A ConnectionPool whose connections all open the same SQLite file
+    def __init__(self, path, size=POOL_SIZE):
+        super().__init__(size, retries=1, scope=f"sqlite:{path}", database=path)
+
+    def _connect(self):
+        connection = SQLiteConnection(self.config["database"])
+        _connection_pools[connection] = self
+        return connection
+
+def create_schema(connection):
+    cursor = connection.cursor()
+    for ddl in TABLE_DDL.values():
+        cursor.execute(ddl)
+    for name, columns in SEARCH_INDEXES.items():
+        connection.db.execute(f"CREATE INDEX IF NOT EXISTS {name} ON ApartmentUnit ({', '.join(columns)})")
+    connection.commit()
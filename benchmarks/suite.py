@@ -0,0 +1,166 @@
+# Benchmark harness for the view, search and insert paths.
+#
+#     python -m benchmarks.suite --scale 100000                   # embedded SQLite stand-in
+#     python -m benchmarks.suite --backend mysql --scale 1000000  # APARTMENT_DB_* database
+#     python -m benchmarks.suite --scale 100000 --compare baseline.json
+#
+# The MySQL backend loads synthetic rows into the configured database, so
+# point APARTMENT_DB_NAME at a scratch schema, never at production data.
+import argparse
+import json
+import os
+import platform
+import statistics
+import time
+import tracemalloc
+from datetime import datetime
+from itertools import islice
+
+import apartment
+from apartment import (
+    TABLE_APARTMENT_UNIT,
+    TABLE_PARKING,
+    TABLE_TENANT_OWNER,
+    build_insert_query,
+    connect_to_database,
+    execute_many,
+    find_apartments,
+    insert_record,
+    iter_table_rows,
+)
+from benchmarks.generator import GENERATORS, table_columns
+
+LOAD_BATCH_SIZE = 5000
+
+SEARCHES = {
+    "search_vacant_2bed_floors": {"occupancy_status": "Vacant", "bedrooms": (2, None), "floor_number": (3, 8)},
+    "search_floor": {"floor_number": 3},
+    "search_square_footage": {"square_footage": (1200, 1300)},
+}
+
+def summarize(latencies, rows, elapsed, peak_bytes):
+    latencies = sorted(latencies)
+    def percentile(fraction):
+        return round(latencies[min(len(latencies) - 1, int(fraction * len(latencies)))] * 1000, 3)
+    return {
+        "runs": len(latencies),
+        "p50_ms": percentile(0.50),
+        "p95_ms": percentile(0.95),
+        "p99_ms": percentile(0.99),
+        "max_ms": round(latencies[-1] * 1000, 3),
+        "mean_ms": round(statistics.fmean(latencies) * 1000, 3),
+        "rows": rows,
+        "rows_per_sec": round(rows / elapsed, 1) if elapsed else 0.0,
+        "peak_memory_kb": round(peak_bytes / 1024, 1),
+    }
+
+def measure(operation, runs):
+    # tracemalloc hooks every allocation and would inflate the latencies, so
+    # the runs are timed untraced and peak memory (the Python allocation
+    # high-water mark of one run) comes from an extra, untimed run
+    latencies = []
+    rows = 0
+    started = time.perf_counter()
+    for _ in range(runs):
+        run_started = time.perf_counter()
+        rows += operation()
+        latencies.append(time.perf_counter() - run_started)
+    elapsed = time.perf_counter() - started
+    tracemalloc.start()
+    try:
+        operation()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return summarize(latencies, rows, elapsed, peak)
+
+def load(connection, scale, seed):
+    counts = {TABLE_APARTMENT_UNIT: scale, TABLE_TENANT_OWNER: scale, TABLE_PARKING: max(1, scale // 2)}
+    for table_name, count in counts.items():
+        query = build_insert_query(table_name, table_columns(table_name))
+        rows = GENERATORS[table_name](count, seed)
+        while batch := list(islice(rows, LOAD_BATCH_SIZE)):
+            execute_many(connection, query, batch)
+    return counts
+
+def run_suite(connection, scale, runs, seed):
+    results = {}
+    apartment.query_cache.ttl = 0
+    started = time.perf_counter()
+    counts = load(connection, scale, seed)
+    results["bulk_load"] = {"rows": sum(counts.values()), "seconds": round(time.perf_counter() - started, 3)}
+
+    for table_name in (TABLE_APARTMENT_UNIT, TABLE_TENANT_OWNER, TABLE_PARKING):
+        results[f"view_{table_name}"] = measure(
+            lambda: sum(1 for _ in iter_table_rows(connection, table_name)), max(1, runs // 10))
+
+    for name, filters in SEARCHES.items():
+        results[name] = measure(lambda: sum(1 for _ in find_apartments(connection, filters)), runs)
+    results["search_sorted_top50"] = measure(
+        lambda: sum(1 for _ in find_apartments(connection, {"occupancy_status": "Vacant"}, "square_footage", True, 50)), runs)
+
+    columns = table_columns(TABLE_PARKING)
+    next_space = [counts[TABLE_PARKING]]
+    def insert_one():
+        next_space[0] += 1
+        insert_record(connection, TABLE_PARKING, dict(zip(columns, (next_space[0], "None", "Available"))))
+        return 1
+    results["insert_parking"] = measure(insert_one, runs)
+
+    apartment.query_cache.ttl = apartment.CACHE_TTL
+    apartment.query_cache.clear()
+    results["search_floor_cached"] = measure(lambda: sum(1 for _ in find_apartments(connection, {"floor_number": 3})), runs)
+    return results
+
+def compare(results, baseline_path):
+    with open(baseline_path, encoding="utf-8") as source:
+        baseline = json.load(source)["results"]
+    for name, metrics in results.items():
+        before = baseline.get(name, {})
+        if "p50_ms" in metrics and before.get("p50_ms"):
+            change = (metrics["p50_ms"] - before["p50_ms"]) / before["p50_ms"] * 100
+            print(f"{name:32} p50 {before['p50_ms']:>10.3f} -> {metrics['p50_ms']:>10.3f} ms ({change:+.1f}%)")
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark view/search/insert at a synthetic scale.")
+    parser.add_argument("--backend", choices=("sqlite", "mysql"), default="sqlite")
+    parser.add_argument("--sqlite-path", default=":memory:")
+    parser.add_argument("--scale", type=int, default=10000, help="apartment and tenant rows (parking gets half)")
+    parser.add_argument("--runs", type=int, default=50)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", default="benchmark_results.json")
+    parser.add_argument("--compare", help="earlier results file to compare p50 latencies against")
+    args = parser.parse_args()
+
+    if args.backend == "sqlite":
+        from benchmarks.sqlite_backend import SQLiteConnection, create_schema
+        connection = SQLiteConnection(args.sqlite_path)
+        create_schema(connection)
+        results = run_suite(connection, args.scale, args.runs, args.seed)
+    else:
+        from schema import migrate
+        with connect_to_database() as connection:
+            if not connection:
+                return
+            migrate(connection)
+            results = run_suite(connection, args.scale, args.runs, args.seed)
+
+    report = {
+        "backend": args.backend,
+        "scale": args.scale,
+        "runs": args.runs,
+        "timestamp": datetime.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "host": platform.node(),
+        "results": results,
+    }
+    with open(args.output, "w", encoding="utf-8") as output:
+        json.dump(report, output, indent=2)
+    for name, metrics in results.items():
+        print(f"{name:32} {json.dumps(metrics)}")
+    print(f"Results written to {os.path.abspath(args.output)}")
+    if args.compare:
+        compare(results, args.compare)
+
+if __name__ == "__main__":
+    main()
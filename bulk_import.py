@@ -0,0 +1,141 @@
+import argparse
+import csv
+import json
+import logging
+import time
+
+import mysql.connector
+
+from apartment import (
+    AUDIT_ENABLED,
+    PRIMARY_KEYS,
+    TABLE_FIELDS,
+    build_insert_query,
+    execute_many,
+    get_pool,
+    notify_table_changed,
+    queue_change,
+    unit_of_work,
+)
+
+DEFAULT_BATCH_SIZE = 1000
+
+def read_records(path):
+    # Records are yielded one at a time so the source file is never fully loaded
+    with open(path, newline="", encoding="utf-8") as source:
+        if path.endswith(".jsonl"):
+            for line in source:
+                if line.strip():
+                    yield json.loads(line)
+        else:
+            yield from csv.DictReader(source)
+
+def validate_record(record, fields):
+    values = []
+    for field, _, validator, error_msg in fields:
+        value = record.get(field)
+        value = "" if value is None else str(value).strip()
+        if not validator(value):
+            raise ValueError(f"{field}: {error_msg}")
+        values.append(value)
+    return tuple(values)
+
+def is_data_error(error):
+    # Only these are about particular rows; a missing table or unknown column
+    # (ProgrammingError) fails every row alike, so bisecting it is wasted work
+    return isinstance(error, (mysql.connector.IntegrityError, mysql.connector.DataError))
+
+def queue_insert_changes(table_name, columns, rows, first_id):
+    # One change event per inserted row. Rows without their primary key got
+    # it from AUTO_INCREMENT; a multi-row INSERT is a "simple insert", which
+    # InnoDB gives consecutive values starting at the reported insert id.
+    primary_key = PRIMARY_KEYS[table_name]
+    for index, row in enumerate(rows):
+        after = dict(zip(columns, row))
+        if primary_key not in after:
+            after = {primary_key: first_id + index, **after}
+        queue_change(table_name, after[primary_key], "insert", after=after)
+
+def import_records(connection, table_name, records, batch_size=DEFAULT_BATCH_SIZE, rejects=None):
+    fields = TABLE_FIELDS[table_name]
+    columns = [field for field, _, _, _ in fields]
+    query = build_insert_query(table_name, columns)
+    stats = {"read": 0, "inserted": 0, "rejected": 0}
+    batch = []
+    source_rows = []
+
+    def reject(record, reason):
+        stats["rejected"] += 1
+        if rejects is not None:
+            rejects.write(json.dumps({"record": record, "error": reason}, default=str) + "\n")
+
+    def insert(rows, sources):
+        # A batch the database refuses is split in half and retried, so only
+        # the offending rows are rejected; a lost connection or deadlock is not
+        # about the rows and rejects the batch as it stands
+        try:
+            with unit_of_work(connection):
+                result = execute_many(connection, query, rows)
+                if AUDIT_ENABLED:
+                    queue_insert_changes(table_name, columns, rows, result.lastrowid)
+        except mysql.connector.Error as e:
+            if len(rows) == 1 or not is_data_error(e):
+                for record in sources:
+                    reject(record, str(e))
+                return
+            middle = len(rows) // 2
+            insert(rows[:middle], sources[:middle])
+            insert(rows[middle:], sources[middle:])
+            return
+        stats["inserted"] += len(rows)
+
+    def flush():
+        inserted = stats["inserted"]
+        insert(batch, source_rows)
+        if stats["inserted"] > inserted:
+            notify_table_changed(table_name)
+        batch.clear()
+        source_rows.clear()
+
+    started = time.perf_counter()
+    for record in records:
+        stats["read"] += 1
+        try:
+            batch.append(validate_record(record, fields))
+        except ValueError as e:
+            reject(record, str(e))
+            continue
+        source_rows.append(record)
+        if len(batch) >= batch_size:
+            flush()
+    if batch:
+        flush()
+    elapsed = time.perf_counter() - started
+    stats["seconds"] = round(elapsed, 3)
+    stats["rows_per_sec"] = round(stats["inserted"] / elapsed, 1) if elapsed else 0.0
+    return stats
+
+def import_file(connection, table_name, path, batch_size=DEFAULT_BATCH_SIZE, reject_path=None):
+    rejects = open(reject_path, "w", encoding="utf-8") if reject_path else None
+    try:
+        stats = import_records(connection, table_name, read_records(path), batch_size, rejects)
+    finally:
+        if rejects is not None:
+            rejects.close()
+    logging.info(
+        f"Imported {stats['inserted']} of {stats['read']} rows into {table_name} "
+        f"({stats['rejected']} rejected) at {stats['rows_per_sec']} rows/sec"
+    )
+    return stats
+
+def main():
+    parser = argparse.ArgumentParser(description="Bulk load apartments, tenants or parking from CSV/JSONL.")
+    parser.add_argument("table", choices=sorted(TABLE_FIELDS))
+    parser.add_argument("path", help="CSV file with a header row, or a .jsonl file")
+    parser.add_argument("--batch-size", type=int, default=DEFAULT_BATCH_SIZE)
+    parser.add_argument("--rejects", help="write rejected rows to this JSONL file")
+    args = parser.parse_args()
+    import_file(get_pool(), args.table, args.path, args.batch_size, args.rejects)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,244 @@
+# Non-interactive entry point for every menu operation.
+#
+#     python cli.py view TenantOwner --limit 20
+#     python cli.py search --filter floor_number=3-8 --filter occupancy_status=Vacant
+#     python cli.py add Parking --set parking_space_number=12 --set vehicle_details=None --set availability_status=Available
+#     python cli.py update TenantOwner 42 --set contact_info=5550100
+#     python cli.py delete Parking 7
+#     python cli.py import TenantOwner tenants.csv
+#     python cli.py export ApartmentUnit units.jsonl.gz --filter bedrooms=2
+#     python cli.py batch nightly.txt --atomic
+#
+# A batch script holds one of the commands above per line (blank lines and
+# # comments are skipped) and runs them all on one pooled connection.
+import argparse
+import json
+import logging
+import shlex
+import sys
+
+import mysql.connector
+
+from apartment import (
+    DEFAULT_PAGE_SIZE,
+    PRIMARY_KEYS,
+    SEARCH_COLUMNS,
+    TABLE_APARTMENT_UNIT,
+    connect_to_database,
+    delete_record,
+    find_apartments,
+    get_pool,
+    get_table_columns,
+    insert_record,
+    iter_table_pages,
+    unit_of_work,
+    update_record,
+    validate_values,
+)
+from bulk_import import DEFAULT_BATCH_SIZE, import_file
+from export import EXPORT_FORMATS, export_table, parse_filters, parse_search_criteria, parse_search_filters
+
+TABLES = sorted(PRIMARY_KEYS)
+
+def parse_assignments(items):
+    values = {}
+    for item in items:
+        column, separator, value = item.partition("=")
+        if not separator:
+            raise ValueError(f"Expected COLUMN=VALUE, got {item}")
+        values[column] = value
+    return values
+
+def load_values(args):
+    # --values-file supplies a JSON object; --set pairs override its entries
+    values = {}
+    if args.values_file:
+        with open(args.values_file, encoding="utf-8") as source:
+            values.update(json.load(source))
+    values.update(parse_assignments(args.set))
+    if not values:
+        raise ValueError("No values given; use --set COLUMN=VALUE or --values-file")
+    return values
+
+def print_rows(columns, rows):
+    count = 0
+    for row in rows:
+        print(json.dumps(dict(zip(columns, row)), default=str))
+        count += 1
+    return count
+
+def run_view(connection, args):
+    columns = get_table_columns(connection, args.table)
+    after = None if args.after is None else (args.after,)
+    page_size = min(args.limit, DEFAULT_PAGE_SIZE) if args.limit else DEFAULT_PAGE_SIZE
+    count = 0
+    for page in iter_table_pages(connection, args.table, page_size=page_size, after=after):
+        if args.limit:
+            page = page[:args.limit - count]
+        count += print_rows(columns, page)
+        if args.limit and count >= args.limit:
+            break
+
+def run_search(connection, args):
+    if args.order_by and args.order_by not in SEARCH_COLUMNS:
+        raise ValueError(f"Cannot order by {args.order_by}.")
+    columns = get_table_columns(connection, TABLE_APARTMENT_UNIT)
+    print_rows(columns, find_apartments(connection, parse_search_criteria(args.filter), args.order_by,
+                                        args.descending, args.limit, args.offset))
+
+def run_add(connection, args):
+    values = validate_values(args.table, load_values(args))
+    result = insert_record(connection, args.table, values)
+    if result is None:
+        raise RuntimeError("Insert failed")
+    print(json.dumps({"id": values.get(PRIMARY_KEYS[args.table]) or result.lastrowid}))
+
+def run_update(connection, args):
+    values = validate_values(args.table, load_values(args), partial=True)
+    result = update_record(connection, args.table, PRIMARY_KEYS[args.table], args.id, values)
+    if result is None:
+        raise RuntimeError("Update failed")
+    print(json.dumps({"updated": result.rowcount}))
+
+def run_delete(connection, args):
+    result = delete_record(connection, args.table, PRIMARY_KEYS[args.table], args.id)
+    if result is None:
+        raise RuntimeError("Delete failed")
+    print(json.dumps({"deleted": result.rowcount}))
+
+def run_import(connection, args):
+    print(json.dumps(import_file(connection, args.table, args.path, args.batch_size, args.rejects)))
+
+def run_export(connection, args):
+    if args.table == TABLE_APARTMENT_UNIT:
+        where, params = parse_search_filters(args.filter)
+    else:
+        where, params = parse_filters(args.filter, get_table_columns(connection, args.table))
+    count = export_table(connection, args.table, args.path, args.format, where, params, args.page_size)
+    print(json.dumps({"exported": count}))
+
+def run_batch(connection, args):
+    raise ValueError("batch cannot be used inside a batch script")
+
+COMMANDS = {
+    "view": run_view,
+    "search": run_search,
+    "add": run_add,
+    "update": run_update,
+    "delete": run_delete,
+    "import": run_import,
+    "export": run_export,
+    "batch": run_batch,
+}
+
+def build_parser():
+    parser = argparse.ArgumentParser(description="Apartment management without the interactive menus.")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    view = commands.add_parser("view", help="print a table as JSON lines")
+    view.add_argument("table", choices=TABLES)
+    view.add_argument("--limit", type=int, help="stop after this many rows")
+    view.add_argument("--after", type=int, help="start after this primary key")
+
+    search = commands.add_parser("search", help="search apartments")
+    search.add_argument("--filter", action="append", default=[], metavar="COLUMN=VALUE",
+                        help="exact (3), range (3-8) or list (2,3) match on an apartment column")
+    search.add_argument("--order-by")
+    search.add_argument("--descending", action="store_true")
+    search.add_argument("--limit", type=int)
+    search.add_argument("--offset", type=int, default=0)
+
+    for name, help_text in (("add", "insert a record"), ("update", "change fields of a record")):
+        command = commands.add_parser(name, help=help_text)
+        command.add_argument("table", choices=TABLES)
+        if name == "update":
+            command.add_argument("id", type=int, help="primary key of the record")
+        command.add_argument("--set", action="append", default=[], metavar="COLUMN=VALUE")
+        command.add_argument("--values-file", help="JSON object of column values")
+
+    delete = commands.add_parser("delete", help="delete a record")
+    delete.add_argument("table", choices=TABLES)
+    delete.add_argument("id", type=int, help="primary key of the record")
+
+    bulk = commands.add_parser("import", help="bulk load a CSV or JSONL file")
+    bulk.add_argument("table", choices=TABLES)
+    bulk.add_argument("path")
+    bulk.add_argument("--batch-size", type=int, default=DEFAULT_BATCH_SIZE)
+    bulk.add_argument("--rejects", help="write rejected rows to this JSONL file")
+
+    export = commands.add_parser("export", help="stream a table to CSV, JSONL or Parquet")
+    export.add_argument("table", choices=TABLES)
+    export.add_argument("path")
+    export.add_argument("--format", choices=EXPORT_FORMATS)
+    export.add_argument("--filter", action="append", default=[], metavar="COLUMN=VALUE")
+    export.add_argument("--page-size", type=int, default=DEFAULT_PAGE_SIZE)
+
+    batch = commands.add_parser("batch", help="run a script of commands, one per line ('-' reads stdin)")
+    batch.add_argument("script")
+    batch.add_argument("--atomic", action="store_true",
+                       help="run the whole script in one transaction; the first failure rolls it all back")
+    batch.add_argument("--stop-on-error", action="store_true")
+    return parser
+
+def run_script(connection, parser, lines, stop_on_error=False):
+    # Returns (succeeded, failed) line counts
+    succeeded = failed = 0
+    for number, line in enumerate(lines, 1):
+        line = line.strip()
+        if not line or line.startswith("#"):
+            continue
+        try:
+            try:
+                args = parser.parse_args(shlex.split(line))
+            except SystemExit:
+                raise ValueError(f"Invalid command: {line}")
+            COMMANDS[args.command](connection, args)
+            succeeded += 1
+        except (ValueError, RuntimeError, OSError, mysql.connector.Error) as e:
+            logging.error(f"Line {number}: {e}")
+            failed += 1
+            if stop_on_error:
+                raise
+    return succeeded, failed
+
+def run_batch_file(pool, parser, args):
+    # One connection serves the whole script, so there is no per-command
+    # connection setup; --atomic also makes it a single transaction.
+    try:
+        source = sys.stdin if args.script == "-" else open(args.script, encoding="utf-8")
+    except OSError as e:
+        logging.error(f"Cannot read the script: {e}")
+        return 1
+    try:
+        with connect_to_database(pool) as connection:
+            if not connection:
+                return 1
+            if args.atomic:
+                with unit_of_work(connection):
+                    succeeded, failed = run_script(connection, parser, source, stop_on_error=True)
+            else:
+                succeeded, failed = run_script(connection, parser, source, args.stop_on_error)
+    except (ValueError, RuntimeError, OSError, mysql.connector.Error):
+        logging.error("Batch stopped; " + ("nothing was committed." if args.atomic else "earlier lines were committed."))
+        return 1
+    finally:
+        if source is not sys.stdin:
+            source.close()
+    logging.info(f"Batch finished: {succeeded} succeeded, {failed} failed")
+    return 1 if failed else 0
+
+def main(argv=None):
+    parser = build_parser()
+    args = parser.parse_args(argv)
+    pool = get_pool()
+    if args.command == "batch":
+        return run_batch_file(pool, parser, args)
+    try:
+        COMMANDS[args.command](pool, args)
+    except (ValueError, RuntimeError, OSError, mysql.connector.Error) as e:
+        logging.error(str(e))
+        return 1
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,149 @@
+import argparse
+import csv
+import gzip
+import json
+import logging
+import os
+import time
+
+import mysql.connector
+
+from apartment import (
+    DEFAULT_PAGE_SIZE,
+    PRIMARY_KEYS,
+    SEARCH_COLUMNS,
+    TABLE_APARTMENT_UNIT,
+    build_search_filter,
+    get_pool,
+    get_table_columns,
+    is_valid_search_value,
+    iter_table_pages,
+    parse_search_value,
+)
+
+try:
+    import pyarrow
+    import pyarrow.parquet
+except ImportError:
+    pyarrow = None
+
+EXPORT_FORMATS = ("csv", "jsonl", "parquet")
+
+def open_output(path):
+    if path.endswith(".gz"):
+        return gzip.open(path, "wt", newline="", encoding="utf-8")
+    return open(path, "w", newline="", encoding="utf-8")
+
+def write_csv(path, columns, pages):
+    count = 0
+    with open_output(path) as output:
+        writer = csv.writer(output)
+        writer.writerow(columns)
+        for page in pages:
+            writer.writerows(page)
+            count += len(page)
+    return count
+
+def write_jsonl(path, columns, pages):
+    count = 0
+    with open_output(path) as output:
+        for page in pages:
+            output.writelines(json.dumps(dict(zip(columns, row)), default=str) + "\n" for row in page)
+            count += len(page)
+    return count
+
+def write_parquet(path, columns, pages):
+    # Each page becomes one row group, so only a single page is ever held in memory
+    if pyarrow is None:
+        raise RuntimeError("Parquet export requires the optional 'pyarrow' package.")
+    count = 0
+    writer = None
+    try:
+        for page in pages:
+            batch = pyarrow.table({column: [row[i] for row in page] for i, column in enumerate(columns)})
+            if writer is None:
+                writer = pyarrow.parquet.ParquetWriter(path, batch.schema, compression="zstd")
+            writer.write_table(batch.cast(writer.schema))
+            count += len(page)
+        if writer is None:
+            # No rows to take types from, so the columns are written as nulls
+            empty = pyarrow.table({column: pyarrow.array([], pyarrow.null()) for column in columns})
+            pyarrow.parquet.write_table(empty, path, compression="zstd")
+    finally:
+        if writer is not None:
+            writer.close()
+    return count
+
+WRITERS = {"csv": write_csv, "jsonl": write_jsonl, "parquet": write_parquet}
+
+def detect_format(path):
+    name = path[:-3] if path.endswith(".gz") else path
+    extension = name.rsplit(".", 1)[-1].lower()
+    return extension if extension in EXPORT_FORMATS else "csv"
+
+def export_table(connection, table_name, path, fmt=None, where="", params=(), page_size=DEFAULT_PAGE_SIZE):
+    fmt = fmt or detect_format(path)
+    columns = get_table_columns(connection, table_name)
+    started = time.perf_counter()
+    # Rows go to a temporary file that only replaces path once every page
+    # was read, so a failed read never leaves a truncated export behind
+    directory, name = os.path.split(path)
+    partial = os.path.join(directory, f".partial-{os.getpid()}-{name}")
+    # A one-off stream, so its pages bypass the query cache
+    pages = iter_table_pages(connection, table_name, where, params, page_size, cached_pages=0)
+    try:
+        count = WRITERS[fmt](partial, columns, pages)
+        os.replace(partial, path)
+    finally:
+        if os.path.exists(partial):
+            os.remove(partial)
+    elapsed = time.perf_counter() - started
+    logging.info(f"Exported {count} rows from {table_name} to {path} in {elapsed:.2f}s")
+    return count
+
+def parse_search_criteria(filters):
+    # Apartment filters accept the same range/IN-list syntax as search_apartments
+    criteria = {}
+    for item in filters:
+        column, _, value = item.partition("=")
+        if column not in SEARCH_COLUMNS or not is_valid_search_value(column, value):
+            raise ValueError(f"Invalid filter: {item}")
+        criteria[column] = parse_search_value(column, value)
+    return criteria
+
+def parse_search_filters(filters):
+    return build_search_filter(parse_search_criteria(filters))
+
+def parse_filters(filters, columns):
+    conditions = []
+    params = []
+    for item in filters:
+        column, _, value = item.partition("=")
+        if column not in columns:
+            raise ValueError(f"Invalid filter: {item}")
+        conditions.append(f"{column} = %s")
+        params.append(value)
+    return " AND ".join(conditions), tuple(params)
+
+def main():
+    parser = argparse.ArgumentParser(description="Stream a table or apartment search results to a file.")
+    parser.add_argument("table", choices=sorted(PRIMARY_KEYS))
+    parser.add_argument("path", help="output file (.csv, .jsonl, .parquet; add .gz to compress csv/jsonl)")
+    parser.add_argument("--format", choices=EXPORT_FORMATS)
+    parser.add_argument("--filter", action="append", default=[], metavar="COLUMN=VALUE",
+                        help="only export matching rows; apartment filters accept ranges (3-8) and lists (2,3)")
+    parser.add_argument("--page-size", type=int, default=DEFAULT_PAGE_SIZE)
+    args = parser.parse_args()
+    pool = get_pool()
+    try:
+        if args.table == TABLE_APARTMENT_UNIT:
+            where, params = parse_search_filters(args.filter)
+        else:
+            where, params = parse_filters(args.filter, get_table_columns(pool, args.table))
+        export_table(pool, args.table, args.path, args.format, where, params, args.page_size)
+    except (mysql.connector.Error, OSError, RuntimeError, ValueError) as e:
+        logging.error(e)
+        raise SystemExit(1)
+
+if __name__ == "__main__":
+    main()
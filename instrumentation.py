@@ -0,0 +1,270 @@
+import logging
+import os
+import re
+import signal
+import threading
+import time
+
+# Statements slower than this are logged with their normalized SQL
+SLOW_QUERY_MS = float(os.environ.get("APARTMENT_SLOW_QUERY_MS", "200"))
+ENABLED = os.environ.get("APARTMENT_INSTRUMENTATION", "1") != "0"
+
+DURATION_BUCKETS_MS = (1, 2.5, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000)
+SIZE_BUCKETS = (0, 1, 10, 100, 1000, 10000, 100000, 1000000)
+
+NUMBER_LITERAL = re.compile(r"\b\d+(\.\d+)?\b")
+STRING_LITERAL = re.compile(r"'(?:[^'\\]|\\.)*'|\"(?:[^\"\\]|\\.)*\"")
+PLACEHOLDER_LIST = re.compile(r"\((?:\s*(?:%s|\?)\s*,)+\s*(?:%s|\?)\s*\)")
+TABLE_NAME = re.compile(r"\b(?:FROM|INTO|UPDATE)\s+`?(\w+)", re.IGNORECASE)
+
+def normalize_sql(query):
+    # Literals become ? and IN-lists collapse so that every shape of a
+    # statement aggregates under one key
+    if isinstance(query, (bytes, bytearray)):
+        query = query.decode("utf-8", "replace")
+    query = STRING_LITERAL.sub("?", query)
+    query = NUMBER_LITERAL.sub("?", query)
+    query = query.replace("%s", "?")
+    query = PLACEHOLDER_LIST.sub("(...)", query)
+    return " ".join(query.split())
+
+def operation_name(query):
+    if isinstance(query, (bytes, bytearray)):
+        query = query.decode("utf-8", "replace")
+    words = query.split(None, 1)
+    verb = words[0].lower() if words else "unknown"
+    match = TABLE_NAME.search(query)
+    return f"{verb}_{match.group(1)}" if match else verb
+
+class Histogram:
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.total = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        index = 0
+        while index < len(self.buckets) and value > self.buckets[index]:
+            index += 1
+        self.counts[index] += 1
+        self.total += value
+        self.count += 1
+
+    def snapshot(self):
+        return {"count": self.count, "sum": round(self.total, 3),
+                "mean": round(self.total / self.count, 3) if self.count else 0.0}
+
+class MetricsRegistry:
+    def __init__(self):
+        self._histograms = {}
+        self._counters = {}
+        self._lock = threading.Lock()
+
+    def observe(self, name, value, buckets=DURATION_BUCKETS_MS, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = Histogram(buckets)
+            histogram.observe(value)
+
+    def increment(self, name, amount=1, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + amount
+
+    def reset(self):
+        with self._lock:
+            self._histograms.clear()
+            self._counters.clear()
+
+    def snapshot(self):
+        with self._lock:
+            result = {}
+            for (name, labels), histogram in sorted(self._histograms.items()):
+                result.setdefault(name, {})[_label_text(labels)] = histogram.snapshot()
+            for (name, labels), value in sorted(self._counters.items()):
+                result.setdefault(name, {})[_label_text(labels)] = value
+            return result
+
+    def _copy(self):
+        histograms = [(key, (histogram.buckets, list(histogram.counts), histogram.total, histogram.count))
+                      for key, histogram in list(self._histograms.items())]
+        return sorted(histograms), sorted(list(self._counters.items()))
+
+    def render_prometheus(self, lock=True):
+        # lock=False copies the metrics without taking the lock. Signal
+        # handlers need that: they run on the main thread, possibly while it
+        # is inside observe() holding the lock, and would deadlock on it. Such
+        # a copy may miss the one update in progress.
+        if lock:
+            with self._lock:
+                histograms, counters = self._copy()
+        else:
+            histograms, counters = self._copy()
+        lines = []
+        for name in sorted({name for (name, _), _ in histograms}):
+            lines.append(f"# TYPE apartment_{name} histogram")
+            for (metric, labels), (buckets, counts, total, count) in histograms:
+                if metric != name:
+                    continue
+                cumulative = 0
+                for bound, bucket_count in zip(buckets + ("+Inf",), counts):
+                    cumulative += bucket_count
+                    bucket_labels = _prometheus_labels(labels + (("le", bound),))
+                    lines.append(f"apartment_{name}_bucket{bucket_labels} {cumulative}")
+                lines.append(f"apartment_{name}_sum{_prometheus_labels(labels)} {total}")
+                lines.append(f"apartment_{name}_count{_prometheus_labels(labels)} {count}")
+        for name in sorted({name for (name, _), _ in counters}):
+            lines.append(f"# TYPE apartment_{name} counter")
+            for (metric, labels), value in counters:
+                if metric == name:
+                    lines.append(f"apartment_{name}{_prometheus_labels(labels)} {value}")
+        return "\n".join(lines) + "\n"
+
+def _label_text(labels):
+    return ",".join(f"{key}={value}" for key, value in labels) or "all"
+
+def _prometheus_labels(labels):
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{key}="{value}"' for key, value in labels) + "}"
+
+metrics = MetricsRegistry()
+
+# Callables receiving one dict per statement: sql, operation, duration_ms,
+# rows, bytes, wait_ms and error
+query_observers = []
+
+_local = threading.local()
+
+def note_connection_wait(seconds):
+    # Called by the pool; the wait is attributed to the next statement in this thread
+    wait_ms = seconds * 1000
+    _local.wait_ms = getattr(_local, "wait_ms", 0.0) + wait_ms
+    if ENABLED:
+        metrics.observe("connection_wait_ms", wait_ms)
+
+def _row_bytes(rows):
+    size = 0
+    for row in rows:
+        for value in row:
+            size += len(value) if isinstance(value, (str, bytes, bytearray)) else 8
+    return size
+
+def record_query(event):
+    operation = event["operation"]
+    metrics.observe("query_duration_ms", event["duration_ms"], operation=operation)
+    metrics.observe("query_rows", event["rows"], SIZE_BUCKETS, operation=operation)
+    metrics.increment("query_bytes_fetched", event["bytes"], operation=operation)
+    if event["error"]:
+        metrics.increment("query_errors", operation=operation)
+    if event["duration_ms"] >= SLOW_QUERY_MS:
+        logging.warning(
+            f"Slow query ({event['duration_ms']:.1f} ms, {event['rows']} rows, "
+            f"waited {event['wait_ms']:.1f} ms for a connection): {normalize_sql(event['sql'])}"
+        )
+    for observer in query_observers:
+        observer(event)
+
+class InstrumentedCursor:
+    # Wraps a DB-API cursor and reports one event per executed statement once
+    # its results have been read: when a fetch exhausts the result set, or
+    # else on the next execute, finish() or close().
+    def __init__(self, cursor):
+        self._cursor = cursor
+        self._sql = None
+
+    def __getattr__(self, name):
+        return getattr(self._cursor, name)
+
+    def __iter__(self):
+        return iter(self._cursor)
+
+    def _start(self, query):
+        self.finish()
+        self._sql = query
+        self._elapsed = 0.0
+        self._rows = 0
+        self._bytes = 0
+        self._error = False
+        self._wait_ms = getattr(_local, "wait_ms", 0.0)
+        _local.wait_ms = 0.0
+
+    def _timed(self, method, *args):
+        started = time.perf_counter()
+        try:
+            return method(*args)
+        except Exception:
+            self._error = True
+            raise
+        finally:
+            self._elapsed += time.perf_counter() - started
+
+    def execute(self, query, params=None):
+        if not ENABLED:
+            return self._cursor.execute(query, params)
+        self._start(query)
+        return self._timed(self._cursor.execute, query, params)
+
+    def executemany(self, query, rows):
+        if not ENABLED:
+            return self._cursor.executemany(query, rows)
+        self._start(query)
+        return self._timed(self._cursor.executemany, query, rows)
+
+    def _fetched(self, rows):
+        if self._sql is not None and rows:
+            self._rows += len(rows)
+            self._bytes += _row_bytes(rows)
+
+    def fetchone(self):
+        row = self._timed(self._cursor.fetchone)
+        self._fetched([row] if row is not None else [])
+        if row is None:
+            self.finish()
+        return row
+
+    def fetchmany(self, size=1):
+        rows = self._timed(self._cursor.fetchmany, size)
+        self._fetched(rows)
+        if len(rows) < size:
+            self.finish()
+        return rows
+
+    def fetchall(self):
+        rows = self._timed(self._cursor.fetchall)
+        self._fetched(rows)
+        self.finish()
+        return rows
+
+    def finish(self):
+        if self._sql is None:
+            return
+        sql, self._sql = self._sql, None
+        rows = self._rows
+        if not rows and self._cursor.rowcount and self._cursor.rowcount > 0:
+            rows = self._cursor.rowcount
+        record_query({
+            "sql": sql,
+            "operation": operation_name(sql),
+            "duration_ms": self._elapsed * 1000,
+            "rows": rows,
+            "bytes": self._bytes,
+            "wait_ms": self._wait_ms,
+            "error": self._error,
+        })
+
+    def close(self):
+        self.finish()
+        self._cursor.close()
+
+def dump_metrics(signum=None, frame=None):
+    # Called as a signal handler (signum set) it must not wait on the metrics lock
+    logging.info("Query metrics:\n" + metrics.render_prometheus(lock=signum is None))
+
+def install_dump_signal():
+    # `kill -USR1 <pid>` logs the current metrics without stopping the process
+    if hasattr(signal, "SIGUSR1"):
+        signal.signal(signal.SIGUSR1, dump_metrics)
@@ -0,0 +1,289 @@
+import argparse
+import logging
+from datetime import date, datetime
+from decimal import Decimal
+
+import mysql.connector
+
+from apartment import (
+    AUDIT_ENABLED,
+    TABLE_TENANT_OWNER,
+    connect_to_database,
+    execute_query,
+    get_cursor,
+    get_pool,
+    queue_change,
+    unit_of_work,
+)
+
+TABLE_RENT_LEDGER = "RentLedger"
+TABLE_TENANT_BALANCE = "TenantBalance"
+TABLE_PERIOD_BALANCE = "TenantPeriodBalance"
+
+# Ledger entries are audited when auditing is on; the balance tables are
+# derived from them and are not.
+#
+# Charges are stored as positive amounts and payments as negative ones, so a
+# balance is always a plain SUM(amount). Legacy entries carry the old
+# free-text rent_payment_history with a zero amount.
+ENTRY_CHARGE = "charge"
+ENTRY_PAYMENT = "payment"
+ENTRY_LEGACY = "legacy"
+
+LEDGER_DDL = {
+    TABLE_RENT_LEDGER: f"""
+        CREATE TABLE IF NOT EXISTS {TABLE_RENT_LEDGER} (
+            entry_id BIGINT AUTO_INCREMENT PRIMARY KEY,
+            tenant_id INT NOT NULL,
+            period CHAR(7) NOT NULL,
+            entry_type VARCHAR(16) NOT NULL,
+            amount DECIMAL(12, 2) NOT NULL,
+            recorded_at DATETIME NOT NULL,
+            note VARCHAR(255),
+            INDEX idx_ledger_tenant_period (tenant_id, period),
+            INDEX idx_ledger_period (period)
+        )""",
+    TABLE_TENANT_BALANCE: f"""
+        CREATE TABLE IF NOT EXISTS {TABLE_TENANT_BALANCE} (
+            tenant_id INT PRIMARY KEY,
+            charged DECIMAL(12, 2) NOT NULL DEFAULT 0,
+            paid DECIMAL(12, 2) NOT NULL DEFAULT 0,
+            balance DECIMAL(12, 2) NOT NULL DEFAULT 0,
+            last_entry_id BIGINT,
+            updated_at DATETIME NOT NULL,
+            INDEX idx_balance (balance)
+        )""",
+    # One row per tenant and period with entries; closing_balance includes
+    # every earlier period, so a statement never sums older history.
+    TABLE_PERIOD_BALANCE: f"""
+        CREATE TABLE IF NOT EXISTS {TABLE_PERIOD_BALANCE} (
+            tenant_id INT NOT NULL,
+            period CHAR(7) NOT NULL,
+            charges DECIMAL(12, 2) NOT NULL DEFAULT 0,
+            payments DECIMAL(12, 2) NOT NULL DEFAULT 0,
+            closing_balance DECIMAL(12, 2) NOT NULL DEFAULT 0,
+            PRIMARY KEY (tenant_id, period),
+            INDEX idx_period_balance_period (period)
+        )""",
+}
+
+INSERT_ENTRY = (
+    f"INSERT INTO {TABLE_RENT_LEDGER} (tenant_id, period, entry_type, amount, recorded_at, note) "
+    "VALUES (%s, %s, %s, %s, %s, %s)"
+)
+
+UPSERT_BALANCE = (
+    f"INSERT INTO {TABLE_TENANT_BALANCE} (tenant_id, charged, paid, balance, last_entry_id, updated_at) "
+    "VALUES (%s, %s, %s, %s, %s, %s) "
+    "ON DUPLICATE KEY UPDATE charged = charged + VALUES(charged), paid = paid + VALUES(paid), "
+    "balance = balance + VALUES(balance), last_entry_id = VALUES(last_entry_id), updated_at = VALUES(updated_at)"
+)
+
+UPSERT_PERIOD_BALANCE = (
+    f"INSERT INTO {TABLE_PERIOD_BALANCE} (tenant_id, period, charges, payments, closing_balance) "
+    "VALUES (%s, %s, %s, %s, %s) "
+    "ON DUPLICATE KEY UPDATE charges = charges + VALUES(charges), payments = payments + VALUES(payments), "
+    "closing_balance = closing_balance + %s"
+)
+
+def create_ledger_tables(connection):
+    cursor = connection.cursor()
+    try:
+        for ddl in LEDGER_DDL.values():
+            cursor.execute(ddl)
+    finally:
+        cursor.close()
+
+def normalize_period(value):
+    # Periods are compared as strings, so "2024-1" is stored and queried as
+    # "2024-01"; anything strptime rejects raises ValueError
+    try:
+        return datetime.strptime(str(value), "%Y-%m").strftime("%Y-%m")
+    except ValueError:
+        raise ValueError(f"Invalid period {value}; expected YYYY-MM.") from None
+
+def record_entry(connection, tenant_id, period, entry_type, amount, note=None):
+    # The ledger row, the running balance and the period balances change in
+    # one transaction, so the summaries never drift from the entries.
+    period = normalize_period(period)
+    amount = Decimal(str(amount))
+    if entry_type == ENTRY_PAYMENT:
+        amount = -abs(amount)
+    now = datetime.now().replace(microsecond=0)
+    with unit_of_work(connection):
+        result = execute_query(connection, INSERT_ENTRY, (tenant_id, period, entry_type, amount, now, note))
+        if AUDIT_ENABLED:
+            queue_change(TABLE_RENT_LEDGER, result.lastrowid, "insert", after={
+                "entry_id": result.lastrowid, "tenant_id": tenant_id, "period": period, "entry_type": entry_type,
+                "amount": amount, "recorded_at": now, "note": note})
+        charged = amount if amount > 0 else Decimal("0")
+        paid = -amount if amount < 0 else Decimal("0")
+        execute_query(connection, UPSERT_BALANCE, (tenant_id, charged, paid, amount, result.lastrowid, now))
+        # The balance row above is locked until commit, so the tenant's period
+        # rows cannot change under the opening balance read here
+        rows = fetch(connection, f"SELECT closing_balance FROM {TABLE_PERIOD_BALANCE} "
+                                 "WHERE tenant_id = %s AND period < %s ORDER BY period DESC LIMIT 1", (tenant_id, period))
+        opening = rows[0][0] if rows else Decimal("0")
+        execute_query(connection, UPSERT_PERIOD_BALANCE, (tenant_id, period, charged, paid, opening + amount, amount))
+        # An entry for an earlier period moves the closing balance of every later one
+        execute_query(connection, f"UPDATE {TABLE_PERIOD_BALANCE} SET closing_balance = closing_balance + %s "
+                                  "WHERE tenant_id = %s AND period > %s", (amount, tenant_id, period))
+    return result.lastrowid
+
+def record_charge(connection, tenant_id, period, amount, note=None):
+    return record_entry(connection, tenant_id, period, ENTRY_CHARGE, abs(Decimal(str(amount))), note)
+
+def record_payment(connection, tenant_id, period, amount, note=None):
+    return record_entry(connection, tenant_id, period, ENTRY_PAYMENT, amount, note)
+
+def rebuild_balances(connection=None):
+    # Recomputes every running and per-period balance from the ledger
+    now = datetime.now().replace(microsecond=0)
+    with unit_of_work(connection):
+        execute_query(connection, f"DELETE FROM {TABLE_TENANT_BALANCE}")
+        execute_query(connection, f"""
+            INSERT INTO {TABLE_TENANT_BALANCE} (tenant_id, charged, paid, balance, last_entry_id, updated_at)
+            SELECT tenant_id,
+                   SUM(CASE WHEN amount > 0 THEN amount ELSE 0 END),
+                   SUM(CASE WHEN amount < 0 THEN -amount ELSE 0 END),
+                   SUM(amount), MAX(entry_id), %s
+            FROM {TABLE_RENT_LEDGER}
+            GROUP BY tenant_id""", (now,))
+        execute_query(connection, f"DELETE FROM {TABLE_PERIOD_BALANCE}")
+        execute_query(connection, f"""
+            INSERT INTO {TABLE_PERIOD_BALANCE} (tenant_id, period, charges, payments, closing_balance)
+            SELECT tenant_id, period,
+                   SUM(CASE WHEN amount > 0 THEN amount ELSE 0 END),
+                   SUM(CASE WHEN amount < 0 THEN -amount ELSE 0 END),
+                   SUM(SUM(amount)) OVER (PARTITION BY tenant_id ORDER BY period)
+            FROM {TABLE_RENT_LEDGER}
+            GROUP BY tenant_id, period""")
+
+def migrate_payment_history(connection=None):
+    # rent_payment_history is unstructured alphanumeric text with no amounts
+    # or dates, so each tenant's value is carried over verbatim as one legacy
+    # entry (amount 0, period of the lease start) rather than guessed at.
+    # The column itself is left in place for the existing menus.
+    now = datetime.now().replace(microsecond=0)
+    default_period = date.today().strftime("%Y-%m")
+    with unit_of_work(connection):
+        result = execute_query(connection, f"""
+            INSERT INTO {TABLE_RENT_LEDGER} (tenant_id, period, entry_type, amount, recorded_at, note)
+            SELECT t.tenant_id, COALESCE(SUBSTR(t.lease_start_date, 1, 7), %s), %s, 0, %s, t.rent_payment_history
+            FROM {TABLE_TENANT_OWNER} t
+            WHERE t.rent_payment_history IS NOT NULL AND t.rent_payment_history <> ''
+              AND NOT EXISTS (
+                  SELECT 1 FROM {TABLE_RENT_LEDGER} l
+                  WHERE l.tenant_id = t.tenant_id AND l.entry_type = %s
+              )""", (default_period, ENTRY_LEGACY, now, ENTRY_LEGACY))
+        if AUDIT_ENABLED and result.rowcount:
+            for entry in fetch_entries(connection, "entry_id >= %s AND entry_type = %s AND recorded_at = %s",
+                                       (result.lastrowid, ENTRY_LEGACY, now)):
+                queue_change(TABLE_RENT_LEDGER, entry["entry_id"], "insert", after=entry)
+        rebuild_balances(connection)
+    return result.rowcount
+
+def fetch(connection, query, params=None):
+    with get_cursor(connection) as cursor:
+        cursor.execute(query, params)
+        return cursor.fetchall()
+
+def fetch_entries(connection, where, params):
+    with get_cursor(connection) as cursor:
+        cursor.execute(f"SELECT * FROM {TABLE_RENT_LEDGER} WHERE {where} ORDER BY entry_id", params)
+        return [dict(zip(cursor.column_names, row)) for row in cursor.fetchall()]
+
+def tenant_balance(connection, tenant_id):
+    rows = fetch(connection, f"SELECT charged, paid, balance, updated_at FROM {TABLE_TENANT_BALANCE} "
+                             "WHERE tenant_id = %s", (tenant_id,))
+    if not rows:
+        return {"tenant_id": tenant_id, "charged": Decimal("0"), "paid": Decimal("0"), "balance": Decimal("0")}
+    charged, paid, balance, updated_at = rows[0]
+    return {"tenant_id": tenant_id, "charged": charged, "paid": paid, "balance": balance, "updated_at": updated_at}
+
+def tenants_in_arrears(connection, min_balance="0.01", limit=None):
+    # Served from idx_balance on the summary table; the ledger is not scanned
+    query = (f"SELECT b.tenant_id, t.name, b.balance FROM {TABLE_TENANT_BALANCE} b "
+             f"JOIN {TABLE_TENANT_OWNER} t ON t.tenant_id = b.tenant_id "
+             "WHERE b.balance >= %s ORDER BY b.balance DESC")
+    params = (Decimal(min_balance),)
+    if limit is not None:
+        query += " LIMIT %s"
+        params += (limit,)
+    return [{"tenant_id": tenant_id, "name": name, "balance": balance}
+            for tenant_id, name, balance in fetch(connection, query, params)]
+
+def monthly_statements(connection, period):
+    # Every tenant's statement for one period: that period's totals plus the
+    # closing balance of the tenant's latest earlier period, both primary key
+    # lookups on the per-period summary, so no ledger history is summed
+    period = normalize_period(period)
+    rows = fetch(connection, f"""
+        SELECT tenant_id, name, opening, charges, payments FROM (
+            SELECT t.tenant_id, t.name,
+                   (SELECT o.closing_balance FROM {TABLE_PERIOD_BALANCE} o
+                    WHERE o.tenant_id = t.tenant_id AND o.period < %s
+                    ORDER BY o.period DESC LIMIT 1) AS opening,
+                   p.charges, p.payments
+            FROM {TABLE_TENANT_OWNER} t
+            LEFT JOIN {TABLE_PERIOD_BALANCE} p ON p.tenant_id = t.tenant_id AND p.period = %s
+        ) s
+        WHERE opening IS NOT NULL OR charges IS NOT NULL
+        ORDER BY tenant_id""", (period, period))
+    statements = []
+    for tenant_id, name, opening, charges, payments in rows:
+        opening = opening or Decimal("0")
+        charges = charges or Decimal("0")
+        payments = payments or Decimal("0")
+        statements.append({"tenant_id": tenant_id, "name": name, "period": period, "opening_balance": opening,
+                           "charges": charges, "payments": payments,
+                           "closing_balance": opening + charges - payments})
+    return statements
+
+def main():
+    parser = argparse.ArgumentParser(description="Rent payment ledger.")
+    commands = parser.add_subparsers(dest="command", required=True)
+    commands.add_parser("setup", help="create the ledger tables and migrate rent_payment_history")
+    commands.add_parser("rebuild", help="recompute running and per-period balances from the ledger")
+    for name in ("charge", "pay"):
+        command = commands.add_parser(name)
+        command.add_argument("tenant_id", type=int)
+        command.add_argument("period", type=normalize_period, help="YYYY-MM")
+        command.add_argument("amount", type=Decimal)
+        command.add_argument("--note")
+    balance = commands.add_parser("balance")
+    balance.add_argument("tenant_id", type=int)
+    arrears = commands.add_parser("arrears")
+    arrears.add_argument("--min-balance", default="0.01")
+    arrears.add_argument("--limit", type=int)
+    statement = commands.add_parser("statements")
+    statement.add_argument("period", type=normalize_period, help="YYYY-MM")
+    args = parser.parse_args()
+
+    pool = get_pool()
+    try:
+        if args.command == "setup":
+            with connect_to_database(pool) as connection:
+                if connection:
+                    create_ledger_tables(connection)
+                    print(f"Migrated {migrate_payment_history(connection)} payment histories.")
+        elif args.command == "rebuild":
+            rebuild_balances(pool)
+        elif args.command == "charge":
+            record_charge(pool, args.tenant_id, args.period, args.amount, args.note)
+        elif args.command == "pay":
+            record_payment(pool, args.tenant_id, args.period, args.amount, args.note)
+        elif args.command == "balance":
+            print(tenant_balance(pool, args.tenant_id))
+        elif args.command == "arrears":
+            for row in tenants_in_arrears(pool, args.min_balance, args.limit):
+                print(row)
+        else:
+            for row in monthly_statements(pool, args.period):
+                print(row)
+    except mysql.connector.Error as e:
+        logging.error(e)
+        raise SystemExit(1)
+
+if __name__ == "__main__":
+    main()
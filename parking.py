@@ -0,0 +1,331 @@
+import argparse
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime
+
+import mysql.connector
+
+from apartment import (
+    TABLE_PARKING,
+    connect_to_database,
+    execute_query,
+    get_cursor,
+    get_pool,
+    notify_table_changed,
+    table_change_listeners,
+    unit_of_work,
+    validate_values,
+    write_record,
+)
+from schema import migrate
+
+AVAILABLE_STATUS = "Available"
+OCCUPIED_STATUS = "Occupied"
+EMPTY_VEHICLE = "None"
+
+# Spaces 0-99 are zone 0, 100-199 zone 1 and so on
+ZONE_SIZE = int(os.environ.get("APARTMENT_PARKING_ZONE_SIZE", "100"))
+
+# Writes made by other processes are not seen by change listeners, so the
+# index is also reloaded once it is this old
+INDEX_MAX_AGE = float(os.environ.get("APARTMENT_PARKING_INDEX_MAX_AGE", "60"))
+
+TABLE_PARKING_WAITLIST = "ParkingWaitlist"
+
+# Requests that found no free space, served in request_id (arrival) order
+PARKING_DDL = {
+    TABLE_PARKING_WAITLIST: f"""
+        CREATE TABLE IF NOT EXISTS {TABLE_PARKING_WAITLIST} (
+            request_id BIGINT AUTO_INCREMENT PRIMARY KEY,
+            vehicle_details VARCHAR(255) NOT NULL,
+            zone INT,
+            requested_at DATETIME NOT NULL
+        )""",
+}
+
+CLAIM_SPACE = (
+    f"UPDATE {TABLE_PARKING} SET availability_status = %s, vehicle_details = %s "
+    "WHERE parking_id = %s AND availability_status = %s"
+)
+
+RELEASE_SPACE = (
+    f"UPDATE {TABLE_PARKING} SET availability_status = %s, vehicle_details = %s "
+    "WHERE parking_space_number = %s AND availability_status = %s"
+)
+
+def zone_of(space_number):
+    return space_number // ZONE_SIZE
+
+class ParkingAllocator:
+    # Free spaces are held in two dicts, space number -> parking_id and
+    # zone -> {space number: parking_id}, so lookups and picks are O(1).
+    # The index only proposes a space; the conditional UPDATE is what claims
+    # it, so two admins (or two processes) can never take the same space.
+    def __init__(self, source=None):
+        self.source = source
+        self._free = {}
+        self._zones = {}
+        self._loaded_at = None
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        table_change_listeners.append(self.mark_stale)
+
+    def mark_stale(self, table_name):
+        # The allocator's own writes are already reflected in the index
+        if table_name == TABLE_PARKING and not getattr(self._local, "writing", False):
+            self._loaded_at = None
+
+    @contextmanager
+    def _write(self):
+        writing = getattr(self._local, "writing", False)
+        self._local.writing = True
+        try:
+            with unit_of_work(self.source) as unit:
+                yield unit
+        finally:
+            self._local.writing = writing
+
+    def load(self):
+        with get_cursor(self.source) as cursor:
+            cursor.execute(f"SELECT parking_id, parking_space_number FROM {TABLE_PARKING} "
+                           "WHERE availability_status = %s", (AVAILABLE_STATUS,))
+            rows = cursor.fetchall()
+        free, zones = {}, {}
+        for parking_id, space_number in rows:
+            free[space_number] = parking_id
+            zones.setdefault(zone_of(space_number), {})[space_number] = parking_id
+        with self._lock:
+            self._free, self._zones = free, zones
+            self._loaded_at = time.monotonic()
+
+    def _is_stale(self):
+        loaded_at = self._loaded_at
+        return loaded_at is None or time.monotonic() - loaded_at > INDEX_MAX_AGE
+
+    def _ensure_loaded(self):
+        # A reload can find spaces freed outside release(), by other code or
+        # other processes, so the waitlist is offered them first
+        if self._is_stale():
+            self.load()
+            self._serve_waitlist()
+
+    def _add(self, space_number, parking_id):
+        self._free[space_number] = parking_id
+        self._zones.setdefault(zone_of(space_number), {})[space_number] = parking_id
+
+    def _take(self, zone=None, space_number=None):
+        # Removes and returns (space_number, parking_id), or None; caller holds the lock
+        if space_number is not None:
+            if space_number not in self._free:
+                return None
+        elif zone is not None:
+            spaces = self._zones.get(zone)
+            if not spaces:
+                return None
+            space_number = next(reversed(spaces))
+        elif self._free:
+            space_number = next(reversed(self._free))
+        else:
+            return None
+        parking_id = self._free.pop(space_number)
+        spaces = self._zones[zone_of(space_number)]
+        del spaces[space_number]
+        if not spaces:
+            del self._zones[zone_of(space_number)]
+        return space_number, parking_id
+
+    def _claim(self, parking_id, vehicle_details):
+        with self._write():
+            # write_record, so claims and releases reach the change log when auditing is on
+            result = write_record(self.source, TABLE_PARKING, "update", "parking_id", parking_id, CLAIM_SPACE,
+                                  (OCCUPIED_STATUS, vehicle_details, parking_id, AVAILABLE_STATUS))
+            claimed = result.rowcount == 1
+            if claimed:
+                notify_table_changed(TABLE_PARKING)
+        return claimed
+
+    def allocate(self, vehicle_details, zone=None, space_number=None):
+        # Returns the allocated space number, or None if nothing matching is free
+        vehicle_details = validate_values(TABLE_PARKING, {"vehicle_details": vehicle_details}, partial=True)["vehicle_details"]
+        self._ensure_loaded()
+        return self._allocate(vehicle_details, zone, space_number)
+
+    def _allocate(self, vehicle_details, zone=None, space_number=None):
+        while True:
+            with self._lock:
+                candidate = self._take(zone, space_number)
+            if candidate is None:
+                return None
+            try:
+                if self._claim(candidate[1], vehicle_details):
+                    return candidate[0]
+            except Exception:
+                with self._lock:
+                    self._add(*candidate)
+                raise
+            # Taken elsewhere since the index was loaded; it stays out of the index
+            if space_number is not None:
+                return None
+
+    def request(self, vehicle_details, zone=None):
+        # Allocates now or joins the waitlist; returns the space number or None if queued
+        vehicle_details = validate_values(TABLE_PARKING, {"vehicle_details": vehicle_details}, partial=True)["vehicle_details"]
+        space_number = self.allocate(vehicle_details, zone)
+        if space_number is None:
+            with unit_of_work(self.source):
+                execute_query(self.source, f"INSERT INTO {TABLE_PARKING_WAITLIST} (vehicle_details, zone, requested_at) "
+                                           "VALUES (%s, %s, %s)", (vehicle_details, zone, datetime.now().replace(microsecond=0)))
+        return space_number
+
+    def release(self, space_number):
+        # Frees an occupied space and hands free spaces to the waitlist in
+        # arrival order; returns the (vehicle_details, space_number) assignments
+        # made, or None if the space was not occupied
+        released = []
+        with self._write():
+            result = write_record(self.source, TABLE_PARKING, "update", "parking_space_number", space_number,
+                                  RELEASE_SPACE, (AVAILABLE_STATUS, EMPTY_VEHICLE, space_number, OCCUPIED_STATUS))
+            if result.rowcount:
+                notify_table_changed(TABLE_PARKING)
+                with get_cursor(self.source) as cursor:
+                    cursor.execute(f"SELECT parking_id FROM {TABLE_PARKING} "
+                                   "WHERE availability_status = %s AND parking_space_number = %s",
+                                   (AVAILABLE_STATUS, space_number))
+                    released = cursor.fetchall()
+        if not released:
+            return None
+        with self._lock:
+            for (parking_id,) in released:
+                self._add(space_number, parking_id)
+        return self.serve_waitlist()
+
+    def waitlist(self):
+        # (request_id, vehicle_details, zone, requested_at) in arrival order
+        with get_cursor(self.source) as cursor:
+            cursor.execute(f"SELECT request_id, vehicle_details, zone, requested_at FROM {TABLE_PARKING_WAITLIST} "
+                           "ORDER BY request_id")
+            return cursor.fetchall()
+
+    def serve_waitlist(self):
+        # Offers the free spaces to waiting requests; returns the
+        # (vehicle_details, space_number) assignments made
+        if self._is_stale():
+            self.load()
+        return self._serve_waitlist()
+
+    def _serve_waitlist(self):
+        assignments = []
+        for request_id, vehicle_details, zone, _ in self.waitlist():
+            if not self._free:
+                break
+            space_number = self._serve(request_id, vehicle_details, zone)
+            if space_number is not None:
+                logging.info(f"Assigned space {space_number} to waiting request {request_id} ({vehicle_details})")
+                assignments.append((vehicle_details, space_number))
+        return assignments
+
+    def _serve(self, request_id, vehicle_details, zone):
+        # The request row stays locked until the claim commits and is deleted
+        # in the same transaction, so concurrent servers fill each request once
+        with self._write():
+            with get_cursor(self.source) as cursor:
+                cursor.execute(f"SELECT request_id FROM {TABLE_PARKING_WAITLIST} WHERE request_id = %s FOR UPDATE",
+                               (request_id,))
+                waiting = cursor.fetchall()
+            if not waiting:
+                return None
+            space_number = self._allocate(vehicle_details, zone)
+            if space_number is not None:
+                execute_query(self.source, f"DELETE FROM {TABLE_PARKING_WAITLIST} WHERE request_id = %s", (request_id,))
+        return space_number
+
+    def is_available(self, space_number):
+        self._ensure_loaded()
+        return space_number in self._free
+
+    def available(self, zone=None):
+        self._ensure_loaded()
+        with self._lock:
+            spaces = self._free if zone is None else self._zones.get(zone, {})
+            return sorted(spaces)
+
+    def stats(self):
+        with self._lock:
+            return {
+                "free": len(self._free),
+                "zones": {zone: len(spaces) for zone, spaces in sorted(self._zones.items())},
+            }
+
+def create_parking_tables(connection):
+    cursor = connection.cursor()
+    try:
+        for ddl in PARKING_DDL.values():
+            cursor.execute(ddl)
+    finally:
+        cursor.close()
+
+def create_parking_indexes(connection):
+    # The allocator's index and the unique space number key are schema
+    # migrations; returns the versions applied
+    return migrate(connection)
+
+def main():
+    parser = argparse.ArgumentParser(description="Parking space allocation.")
+    commands = parser.add_subparsers(dest="command", required=True)
+    commands.add_parser("setup", help="create the waitlist table and the indexes the allocator reads from")
+    free = commands.add_parser("free")
+    free.add_argument("--zone", type=int)
+    allocate = commands.add_parser("allocate")
+    allocate.add_argument("vehicle_details")
+    allocate.add_argument("--zone", type=int)
+    allocate.add_argument("--space", type=int)
+    request = commands.add_parser("request", help="allocate a space, or join the waitlist if none is free")
+    request.add_argument("vehicle_details")
+    request.add_argument("--zone", type=int)
+    release = commands.add_parser("release")
+    release.add_argument("space", type=int)
+    commands.add_parser("waitlist", help="list waiting requests in the order they will be served")
+    commands.add_parser("serve", help="offer free spaces to the waitlist")
+    args = parser.parse_args()
+
+    pool = get_pool()
+    try:
+        if args.command == "setup":
+            with connect_to_database(pool) as connection:
+                if connection:
+                    create_parking_tables(connection)
+                    print(f"Applied schema migrations: {', '.join(map(str, create_parking_indexes(connection))) or 'none'}")
+            return
+        allocator = ParkingAllocator(pool)
+        if args.command == "free":
+            print(allocator.available(args.zone))
+        elif args.command == "allocate":
+            space_number = allocator.allocate(args.vehicle_details, args.zone, args.space)
+            print(f"Allocated space {space_number}." if space_number is not None else "No matching space is free.")
+        elif args.command == "request":
+            space_number = allocator.request(args.vehicle_details, args.zone)
+            print(f"Allocated space {space_number}." if space_number is not None
+                  else "No matching space is free; added to the waitlist.")
+        elif args.command == "waitlist":
+            waiting = allocator.waitlist()
+            for request_id, vehicle_details, zone, requested_at in waiting:
+                print(f"{request_id}: {vehicle_details} (zone {'any' if zone is None else zone}, since {requested_at})")
+            if not waiting:
+                print("The waitlist is empty.")
+        elif args.command == "release":
+            assignments = allocator.release(args.space)
+            print("Space released." if assignments is not None else "That space is not occupied.")
+            for vehicle_details, space_number in assignments or ():
+                print(f"Assigned space {space_number} to {vehicle_details}.")
+        else:
+            for vehicle_details, space_number in allocator.serve_waitlist():
+                print(f"Assigned space {space_number} to {vehicle_details}.")
+    except mysql.connector.Error as e:
+        logging.error(e)
+        raise SystemExit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,286 @@
+import argparse
+import itertools
+import logging
+from datetime import date, datetime, timedelta
+
+import mysql.connector
+
+from apartment import (
+    TABLE_APARTMENT_UNIT,
+    TABLE_CHANGE_SEQUENCE,
+    TABLE_TENANT_OWNER,
+    connect_to_database,
+    execute_many,
+    execute_query,
+    get_cursor,
+    get_pool,
+    iter_table_rows,
+    unit_of_work,
+)
+from audit import TABLE_CHANGE_CONSUMER, commit_offset, create_audit_tables, tail
+from schema import migrate
+
+OCCUPIED_STATUS = "Occupied"
+VACANT_STATUS = "Vacant"
+
+# The rollups follow the ChangeLog (see audit.py) from this consumer's offset,
+# applying each ApartmentUnit and TenantOwner write as a delta to the cells it
+# touched, so writers need APARTMENT_AUDIT=1. `refresh` rebuilds them from the
+# base tables.
+ROLLUP_CONSUMER = "reports"
+SOURCE_TABLES = (TABLE_APARTMENT_UNIT, TABLE_TENANT_OWNER)
+
+ROLLUP_DDL = {
+    "OccupancyRollup": """
+        CREATE TABLE IF NOT EXISTS OccupancyRollup (
+            floor_number INT NOT NULL,
+            bedrooms INT NOT NULL,
+            total_units INT NOT NULL,
+            occupied_units INT NOT NULL,
+            vacant_units INT NOT NULL,
+            refreshed_at DATETIME NOT NULL,
+            PRIMARY KEY (floor_number, bedrooms)
+        )""",
+    "LeaseExpiryRollup": """
+        CREATE TABLE IF NOT EXISTS LeaseExpiryRollup (
+            expiry_month CHAR(7) PRIMARY KEY,
+            leases INT NOT NULL,
+            refreshed_at DATETIME NOT NULL
+        )""",
+    "UnitVacancy": """
+        CREATE TABLE IF NOT EXISTS UnitVacancy (
+            unit_number INT PRIMARY KEY,
+            vacant_since DATETIME NOT NULL
+        )""",
+}
+
+INSERT_OCCUPANCY = (
+    "INSERT INTO OccupancyRollup (floor_number, bedrooms, total_units, occupied_units, vacant_units, refreshed_at) "
+    "VALUES (%s, %s, %s, %s, %s, %s)"
+)
+
+APPLY_OCCUPANCY = (
+    f"{INSERT_OCCUPANCY} ON DUPLICATE KEY UPDATE total_units = total_units + VALUES(total_units), "
+    "occupied_units = occupied_units + VALUES(occupied_units), vacant_units = vacant_units + VALUES(vacant_units), "
+    "refreshed_at = VALUES(refreshed_at)"
+)
+
+INSERT_LEASE_EXPIRY = "INSERT INTO LeaseExpiryRollup (expiry_month, leases, refreshed_at) VALUES (%s, %s, %s)"
+
+APPLY_LEASE_EXPIRY = (
+    f"{INSERT_LEASE_EXPIRY} ON DUPLICATE KEY UPDATE leases = leases + VALUES(leases), "
+    "refreshed_at = VALUES(refreshed_at)"
+)
+
+INSERT_VACANCY = "INSERT INTO UnitVacancy (unit_number, vacant_since) VALUES (%s, %s)"
+
+# A unit already listed as vacant keeps its original vacant_since
+APPLY_VACANCY = f"{INSERT_VACANCY} ON DUPLICATE KEY UPDATE vacant_since = vacant_since"
+
+def create_report_tables(connection):
+    cursor = connection.cursor()
+    try:
+        for ddl in ROLLUP_DDL.values():
+            cursor.execute(ddl)
+    finally:
+        cursor.close()
+    # The rollups are maintained from the change log, and the lease end date
+    # index the expiry reports read comes with the schema
+    create_audit_tables(connection)
+    migrate(connection)
+
+def fetch(connection, query, params=None):
+    with get_cursor(connection) as cursor:
+        cursor.execute(query, params)
+        return cursor.fetchall()
+
+def lock_offset(connection):
+    # The consumer offset, locked until the caller's unit of work ends so
+    # catch-ups and rebuilds run one at a time; None before the first rebuild
+    rows = fetch(connection, f"SELECT last_change_id FROM {TABLE_CHANGE_CONSUMER} WHERE consumer = %s FOR UPDATE",
+                 (ROLLUP_CONSUMER,))
+    return rows[0][0] if rows else None
+
+def change_position(connection):
+    # The last committed change_id, read as the unit's first consistent read,
+    # so it and every later read describe the same moment
+    rows = fetch(connection, f"SELECT last_id FROM {TABLE_CHANGE_SEQUENCE} WHERE sequence_id = 1")
+    if not rows:
+        raise RuntimeError(f"{TABLE_CHANGE_SEQUENCE} is not set up; run `python audit.py setup`")
+    return rows[0][0]
+
+def rebuild_rollups(connection=None):
+    # Recomputes every rollup from the base tables and moves the offset to the
+    # change log position they reflect. Units that stay vacant keep their
+    # vacant_since; units found vacant without one are stamped now.
+    now = datetime.now().replace(microsecond=0)
+    with unit_of_work(connection):
+        lock_offset(connection)
+        position = change_position(connection)
+        occupancy = fetch(connection, f"""
+            SELECT floor_number, bedrooms, COUNT(*),
+                   SUM(CASE WHEN occupancy_status = %s THEN 1 ELSE 0 END),
+                   SUM(CASE WHEN occupancy_status = %s THEN 1 ELSE 0 END)
+            FROM {TABLE_APARTMENT_UNIT}
+            GROUP BY floor_number, bedrooms""", (OCCUPIED_STATUS, VACANT_STATUS))
+        expiry = fetch(connection, f"""
+            SELECT SUBSTR(lease_end_date, 1, 7), COUNT(*)
+            FROM {TABLE_TENANT_OWNER}
+            WHERE lease_end_date IS NOT NULL
+            GROUP BY SUBSTR(lease_end_date, 1, 7)""")
+        vacant = fetch(connection, f"SELECT unit_number FROM {TABLE_APARTMENT_UNIT} WHERE occupancy_status = %s",
+                       (VACANT_STATUS,))
+        since = dict(fetch(connection, "SELECT unit_number, vacant_since FROM UnitVacancy"))
+        execute_query(connection, "DELETE FROM OccupancyRollup")
+        execute_query(connection, "DELETE FROM LeaseExpiryRollup")
+        execute_query(connection, "DELETE FROM UnitVacancy")
+        if occupancy:
+            execute_many(connection, INSERT_OCCUPANCY, [tuple(row) + (now,) for row in occupancy])
+        if expiry:
+            execute_many(connection, INSERT_LEASE_EXPIRY, [tuple(row) + (now,) for row in expiry])
+        if vacant:
+            execute_many(connection, INSERT_VACANCY, [(unit, since.get(unit, now)) for (unit,) in vacant])
+        commit_offset(connection, ROLLUP_CONSUMER, position)
+
+def collect_deltas(changes):
+    # Folds changes, in change_id order, into count deltas per occupancy cell
+    # and expiry month, plus {unit_number: [was let, vacant since]}. Each
+    # before image is taken out of its cell and each after image put in.
+    occupancy, expiry, vacancy = {}, {}, {}
+    for change in changes:
+        before, after = change["before"], change["after"]
+        if change["table"] == TABLE_TENANT_OWNER:
+            for row, sign in ((before, -1), (after, 1)):
+                if row is not None and row.get("lease_end_date"):
+                    month = str(row["lease_end_date"])[:7]
+                    expiry[month] = expiry.get(month, 0) + sign
+            continue
+        for row, sign in ((before, -1), (after, 1)):
+            if row is not None:
+                cell = occupancy.setdefault((int(row["floor_number"]), int(row["bedrooms"])), [0, 0, 0])
+                cell[0] += sign
+                cell[1] += sign if row["occupancy_status"] == OCCUPIED_STATUS else 0
+                cell[2] += sign if row["occupancy_status"] == VACANT_STATUS else 0
+        was_vacant = before is not None and before["occupancy_status"] == VACANT_STATUS
+        is_vacant = after is not None and after["occupancy_status"] == VACANT_STATUS
+        same_unit = was_vacant and is_vacant and int(before["unit_number"]) == int(after["unit_number"])
+        if was_vacant and not same_unit:
+            vacancy[int(before["unit_number"])] = [True, None]
+        if is_vacant and not same_unit:
+            vacancy.setdefault(int(after["unit_number"]), [False, None])[1] = change["changed_at"]
+    return occupancy, expiry, vacancy
+
+def apply_deltas(connection, occupancy, expiry, vacancy, now):
+    for (floor_number, bedrooms), counts in sorted(occupancy.items()):
+        if any(counts):
+            execute_query(connection, APPLY_OCCUPANCY, (floor_number, bedrooms, *counts, now))
+    for month, leases in sorted(expiry.items()):
+        if leases:
+            execute_query(connection, APPLY_LEASE_EXPIRY, (month, leases, now))
+    # Cells whose last unit or lease went away
+    if occupancy:
+        execute_query(connection, "DELETE FROM OccupancyRollup WHERE total_units <= 0")
+    if expiry:
+        execute_query(connection, "DELETE FROM LeaseExpiryRollup WHERE leases <= 0")
+    for unit_number, (let, vacant_since) in sorted(vacancy.items()):
+        if let:
+            execute_query(connection, "DELETE FROM UnitVacancy WHERE unit_number = %s", (unit_number,))
+        if vacant_since is not None:
+            execute_query(connection, APPLY_VACANCY, (unit_number, vacant_since))
+
+def catch_up(connection=None):
+    # Applies the ApartmentUnit and TenantOwner changes logged since the
+    # offset, in one transaction with the offset itself; returns how many were
+    # applied, or None if the rollups were never built (see rebuild_rollups).
+    # Reads past the offset use idx_changelog_table, so this costs the writes
+    # since the last call, not the size of the base tables.
+    now = datetime.now().replace(microsecond=0)
+    with unit_of_work(connection):
+        offset = lock_offset(connection)
+        if offset is None:
+            return None
+        position = change_position(connection)
+        changes = sorted(itertools.chain.from_iterable(tail(connection, offset, table_name)
+                                                       for table_name in SOURCE_TABLES),
+                         key=lambda change: change["change_id"])
+        apply_deltas(connection, *collect_deltas(changes), now)
+        if position > offset:
+            commit_offset(connection, ROLLUP_CONSUMER, position)
+    return len(changes)
+
+def occupancy_by(connection, column):
+    # column is floor_number or bedrooms; reads a few rollup rows, not ApartmentUnit
+    rows = fetch(connection, f"""
+        SELECT {column}, SUM(total_units), SUM(occupied_units), SUM(vacant_units)
+        FROM OccupancyRollup GROUP BY {column} ORDER BY {column}""")
+    return [
+        {column: key, "total": int(total), "occupied": int(occupied), "vacant": int(vacant),
+         "occupancy_rate": round(int(occupied) / int(total), 3) if total else 0.0}
+        for key, total, occupied, vacant in rows
+    ]
+
+def lease_expirations_by_month(connection, months=12):
+    start = date.today().strftime("%Y-%m")
+    rows = fetch(connection, "SELECT expiry_month, leases FROM LeaseExpiryRollup WHERE expiry_month >= %s "
+                             "ORDER BY expiry_month LIMIT %s", (start, months))
+    return [{"month": month, "leases": leases} for month, leases in rows]
+
+def expiring_leases(connection, days=60):
+    today = date.today()
+    return iter_table_rows(connection, TABLE_TENANT_OWNER, "lease_end_date BETWEEN %s AND %s",
+                           (today, today + timedelta(days=days)))
+
+def vacancy_durations(connection):
+    now = datetime.now()
+    rows = fetch(connection, "SELECT unit_number, vacant_since FROM UnitVacancy ORDER BY vacant_since")
+    return [{"unit_number": unit, "vacant_since": since, "days_vacant": (now - since).days}
+            for unit, since in rows]
+
+def print_rows(rows):
+    found = False
+    for row in rows:
+        print(row)
+        found = True
+    if not found:
+        print("No data found.")
+
+def main():
+    parser = argparse.ArgumentParser(description="Occupancy and lease reports backed by rollup tables.")
+    parser.add_argument("report", choices=("setup", "refresh", "occupancy-floor", "occupancy-bedrooms",
+                                           "expirations", "expiring", "vacancies"))
+    parser.add_argument("--days", type=int, default=60, help="window for the expiring report")
+    parser.add_argument("--months", type=int, default=12, help="months shown by the expirations report")
+    args = parser.parse_args()
+
+    pool = get_pool()
+    try:
+        if args.report == "setup":
+            with connect_to_database(pool) as connection:
+                if connection:
+                    create_report_tables(connection)
+                    rebuild_rollups(connection)
+            return
+        if args.report == "refresh":
+            rebuild_rollups(pool)
+            print("Rebuilt the rollups from the base tables.")
+            return
+        if args.report == "expiring":
+            print_rows(expiring_leases(pool, args.days))
+            return
+        if catch_up(pool) is None:
+            logging.error("The rollups have not been built; run `python reports.py setup` first.")
+            raise SystemExit(1)
+        if args.report == "occupancy-floor":
+            print_rows(occupancy_by(pool, "floor_number"))
+        elif args.report == "occupancy-bedrooms":
+            print_rows(occupancy_by(pool, "bedrooms"))
+        elif args.report == "expirations":
+            print_rows(lease_expirations_by_month(pool, args.months))
+        else:
+            print_rows(vacancy_durations(pool))
+    except (mysql.connector.Error, RuntimeError) as e:
+        logging.error(e)
+        raise SystemExit(1)
+
+if __name__ == "__main__":
+    main()
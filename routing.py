@@ -0,0 +1,295 @@
+# Building-to-shard routing with read replicas.
+#
+# Every building maps to a shard: one primary database and any number of
+# replicas. Writes and read-your-writes reads go to the primary, other reads
+# rotate over the replicas, and whole-portfolio searches fan out to every
+# shard in parallel while table views stream each shard a page at a time;
+# both are merged here. The router hands out ConnectionPools,
+# so every data-access function works on a shard unchanged:
+#
+#     router = ShardRouter.from_file("shards.json")
+#     find_apartments(router.reader("riverside"), {"bedrooms": 2})
+#     insert_record(router.writer("riverside"), TABLE_PARKING, values)
+#
+# To try it against several local MySQL instances (see shards.example.json):
+#
+#     docker run -d -p 3307:3306 -e MYSQL_ROOT_PASSWORD=secret -e MYSQL_DATABASE=Apartment mysql:8
+#     docker run -d -p 3308:3306 -e MYSQL_ROOT_PASSWORD=secret -e MYSQL_DATABASE=Apartment mysql:8
+#     python routing.py --config shards.example.json setup
+#     python routing.py --config shards.example.json check
+import argparse
+import heapq
+import itertools
+import json
+import logging
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import mysql.connector
+
+from apartment import (
+    DB_CONFIG,
+    POOL_SIZE,
+    PRIMARY_KEYS,
+    TABLE_APARTMENT_UNIT,
+    ConnectionPool,
+    commit_listeners,
+    connect_to_database,
+    current_unit_of_work,
+    find_apartments,
+    get_table_columns,
+    iter_table_pages,
+    pool_of,
+)
+from export import parse_search_criteria
+
+SHARDS_CONFIG = os.environ.get("APARTMENT_SHARDS_CONFIG", "shards.json")
+
+# After a thread's write to a shard commits, its reads from that shard go to
+# the primary for this long, so it never reads around its own write through
+# a lagging replica
+READ_YOUR_WRITES_WINDOW = float(os.environ.get("APARTMENT_READ_YOUR_WRITES", "2"))
+
+# A replica that failed to connect is skipped for this long
+REPLICA_RETRY_AFTER = float(os.environ.get("APARTMENT_REPLICA_RETRY_AFTER", "30"))
+
+class Shard:
+    def __init__(self, name, primary, replicas=(), pool_size=POOL_SIZE):
+        # Credentials missing from an endpoint come from DB_CONFIG. Each copy
+        # caches reads under its own scope: a page cached from a lagging
+        # replica must never answer a read that was sent to the primary.
+        self.name = name
+        self.primary = ConnectionPool(pool_size, scope=name, **{**DB_CONFIG, **primary})
+        self.replicas = [ConnectionPool(pool_size, scope=f"{name}/replica{index}", **{**DB_CONFIG, **replica})
+                         for index, replica in enumerate(replicas)]
+        self._rotation = itertools.cycle(self.replicas)
+        self._down_until = {}
+        self._lock = threading.Lock()
+
+    def replica(self):
+        # Next healthy replica in rotation, or None if there is none
+        now = time.monotonic()
+        with self._lock:
+            for _ in range(len(self.replicas)):
+                pool = next(self._rotation)
+                if self._down_until.get(pool, 0) <= now:
+                    return pool
+        return None
+
+    def mark_down(self, pool):
+        with self._lock:
+            self._down_until[pool] = time.monotonic() + REPLICA_RETRY_AFTER
+        logging.warning(f"Replica {pool.scope} of shard {self.name} is unavailable; using other copies")
+
+    def pools(self):
+        return [self.primary] + self.replicas
+
+    def close(self):
+        for pool in self.pools():
+            pool.close()
+
+class ShardRouter:
+    def __init__(self, shards, buildings, default=None):
+        self.shards = shards
+        self.buildings = buildings
+        self.default = default
+        self._primaries = {shard.primary: shard for shard in shards.values()}
+        self._last_write = threading.local()
+        commit_listeners.append(self._committed)
+
+    @classmethod
+    def from_config(cls, config):
+        pool_size = config.get("pool_size", POOL_SIZE)
+        shards = {name: Shard(name, spec["primary"], spec.get("replicas", ()), pool_size)
+                  for name, spec in config["shards"].items()}
+        buildings = config.get("buildings", {})
+        unknown = set(buildings.values()) - set(shards)
+        if unknown:
+            raise ValueError(f"Buildings map to unknown shards: {', '.join(sorted(unknown))}")
+        return cls(shards, buildings, config.get("default"))
+
+    @classmethod
+    def from_file(cls, path=SHARDS_CONFIG):
+        with open(path, encoding="utf-8") as source:
+            return cls.from_config(json.load(source))
+
+    def shard(self, building=None):
+        name = self.buildings.get(building, self.default) if building is not None else self.default
+        if name is None:
+            raise ValueError(f"No shard for building {building!r}")
+        return self.shards[name]
+
+    def writer(self, building=None):
+        return self.shard(building).primary
+
+    def _committed(self, connection):
+        # Each commit on a shard primary (re)starts the committing thread's
+        # read-your-writes window there; until then its writes are invisible
+        # to other connections, primary or replica alike
+        shard = self._primaries.get(pool_of(connection))
+        if shard is None:
+            return
+        if not hasattr(self._last_write, "times"):
+            self._last_write.times = {}
+        self._last_write.times[shard.name] = time.monotonic()
+
+    def reader(self, building=None, consistent=False):
+        # A replica unless the caller asks for consistency, this thread committed
+        # a write to the shard within READ_YOUR_WRITES_WINDOW, or a unit of work is open on
+        # the primary (its uncommitted writes are only visible there)
+        shard = self.shard(building)
+        unit = current_unit_of_work()
+        if unit is not None and pool_of(unit.connection) is shard.primary:
+            return shard.primary
+        written = getattr(self._last_write, "times", {}).get(shard.name)
+        if consistent or (written is not None and time.monotonic() - written < READ_YOUR_WRITES_WINDOW):
+            return shard.primary
+        return shard.replica() or shard.primary
+
+    def read(self, building, func, *args, consistent=False, pool=None):
+        # Runs func(pool, *args) on pool, or on a reader chosen here, moving to
+        # the next copy of the shard if a replica cannot be reached
+        shard = self.shard(building)
+        pool = pool or self.reader(building, consistent)
+        while True:
+            try:
+                return func(pool, *args)
+            except mysql.connector.Error:
+                if pool is shard.primary:
+                    raise
+                shard.mark_down(pool)
+            # The first pick was a replica, so nothing pins this read to the primary
+            pool = shard.replica() or shard.primary
+
+    def fan_out(self, func, *args, consistent=False):
+        # Runs func(pool, *args) on every shard at once; returns {shard name: result}.
+        # func must materialize its result (a list, not a generator) on the worker thread.
+        # Readers are chosen here: the read-your-writes window and the unit of
+        # work are per thread, so the workers would not see the caller's. A
+        # shard whose primary holds the caller's unit is read on this thread,
+        # through the unit's connection, and its uncommitted writes.
+        names = sorted(self.shards)
+        unit = current_unit_of_work()
+        chosen = {}
+        for name in names:
+            building = self._building_for(name)
+            chosen[name] = (building, self.reader(building, consistent))
+        with ThreadPoolExecutor(max_workers=len(names), thread_name_prefix="apartment-shard") as executor:
+            futures = {name: executor.submit(self.read, building, func, *args, pool=pool)
+                       for name, (building, pool) in chosen.items()
+                       if unit is None or pool_of(unit.connection) is not pool}
+            results = {name: self.read(building, func, *args, pool=pool)
+                       for name, (building, pool) in chosen.items() if name not in futures}
+            results.update((name, future.result()) for name, future in futures.items())
+        return {name: results[name] for name in names}
+
+    def _building_for(self, shard_name):
+        for building, name in self.buildings.items():
+            if name == shard_name:
+                return building
+        if shard_name == self.default:
+            return None
+        raise ValueError(f"Shard {shard_name} has no building")
+
+    def search_all(self, filters=None, order_by=None, descending=False, limit=None):
+        # Each shard returns its own top rows in the requested order and the
+        # sorted streams are merged, so no shard ever sends more than limit rows.
+        # Yields (shard name, row).
+        def search(pool):
+            return list(find_apartments(pool, filters, order_by, descending, limit))
+        results = self.fan_out(search)
+        columns = self.columns(TABLE_APARTMENT_UNIT)
+        sort_columns = [order_by, PRIMARY_KEYS[TABLE_APARTMENT_UNIT]] if order_by else [PRIMARY_KEYS[TABLE_APARTMENT_UNIT]]
+        indexes = [columns.index(column) for column in sort_columns]
+        def sort_key(item):
+            return tuple(item[1][index] for index in indexes)
+        streams = [[(name, row) for row in rows] for name, rows in results.items()]
+        merged = heapq.merge(*streams, key=sort_key, reverse=descending)
+        return itertools.islice(merged, limit)
+
+    def _stream_rows(self, shard_name, table_name, index, consistent=False):
+        # One shard's rows in primary key order, a page at a time. A replica
+        # that fails mid-stream is marked down and the read resumes past the
+        # last row on the next copy of the shard.
+        building = self._building_for(shard_name)
+        shard = self.shards[shard_name]
+        after = None
+        while True:
+            pool = self.reader(building, consistent)
+            try:
+                for page in iter_table_pages(pool, table_name, after=after, cached_pages=0):
+                    for row in page:
+                        yield shard_name, row
+                    after = (page[-1][index],)
+                return
+            except mysql.connector.Error:
+                if pool is shard.primary:
+                    raise
+                shard.mark_down(pool)
+
+    def view_all(self, table_name, consistent=False):
+        # Every shard's rows in primary key order, tagged with their shard.
+        # The shards are merged lazily, so at most one page per shard is held.
+        index = self.columns(table_name).index(PRIMARY_KEYS[table_name])
+        streams = [self._stream_rows(name, table_name, index, consistent) for name in sorted(self.shards)]
+        return heapq.merge(*streams, key=lambda item: item[1][index])
+
+    def columns(self, table_name):
+        return self.read(self._building_for(sorted(self.shards)[0]), get_table_columns, table_name)
+
+    def check(self):
+        # {pool scope and host: True/False} for every endpoint
+        status = {}
+        for shard in self.shards.values():
+            for role, pool in [("primary", shard.primary)] + [("replica", replica) for replica in shard.replicas]:
+                with connect_to_database(pool) as connection:
+                    status[f"{shard.name} {role} {pool.config.get('host')}:{pool.config.get('port')}"] = connection is not None
+        return status
+
+    def close(self):
+        for shard in self.shards.values():
+            shard.close()
+
+def main():
+    parser = argparse.ArgumentParser(description="Query every building's shard.")
+    parser.add_argument("--config", default=SHARDS_CONFIG)
+    commands = parser.add_subparsers(dest="command", required=True)
+    commands.add_parser("check", help="try to connect to every primary and replica")
+    commands.add_parser("setup", help="apply the schema migrations on every primary")
+    view = commands.add_parser("view", help="print a table from all shards")
+    view.add_argument("table", choices=sorted(PRIMARY_KEYS))
+    search = commands.add_parser("search", help="search apartments across all shards")
+    search.add_argument("--filter", action="append", default=[], metavar="COLUMN=VALUE")
+    search.add_argument("--order-by")
+    search.add_argument("--descending", action="store_true")
+    search.add_argument("--limit", type=int)
+    args = parser.parse_args()
+
+    router = ShardRouter.from_file(args.config)
+    try:
+        if args.command == "check":
+            for endpoint, healthy in router.check().items():
+                print(f"{endpoint}: {'ok' if healthy else 'unreachable'}")
+        elif args.command == "setup":
+            from schema import migrate
+            for shard in router.shards.values():
+                with connect_to_database(shard.primary) as connection:
+                    if connection:
+                        migrate(connection)
+        elif args.command == "view":
+            for name, row in router.view_all(args.table):
+                print(name, row)
+        else:
+            criteria = parse_search_criteria(args.filter)
+            for name, row in router.search_all(criteria, args.order_by, args.descending, args.limit):
+                print(name, row)
+    except mysql.connector.Error as e:
+        logging.error(e)
+        raise SystemExit(1)
+    finally:
+        router.close()
+
+if __name__ == "__main__":
+    main()
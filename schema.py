@@ -0,0 +1,340 @@
+import argparse
+import logging
+from collections import namedtuple
+from datetime import datetime
+
+TABLE_SCHEMA_VERSION = "SchemaVersion"
+
+# Table definitions the application code assumes
+TABLE_DDL = {
+    "ApartmentUnit": """
+        CREATE TABLE IF NOT EXISTS ApartmentUnit (
+            unit_number INT PRIMARY KEY,
+            floor_number INT NOT NULL,
+            bedrooms INT NOT NULL,
+            bathrooms INT NOT NULL,
+            square_footage INT NOT NULL,
+            rent_ownership_details VARCHAR(255),
+            occupancy_status VARCHAR(32) NOT NULL
+        )""",
+    "TenantOwner": """
+        CREATE TABLE IF NOT EXISTS TenantOwner (
+            tenant_id INT AUTO_INCREMENT PRIMARY KEY,
+            name VARCHAR(255) NOT NULL,
+            contact_info VARCHAR(32),
+            lease_start_date DATE,
+            lease_end_date DATE,
+            emergency_contact VARCHAR(255),
+            rent_payment_history VARCHAR(255)
+        )""",
+    "Parking": """
+        CREATE TABLE IF NOT EXISTS Parking (
+            parking_id INT AUTO_INCREMENT PRIMARY KEY,
+            parking_space_number INT NOT NULL,
+            vehicle_details VARCHAR(255),
+            availability_status VARCHAR(32) NOT NULL
+        )""",
+}
+
+# Column order of each table as created above
+TABLE_COLUMNS = {
+    "ApartmentUnit": ("unit_number", "floor_number", "bedrooms", "bathrooms", "square_footage",
+                      "rent_ownership_details", "occupancy_status"),
+    "TenantOwner": ("tenant_id", "name", "contact_info", "lease_start_date", "lease_end_date",
+                    "emergency_contact", "rent_payment_history"),
+    "Parking": ("parking_id", "parking_space_number", "vehicle_details", "availability_status"),
+}
+
+# Rows are decoded into these on fetch. They are tuples with empty __slots__:
+# no per-row dict, the same size as a plain tuple, and still indexable by
+# position, but fields read as row.bedrooms.
+ApartmentUnitRow = namedtuple("ApartmentUnitRow", TABLE_COLUMNS["ApartmentUnit"])
+TenantOwnerRow = namedtuple("TenantOwnerRow", TABLE_COLUMNS["TenantOwner"])
+ParkingRow = namedtuple("ParkingRow", TABLE_COLUMNS["Parking"])
+
+ROW_TYPES = {
+    "ApartmentUnit": ApartmentUnitRow,
+    "TenantOwner": TenantOwnerRow,
+    "Parking": ParkingRow,
+}
+
+def row_type(table_name, column_names):
+    # The row type for a result with these columns, or None when the result
+    # does not have exactly the table's columns (a projection, or a table that
+    # has drifted from TABLE_COLUMNS)
+    row_class = ROW_TYPES.get(table_name)
+    if row_class is None or tuple(column_names) != row_class._fields:
+        return None
+    return row_class
+
+def is_valid_date(value):
+    try:
+        datetime.strptime(value, '%Y-%m-%d')
+        return True
+    except ValueError:
+        return False
+
+def is_positive_integer(value):
+    # Matches chk_unit_sizes, which rejects a square footage of 0
+    return value.isdecimal() and int(value) > 0
+
+# Columns a user fills in: (column, label, validator, error message).
+# Auto-increment keys are assigned by the database and left out.
+FIELDS = {
+    "ApartmentUnit": [
+        ("unit_number", "unit number", str.isdigit, "Invalid unit number."),
+        ("floor_number", "floor number", str.isdigit, "Invalid floor number."),
+        ("bedrooms", "number of bedrooms", str.isdigit, "Invalid number."),
+        ("bathrooms", "number of bathrooms", str.isdigit, "Invalid number."),
+        ("square_footage", "square footage", is_positive_integer, "Square footage must be a positive number."),
+        ("rent_ownership_details", "rent/ownership details", str.isalnum, "Invalid details."),
+        ("occupancy_status", "occupancy status", str.isalnum, "Invalid status."),
+    ],
+    "TenantOwner": [
+        ("name", "tenant name", str.isalnum, "Invalid name."),
+        ("contact_info", "contact information", str.isdigit, "Invalid contact info."),
+        ("lease_start_date", "lease start date (YYYY-MM-DD)", is_valid_date, "Invalid date format."),
+        ("lease_end_date", "lease end date (YYYY-MM-DD)", is_valid_date, "Invalid date format."),
+        ("emergency_contact", "emergency contact", str.isalnum, "Invalid contact."),
+        ("rent_payment_history", "rent/payment history", str.isalnum, "Invalid history."),
+    ],
+    "Parking": [
+        ("parking_space_number", "parking space number", str.isdigit, "Invalid number."),
+        ("vehicle_details", "vehicle details", str.isalnum, "Invalid details."),
+        ("availability_status", "availability status", str.isalnum, "Invalid status."),
+    ],
+}
+
+# Composite indexes backing the common find_apartments() filter shapes.
+# Leading columns are the equality filters, trailing columns the ranges.
+SEARCH_INDEXES = {
+    "idx_unit_status_bedrooms_floor": ("occupancy_status", "bedrooms", "floor_number"),
+    "idx_unit_floor_bedrooms": ("floor_number", "bedrooms"),
+    "idx_unit_bedrooms_bathrooms": ("bedrooms", "bathrooms"),
+    "idx_unit_bathrooms": ("bathrooms",),
+    "idx_unit_square_footage": ("square_footage",),
+}
+
+# Representative searches that must never fall back to a full table scan
+COMMON_SEARCHES = [
+    {"occupancy_status": "Vacant", "bedrooms": (2, None), "floor_number": (3, 8)},
+    {"occupancy_status": ["Vacant", "Reserved"]},
+    {"floor_number": (3, 8)},
+    {"floor_number": 3, "bedrooms": 2},
+    {"bedrooms": (2, None), "bathrooms": 2},
+    {"bathrooms": 2},
+    {"square_footage": (900, None)},
+]
+
+# Orderings the API and CLI send with those searches, as (order_by, descending);
+# None is primary key order
+SEARCH_ORDERINGS = [(None, False), ("square_footage", True)]
+
+# Single-column and covering indexes for the other hot lookups: free parking
+# spaces in space order, and leases by end date for the expiry reports
+LOOKUP_INDEXES = {
+    "Parking": {"idx_parking_status_space": ("availability_status", "parking_space_number")},
+    "TenantOwner": {"idx_tenant_lease_end": ("lease_end_date",)},
+}
+
+# Key and value constraints: (table, constraint name, definition)
+CONSTRAINTS = [
+    ("Parking", "uq_parking_space", "UNIQUE (parking_space_number)"),
+    ("ApartmentUnit", "chk_unit_sizes",
+     "CHECK (floor_number >= 0 AND bedrooms >= 0 AND bathrooms >= 0 AND square_footage > 0)"),
+    ("TenantOwner", "chk_lease_dates",
+     "CHECK (lease_start_date IS NULL OR lease_end_date IS NULL OR lease_end_date >= lease_start_date)"),
+]
+
+def create_tables(connection):
+    cursor = connection.cursor()
+    try:
+        for ddl in TABLE_DDL.values():
+            cursor.execute(ddl)
+    finally:
+        cursor.close()
+
+def existing_indexes(connection, table_name):
+    cursor = connection.cursor()
+    try:
+        cursor.execute(
+            "SELECT DISTINCT index_name FROM information_schema.statistics "
+            "WHERE table_schema = DATABASE() AND table_name = %s",
+            (table_name,),
+        )
+        return {name for (name,) in cursor.fetchall()}
+    finally:
+        cursor.close()
+
+def create_indexes(connection, table_name, indexes):
+    present = existing_indexes(connection, table_name)
+    created = []
+    cursor = connection.cursor()
+    try:
+        for name, columns in indexes.items():
+            if name in present:
+                continue
+            cursor.execute(f"CREATE INDEX {name} ON {table_name} ({', '.join(columns)})")
+            created.append(name)
+            logging.info(f"Created index {name} on {table_name}")
+    finally:
+        cursor.close()
+    return created
+
+def apply_search_indexes(connection):
+    from apartment import TABLE_APARTMENT_UNIT
+    return create_indexes(connection, TABLE_APARTMENT_UNIT, SEARCH_INDEXES)
+
+def explain_search(connection, filters, order_by=None, descending=False, next_page=False):
+    # Plans the statement find_apartments() really runs: the first page, or
+    # with next_page=True the keyset page that follows it, ORDER BY and LIMIT included
+    from apartment import DEFAULT_PAGE_SIZE, PRIMARY_KEYS, TABLE_APARTMENT_UNIT, build_search_filter, page_statement
+    if order_by == PRIMARY_KEYS[TABLE_APARTMENT_UNIT]:
+        order_by = None
+    where, params = build_search_filter(filters)
+    query = page_statement(TABLE_APARTMENT_UNIT, where, order_by, descending, next_page, False)
+    if next_page:
+        params += (0,) if order_by is None else (0, 0, 0)
+    cursor = connection.cursor(dictionary=True)
+    try:
+        cursor.execute(f"EXPLAIN {query}", params + (DEFAULT_PAGE_SIZE,))
+        return cursor.fetchall()
+    finally:
+        cursor.close()
+
+def check_search_plans(connection, searches=COMMON_SEARCHES, orderings=SEARCH_ORDERINGS):
+    # Access type ALL is a full table scan, and so is index: it reads the whole
+    # index (for InnoDB's PRIMARY, the whole table) in order to skip a sort.
+    # Returns the (filters, order_by, descending) combinations that scan.
+    full_scans = []
+    for filters in searches:
+        for order_by, descending in orderings:
+            for next_page in (False, True):
+                search = f"{filters} ordered by {order_by or 'primary key'}{' descending' if descending else ''}"
+                page = "next pages" if next_page else "first page"
+                for step in explain_search(connection, filters, order_by, descending, next_page):
+                    if step["type"] in ("ALL", "index"):
+                        if (filters, order_by, descending) not in full_scans:
+                            full_scans.append((filters, order_by, descending))
+                        logging.warning(f"Search {search} ({page}) falls back to a full "
+                                        f"{'table' if step['type'] == 'ALL' else 'index'} scan")
+                    else:
+                        logging.info(f"Search {search} ({page}) uses index {step['key']} ({step['type']}"
+                                     f"{', ' + step['Extra'] if step['Extra'] else ''})")
+    return full_scans
+
+def existing_constraints(connection, table_name):
+    cursor = connection.cursor()
+    try:
+        cursor.execute(
+            "SELECT constraint_name FROM information_schema.table_constraints "
+            "WHERE table_schema = DATABASE() AND table_name = %s",
+            (table_name,),
+        )
+        return {name for (name,) in cursor.fetchall()}
+    finally:
+        cursor.close()
+
+def add_constraints(connection, constraints=CONSTRAINTS):
+    cursor = connection.cursor()
+    try:
+        for table_name, name, definition in constraints:
+            if name in existing_constraints(connection, table_name):
+                continue
+            cursor.execute(f"ALTER TABLE {table_name} ADD CONSTRAINT {name} {definition}")
+            logging.info(f"Added constraint {name} to {table_name}")
+    finally:
+        cursor.close()
+
+def drop_index(connection, table_name, name):
+    if name not in existing_indexes(connection, table_name):
+        return
+    cursor = connection.cursor()
+    try:
+        cursor.execute(f"DROP INDEX {name} ON {table_name}")
+        logging.info(f"Dropped index {name} on {table_name}")
+    finally:
+        cursor.close()
+
+def create_lookup_indexes(connection):
+    for table_name, indexes in LOOKUP_INDEXES.items():
+        create_indexes(connection, table_name, indexes)
+
+def add_key_constraints(connection):
+    add_constraints(connection)
+    # Older parking setups created a plain index that uq_parking_space now covers
+    drop_index(connection, "Parking", "idx_parking_space")
+
+# Schema changes in the order they apply. Each step is idempotent, because
+# MySQL commits DDL as it runs: a migration that fails halfway is simply run
+# again, and only a completed one is recorded in SchemaVersion.
+MIGRATIONS = [
+    (1, "Create ApartmentUnit, TenantOwner and Parking", create_tables),
+    (2, "Add apartment search indexes", apply_search_indexes),
+    (3, "Add parking and lease lookup indexes", create_lookup_indexes),
+    (4, "Add key and value constraints", add_key_constraints),
+]
+
+SCHEMA_VERSION_DDL = f"""
+    CREATE TABLE IF NOT EXISTS {TABLE_SCHEMA_VERSION} (
+        version INT PRIMARY KEY,
+        description VARCHAR(255) NOT NULL,
+        applied_at DATETIME NOT NULL
+    )"""
+
+def applied_versions(connection):
+    cursor = connection.cursor()
+    try:
+        cursor.execute(SCHEMA_VERSION_DDL)
+        cursor.execute(f"SELECT version FROM {TABLE_SCHEMA_VERSION}")
+        return {version for (version,) in cursor.fetchall()}
+    finally:
+        cursor.close()
+
+def schema_version(connection):
+    return max(applied_versions(connection), default=0)
+
+def migrate(connection, target=None):
+    # Applies every migration not yet recorded, up to target; returns the
+    # versions applied
+    done = applied_versions(connection)
+    applied = []
+    for version, description, apply in MIGRATIONS:
+        if version in done or (target is not None and version > target):
+            continue
+        logging.info(f"Applying schema migration {version}: {description}")
+        apply(connection)
+        cursor = connection.cursor()
+        try:
+            cursor.execute(f"INSERT INTO {TABLE_SCHEMA_VERSION} (version, description, applied_at) VALUES (%s, %s, %s)",
+                           (version, description, datetime.now().replace(microsecond=0)))
+            connection.commit()
+        finally:
+            cursor.close()
+        applied.append(version)
+    return applied
+
+def main():
+    parser = argparse.ArgumentParser(description="Create and migrate the database schema.")
+    parser.add_argument("command", nargs="?", default="migrate", choices=["migrate", "status", "check"],
+                        help="migrate (default) applies pending migrations and checks the search plans")
+    parser.add_argument("--target", type=int, help="stop after this schema version")
+    args = parser.parse_args()
+
+    from apartment import connect_to_database
+    with connect_to_database() as connection:
+        if not connection:
+            return
+        if args.command == "status":
+            done = applied_versions(connection)
+            for version, description, _ in MIGRATIONS:
+                print(f"{version} {'applied' if version in done else 'pending'}  {description}")
+            return
+        if args.command == "migrate":
+            applied = migrate(connection, args.target)
+            print(f"Schema at version {schema_version(connection)}; applied: {', '.join(map(str, applied)) or 'nothing'}")
+        if check_search_plans(connection):
+            raise SystemExit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,552 @@
+# Local read-only snapshot of ApartmentUnit, TenantOwner and Parking.
+#
+# `python snapshot.py build` dumps the three tables into one file; later builds
+# replay only the ChangeLog entries (see audit.py) written since the previous
+# one, so they need APARTMENT_AUDIT=1 on every writer. A build falls back to a
+# full dump when the change log is not set up, when the replayed row counts
+# disagree with the database (some writer is not logging), and once the last
+# full dump is SNAPSHOT_FULL_EVERY old, which bounds what a count cannot catch.
+# Use --full to rebuild from scratch. Reads memory-map the file and answer lookups and apartment
+# searches from prebuilt column indexes without touching the database, which
+# is also how main() keeps regular-user browsing working while it is down.
+#
+# Layout: magic, header length, JSON header, then 8-byte aligned sections
+# whose [offset, length] pairs (relative to the first section) the header
+# lists. Per table: rows as compact JSON arrays in primary key order, the
+# uint64 start of each row plus the end of the last, the int64 primary keys,
+# and one index per searchable column.
+import argparse
+import bisect
+import json
+import logging
+import mmap
+import os
+import struct
+from array import array
+from datetime import date, datetime
+from itertools import islice
+
+import mysql.connector
+
+from apartment import (
+    PRIMARY_KEYS,
+    SEARCH_COLUMNS,
+    TABLE_APARTMENT_UNIT,
+    TABLE_CHANGE_SEQUENCE,
+    TABLE_PARKING,
+    TABLE_TENANT_OWNER,
+    connect_to_database,
+    display_menu,
+    get_pool,
+    prompt_search_criteria,
+    show_rows,
+)
+from audit import tail
+from schema import FIELDS, ROW_TYPES, is_valid_date
+
+SNAPSHOT_PATH = os.environ.get("APARTMENT_SNAPSHOT_PATH", "apartment.snapshot")
+
+# Seconds between full dumps, however many incremental builds come between
+SNAPSHOT_FULL_EVERY = float(os.environ.get("APARTMENT_SNAPSHOT_FULL_EVERY", "86400"))
+
+MAGIC = b"APTSNAP1"
+PREFIX = struct.Struct("<8sI")
+
+SNAPSHOT_TABLES = (TABLE_APARTMENT_UNIT, TABLE_TENANT_OWNER, TABLE_PARKING)
+
+# Columns with a prebuilt index; searches may filter and sort on these
+INDEXED_COLUMNS = {TABLE_APARTMENT_UNIT: SEARCH_COLUMNS}
+
+# Dates are stored as ISO strings and turned back into dates on read
+DATE_COLUMNS = {table_name: {column for column, _, validator, _ in fields if validator is is_valid_date}
+                for table_name, fields in FIELDS.items()}
+
+# Stands in for NULL in int64 column arrays; never matches a filter
+NULL_INT = -2 ** 63
+
+def align(size):
+    return (size + 7) & ~7
+
+class SectionWriter:
+    def __init__(self):
+        self.body = bytearray()
+
+    def add(self, data):
+        offset = len(self.body)
+        self.body += data
+        self.body += bytes(align(len(self.body)) - len(self.body))
+        return [offset, len(data)]
+
+def build_int_index(sections, values):
+    # The column's values in row order, plus the same values sorted with the
+    # row each came from, for range lookups by bisection
+    column = array("q", (NULL_INT if value is None else value for value in values))
+    present = sorted((value, ordinal) for ordinal, value in enumerate(values) if value is not None)
+    return {
+        "kind": "int",
+        "column": sections.add(column.tobytes()),
+        "sorted": sections.add(array("q", (value for value, _ in present)).tobytes()),
+        "ordinals": sections.add(array("I", (ordinal for _, ordinal in present)).tobytes()),
+    }
+
+def build_code_index(sections, values):
+    # Low-cardinality columns: one code per row, and each code's rows in one run
+    distinct = sorted(set(values), key=lambda value: (value is not None, str(value)))
+    codes = {value: code for code, value in enumerate(distinct)}
+    column = array("I", (codes[value] for value in values))
+    ordinals = array("I", sorted(range(len(column)), key=column.__getitem__))
+    counts = [0] * len(distinct)
+    for code in column:
+        counts[code] += 1
+    postings = []
+    start = 0
+    for count in counts:
+        postings.append([start, count])
+        start += count
+    return {
+        "kind": "code",
+        "values": distinct,
+        "postings": postings,
+        "column": sections.add(column.tobytes()),
+        "ordinals": sections.add(ordinals.tobytes()),
+    }
+
+def encode_table(sections, table_name, columns, rows):
+    # rows are lists in primary key order, with dates already as strings
+    key_index = columns.index(PRIMARY_KEYS[table_name])
+    data = bytearray()
+    offsets = array("Q", [0])
+    for row in rows:
+        data += json.dumps(row, default=str, separators=(",", ":")).encode()
+        offsets.append(len(data))
+    table = {
+        "columns": list(columns),
+        "rows": len(rows),
+        "data": sections.add(data),
+        "offsets": sections.add(offsets.tobytes()),
+        "keys": sections.add(array("q", (row[key_index] for row in rows)).tobytes()),
+        "indexes": {},
+    }
+    for column in INDEXED_COLUMNS.get(table_name, ()):
+        values = [row[columns.index(column)] for row in rows]
+        if all(isinstance(value, int) for value in values if value is not None):
+            table["indexes"][column] = build_int_index(sections, values)
+        else:
+            table["indexes"][column] = build_code_index(sections, values)
+    return table
+
+def write_snapshot(path, tables, change_id, full_at=None):
+    # tables: {table name: (columns, rows)}; full_at is when the rows were last
+    # dumped in full, now if not given. Written to a temporary file and
+    # renamed into place, so readers never see a half-written snapshot.
+    sections = SectionWriter()
+    created_at = datetime.now().isoformat(timespec="seconds")
+    header = {
+        "created_at": created_at,
+        "full_at": full_at or created_at,
+        "change_id": change_id,
+        "tables": {table_name: encode_table(sections, table_name, columns, rows)
+                   for table_name, (columns, rows) in tables.items()},
+    }
+    encoded = json.dumps(header, separators=(",", ":")).encode()
+    start = align(PREFIX.size + len(encoded))
+    temporary = f"{path}.tmp"
+    with open(temporary, "wb") as target:
+        target.write(PREFIX.pack(MAGIC, len(encoded)))
+        target.write(encoded)
+        target.write(bytes(start - PREFIX.size - len(encoded)))
+        target.write(sections.body)
+        target.flush()
+        os.fsync(target.fileno())
+    os.replace(temporary, path)
+
+class IntIndex:
+    def __init__(self, view, meta):
+        self.column = view(meta["column"], "q")
+        self.sorted = view(meta["sorted"], "q")
+        self.ordinals = view(meta["ordinals"], "I")
+
+    def spans(self, value):
+        # [start, stop) runs of self.ordinals whose rows match value
+        if isinstance(value, tuple):
+            low, high = value
+            start = bisect.bisect_left(self.sorted, NULL_INT + 1 if low is None else low)
+            stop = len(self.sorted) if high is None else bisect.bisect_right(self.sorted, high)
+            return [(start, max(start, stop))]
+        if isinstance(value, (list, set, frozenset)):
+            return [span for item in sorted(set(value)) for span in self.spans(item)]
+        return [(bisect.bisect_left(self.sorted, value), bisect.bisect_right(self.sorted, value))]
+
+    def sort_key(self, ordinal):
+        # NULL_INT sorts first, as NULL does in MySQL
+        return self.column[ordinal]
+
+    def matcher(self, value):
+        # A test of one row against value, reading only the column array
+        column = self.column
+        if isinstance(value, tuple):
+            low = NULL_INT + 1 if value[0] is None else value[0]
+            high = value[1]
+            if high is None:
+                return lambda ordinal: column[ordinal] >= low
+            return lambda ordinal: low <= column[ordinal] <= high
+        if isinstance(value, (list, set, frozenset)):
+            wanted = set(value)
+            return lambda ordinal: column[ordinal] in wanted
+        return lambda ordinal: column[ordinal] == value
+
+    def release(self):
+        for view in (self.column, self.sorted, self.ordinals):
+            view.release()
+
+class CodeIndex:
+    def __init__(self, view, meta):
+        self.values = meta["values"]
+        self.postings = meta["postings"]
+        self.column = view(meta["column"], "I")
+        self.ordinals = view(meta["ordinals"], "I")
+
+    def codes(self, value):
+        if isinstance(value, tuple):
+            low, high = value
+            return [code for code, current in enumerate(self.values) if current is not None
+                    and (low is None or current >= low) and (high is None or current <= high)]
+        wanted = value if isinstance(value, (list, set, frozenset)) else (value,)
+        return [code for code, current in enumerate(self.values) if current in wanted]
+
+    def spans(self, value):
+        return [(start, start + count) for start, count in (self.postings[code] for code in self.codes(value))]
+
+    def sort_key(self, ordinal):
+        # Codes follow the order of the values they stand for
+        return self.column[ordinal]
+
+    def matcher(self, value):
+        column = self.column
+        wanted = set(self.codes(value))
+        return lambda ordinal: column[ordinal] in wanted
+
+    def release(self):
+        self.column.release()
+        self.ordinals.release()
+
+class SnapshotTable:
+    def __init__(self, name, meta, view):
+        self.name = name
+        self.columns = tuple(meta["columns"])
+        self.count = meta["rows"]
+        self.data = view(meta["data"])
+        self.offsets = view(meta["offsets"], "Q")
+        self.keys = view(meta["keys"], "q")
+        self.indexes = {column: (IntIndex if index["kind"] == "int" else CodeIndex)(view, index)
+                        for column, index in meta["indexes"].items()}
+        dates = DATE_COLUMNS.get(name, ())
+        self.date_positions = [position for position, column in enumerate(self.columns) if column in dates]
+        row_class = ROW_TYPES.get(name)
+        self.row_class = row_class if row_class is not None and row_class._fields == self.columns else None
+
+    def raw_row(self, ordinal):
+        return json.loads(bytes(self.data[self.offsets[ordinal]:self.offsets[ordinal + 1]]))
+
+    def row(self, ordinal):
+        values = self.raw_row(ordinal)
+        for position in self.date_positions:
+            if values[position] is not None:
+                values[position] = date.fromisoformat(values[position])
+        return self.row_class._make(values) if self.row_class is not None else tuple(values)
+
+    def rows(self, ordinals=None):
+        for ordinal in range(self.count) if ordinals is None else ordinals:
+            yield self.row(ordinal)
+
+    def get(self, key):
+        ordinal = bisect.bisect_left(self.keys, key)
+        if ordinal < self.count and self.keys[ordinal] == key:
+            return self.row(ordinal)
+        return None
+
+    def release(self):
+        for index in self.indexes.values():
+            index.release()
+        for view in (self.data, self.offsets, self.keys):
+            view.release()
+
+class Snapshot:
+    def __init__(self, path=SNAPSHOT_PATH):
+        with open(path, "rb") as source:
+            self._map = mmap.mmap(source.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            magic, length = PREFIX.unpack_from(self._map)
+            if magic != MAGIC:
+                raise ValueError(f"{path} is not an apartment snapshot")
+            header = json.loads(self._map[PREFIX.size:PREFIX.size + length])
+        except (struct.error, ValueError):
+            self._map.close()
+            raise
+        self.path = path
+        self.created_at = header["created_at"]
+        self.full_at = header.get("full_at")
+        self.change_id = header["change_id"]
+        self._buffer = memoryview(self._map)
+        start = align(PREFIX.size + length)
+        def view(section, fmt=None):
+            offset, size = section
+            part = self._buffer[start + offset:start + offset + size]
+            return part.cast(fmt) if fmt else part
+        self.tables = {name: SnapshotTable(name, meta, view) for name, meta in header["tables"].items()}
+
+    def table(self, table_name):
+        if table_name not in self.tables:
+            raise ValueError(f"{table_name} is not in the snapshot.")
+        return self.tables[table_name]
+
+    def rows(self, table_name):
+        return self.table(table_name).rows()
+
+    def get(self, table_name, key):
+        return self.table(table_name).get(key)
+
+    def search(self, filters=None, order_by=None, descending=False, limit=None, offset=0):
+        # Same filters and ordering as find_apartments(). Candidates come from
+        # the most selective filter's index, the other filters are checked
+        # against the column arrays, and only the rows returned are decoded.
+        table = self.table(TABLE_APARTMENT_UNIT)
+        filters = filters or {}
+        for column in filters:
+            if column not in table.indexes:
+                raise ValueError(f"Cannot search on {column}.")
+        if order_by is not None and order_by not in tuple(table.indexes) + (PRIMARY_KEYS[TABLE_APARTMENT_UNIT],):
+            raise ValueError(f"Cannot sort on {order_by}.")
+        plans = sorted(((table.indexes[column], value, table.indexes[column].spans(value))
+                        for column, value in filters.items()),
+                       key=lambda plan: sum(stop - start for start, stop in plan[2]))
+        end = None if limit is None else offset + limit
+        custom_order = order_by is not None and order_by != PRIMARY_KEYS[TABLE_APARTMENT_UNIT]
+        if plans:
+            index, _, spans = plans[0]
+            candidates = sum(stop - start for start, stop in spans)
+            # With a limit in key order, walking the rows in order and stopping
+            # early beats collecting and sorting every candidate when matches are
+            # dense enough to reach the limit within that many rows
+            if end is not None and not custom_order and end * table.count < candidates * candidates:
+                checks = [other.matcher(value) for other, value, _ in plans]
+                order = reversed(range(table.count)) if descending else range(table.count)
+                matched = (ordinal for ordinal in order if all(check(ordinal) for check in checks))
+                return table.rows(islice(matched, offset, end))
+            checks = [other.matcher(value) for other, value, _ in plans[1:]]
+            ordinals = sorted(ordinal for start, stop in spans for ordinal in index.ordinals[start:stop]
+                              if all(check(ordinal) for check in checks))
+        else:
+            ordinals = range(table.count)
+        # Rows are stored in primary key order, so only other orderings need a sort
+        if custom_order:
+            order_index = table.indexes[order_by]
+            ordinals = sorted(ordinals, key=lambda ordinal: (order_index.sort_key(ordinal), ordinal), reverse=descending)
+        elif descending:
+            ordinals = reversed(ordinals)
+        return table.rows(islice(ordinals, offset, end))
+
+    def close(self):
+        for table in self.tables.values():
+            table.release()
+        self._buffer.release()
+        self._map.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+def change_position(cursor):
+    # The last change_id committed as of the cursor's transaction, or None
+    # without a ChangeSequence. Ids are handed out from it in commit order
+    # (see UnitOfWork.flush), so every change up to it is already visible and
+    # none below it can still commit.
+    try:
+        cursor.execute(f"SELECT last_id FROM {TABLE_CHANGE_SEQUENCE} WHERE sequence_id = 1")
+        rows = cursor.fetchall()
+    except mysql.connector.Error:
+        return None
+    return rows[0][0] if rows else None
+
+def dump_tables(connection):
+    # Every row of the snapshot tables plus the ChangeLog position they
+    # reflect, all read in one transaction so the two agree
+    connection.rollback()
+    cursor = connection.cursor()
+    try:
+        change_id = change_position(cursor)
+        if change_id is None:
+            logging.info(f"No {TABLE_CHANGE_SEQUENCE}; the next build will be a full one as well")
+        tables = {}
+        for table_name in SNAPSHOT_TABLES:
+            cursor.execute(f"SELECT * FROM {table_name} ORDER BY {PRIMARY_KEYS[table_name]}")
+            columns = cursor.column_names
+            rows = [json.loads(json.dumps(row, default=str)) for row in cursor.fetchall()]
+            tables[table_name] = (columns, rows)
+        return tables, change_id
+    finally:
+        cursor.close()
+        connection.rollback()
+
+def apply_changes(snapshot, changes):
+    # The snapshot's rows with the changes replayed on top, or None if a change
+    # no longer fits the snapshot's columns; returns (tables, last change_id)
+    tables = {}
+    for table_name in SNAPSHOT_TABLES:
+        table = snapshot.table(table_name)
+        key_index = table.columns.index(PRIMARY_KEYS[table_name])
+        rows = {}
+        for ordinal in range(table.count):
+            row = table.raw_row(ordinal)
+            rows[row[key_index]] = row
+        tables[table_name] = (table.columns, rows)
+    change_id = snapshot.change_id
+    for change in changes:
+        change_id = change["change_id"]
+        if change["table"] not in tables:
+            continue
+        columns, rows = tables[change["table"]]
+        if change["after"] is None:
+            rows.pop(int(change["key"]), None)
+            continue
+        if set(change["after"]) != set(columns):
+            return None, change_id
+        rows[int(change["key"])] = [change["after"][column] for column in columns]
+    return {table_name: (columns, [rows[key] for key in sorted(rows)])
+            for table_name, (columns, rows) in tables.items()}, change_id
+
+def replay_changes(connection, snapshot):
+    # (tables, change_id, changes replayed) bringing the snapshot up to date,
+    # or None if it has to be rebuilt. The position, the row counts and the
+    # changes are read in one transaction, so they describe the same moment.
+    connection.rollback()
+    cursor = connection.cursor()
+    try:
+        position = change_position(cursor)
+        if position is None:
+            logging.info(f"No {TABLE_CHANGE_SEQUENCE} to replay from; rebuilding the snapshot")
+            return None
+        counts = {}
+        for table_name in SNAPSHOT_TABLES:
+            cursor.execute(f"SELECT COUNT(*) FROM {table_name}")
+            ((counts[table_name],),) = cursor.fetchall()
+        changes = list(tail(connection, snapshot.change_id))
+    finally:
+        cursor.close()
+        connection.rollback()
+    tables, _ = apply_changes(snapshot, changes)
+    if tables is None:
+        logging.info("The table columns changed since the last snapshot; rebuilding it")
+        return None
+    drifted = [table_name for table_name, (_, rows) in tables.items() if len(rows) != counts[table_name]]
+    if drifted:
+        logging.warning(f"{', '.join(drifted)} changed without a ChangeLog entry (is every writer running with "
+                        "APARTMENT_AUDIT=1?); rebuilding the snapshot")
+        return None
+    return tables, position, len(changes)
+
+def build_snapshot(pool=None, path=SNAPSHOT_PATH, full=False):
+    # Refreshes the snapshot at path; returns how many changes were replayed,
+    # or None after a full rebuild
+    previous = None
+    if not full:
+        try:
+            previous = Snapshot(path)
+        except (OSError, ValueError) as e:
+            logging.info(f"Building a full snapshot: {e}")
+    if previous is not None and previous.change_id is not None:
+        full_at = previous.full_at and datetime.fromisoformat(previous.full_at)
+        if full_at is None or (datetime.now() - full_at).total_seconds() > SNAPSHOT_FULL_EVERY:
+            logging.info("The last full dump is too old; rebuilding the snapshot")
+            previous.close()
+            previous = None
+    try:
+        with connect_to_database(pool) as connection:
+            if not connection:
+                raise ConnectionError("Database unreachable; the snapshot was not refreshed")
+            if previous is not None and previous.change_id is not None:
+                replayed = replay_changes(connection, previous)
+                if replayed is not None:
+                    tables, change_id, count = replayed
+                    write_snapshot(path, tables, change_id, previous.full_at)
+                    return count
+            tables, change_id = dump_tables(connection)
+            write_snapshot(path, tables, change_id)
+            return None
+    finally:
+        if previous is not None:
+            previous.close()
+
+def browse_offline(path=SNAPSHOT_PATH):
+    # The regular-user menu, answered from the snapshot
+    try:
+        snapshot = Snapshot(path)
+    except (OSError, ValueError) as e:
+        logging.error(f"No snapshot to browse offline: {e}")
+        return
+    print(f"The database is unreachable. Showing the snapshot taken {snapshot.created_at} (read-only).")
+    with snapshot:
+        while True:
+            choice = display_menu(["View Apartment Details", "View Tenant Details", "View Parking Details", "Search Apartments", "Exit"])
+            if choice == "1":
+                show_rows(snapshot.rows(TABLE_APARTMENT_UNIT), f"No data found in {TABLE_APARTMENT_UNIT}.")
+            elif choice == "2":
+                show_rows(snapshot.rows(TABLE_TENANT_OWNER), f"No data found in {TABLE_TENANT_OWNER}.")
+            elif choice == "3":
+                show_rows(snapshot.rows(TABLE_PARKING), f"No data found in {TABLE_PARKING}.")
+            elif choice == "4":
+                criteria = prompt_search_criteria()
+                if criteria is not None:
+                    show_rows(snapshot.search(criteria), "No apartments match your search.")
+            elif choice == "5":
+                break
+            else:
+                print("Invalid choice. Please try again.")
+
+def main():
+    from export import parse_search_criteria
+    parser = argparse.ArgumentParser(description="Local read-only snapshot of the apartment tables.")
+    parser.add_argument("--path", default=SNAPSHOT_PATH)
+    commands = parser.add_subparsers(dest="command", required=True)
+    build = commands.add_parser("build", help="create or incrementally refresh the snapshot")
+    build.add_argument("--full", action="store_true", help="dump every table instead of replaying changes")
+    commands.add_parser("info", help="show when the snapshot was taken and its row counts")
+    view = commands.add_parser("view", help="print a table from the snapshot")
+    view.add_argument("table", choices=SNAPSHOT_TABLES)
+    get = commands.add_parser("get", help="print one record by primary key")
+    get.add_argument("table", choices=SNAPSHOT_TABLES)
+    get.add_argument("key", type=int)
+    search = commands.add_parser("search", help="search apartments in the snapshot")
+    search.add_argument("--filter", action="append", default=[], metavar="COLUMN=VALUE")
+    search.add_argument("--order-by")
+    search.add_argument("--descending", action="store_true")
+    search.add_argument("--limit", type=int)
+    args = parser.parse_args()
+
+    if args.command == "build":
+        try:
+            replayed = build_snapshot(get_pool(), args.path, args.full)
+        except (ConnectionError, mysql.connector.Error) as e:
+            logging.error(e)
+            raise SystemExit(1)
+        print("Built a full snapshot." if replayed is None else f"Replayed {replayed} changes.")
+        return
+    with Snapshot(args.path) as snapshot:
+        if args.command == "info":
+            print(f"Taken {snapshot.created_at} (last full dump {snapshot.full_at}), change log position {snapshot.change_id}")
+            for name, table in snapshot.tables.items():
+                print(f"{name}: {table.count} rows")
+        elif args.command == "view":
+            show_rows(snapshot.rows(args.table), f"No data found in {args.table}.")
+        elif args.command == "get":
+            row = snapshot.get(args.table, args.key)
+            print(row if row is not None else f"No {args.table} with {PRIMARY_KEYS[args.table]} {args.key}.")
+        else:
+            criteria = parse_search_criteria(args.filter)
+            show_rows(snapshot.search(criteria, args.order_by, args.descending, args.limit),
+                      "No apartments match your search.")
+
+if __name__ == "__main__":
+    main()
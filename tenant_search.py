@@ -0,0 +1,252 @@
+import argparse
+import heapq
+import logging
+import threading
+from itertools import islice
+
+import mysql.connector
+from mysql.connector import errorcode
+
+from apartment import (
+    DEFAULT_PAGE_SIZE,
+    PRIMARY_KEYS,
+    TABLE_PARKING,
+    TABLE_TENANT_OWNER,
+    connect_to_database,
+    get_cursor,
+    get_pool,
+    record_change_listeners,
+)
+from schema import existing_indexes
+
+# Columns matched per table; results carry the primary key and these columns
+SEARCH_FIELDS = {
+    TABLE_TENANT_OWNER: ("name", "contact_info"),
+    TABLE_PARKING: ("vehicle_details",),
+}
+
+# Placeholder values that are never worth matching
+EMPTY_VALUES = {"", "none"}
+
+# Results scoring below this are dropped; 0.3 keeps one-letter typos in
+# names of five or more characters
+MIN_SCORE = 0.3
+
+# Upper bound on records scored per query, which keeps unselective queries
+# (a two-letter prefix on 100k names) in the millisecond range
+MAX_CANDIDATES = 5000
+
+# The ngram parser indexes every 2-character slice (ngram_token_size), so
+# partial phone numbers and names match without a leading prefix
+FULLTEXT_INDEXES = {
+    TABLE_TENANT_OWNER: {"ft_tenant_name_contact": ("name", "contact_info")},
+    TABLE_PARKING: {"ft_parking_vehicle": ("vehicle_details",)},
+}
+
+def tokenize(text):
+    text = "".join(ch if ch.isalnum() else " " for ch in str(text).lower())
+    return [token for token in text.split() if token not in EMPTY_VALUES]
+
+def trigrams(token):
+    # Two leading pad characters weight the start of a word, so prefixes rank first
+    padded = f"  {token} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+class TrigramIndex:
+    # Inverted index from trigram to record keys. A query only touches the
+    # posting lists of its own trigrams, and similarity (Dice coefficient of
+    # shared trigrams) tolerates typos that exact or LIKE matching would miss.
+    def __init__(self):
+        self._postings = {}
+        self._documents = {}
+
+    def __len__(self):
+        return len(self._documents)
+
+    def add(self, key, record, fields):
+        self.remove(key)
+        tokens = [token for field in fields for token in tokenize(record[field])]
+        if not tokens:
+            return
+        grams = set().union(*(trigrams(token) for token in tokens))
+        self._documents[key] = (tokens, grams, record)
+        for gram in grams:
+            self._postings.setdefault(gram, set()).add(key)
+
+    def remove(self, key):
+        document = self._documents.pop(key, None)
+        if document is None:
+            return
+        for gram in document[1]:
+            keys = self._postings[gram]
+            keys.discard(key)
+            if not keys:
+                del self._postings[gram]
+
+    def search(self, query, limit=20, min_score=MIN_SCORE):
+        terms = tokenize(query)
+        if not terms:
+            return []
+        query_grams = set().union(*(trigrams(term) for term in terms))
+        # Candidates come from the rarest trigrams first; trigrams shared by
+        # most of the table ("ten" in every Tenant...) only add noise
+        candidates = set()
+        for keys in sorted((self._postings.get(gram, ()) for gram in query_grams), key=len):
+            if candidates and len(candidates) + len(keys) > MAX_CANDIDATES:
+                break
+            candidates.update(islice(keys, MAX_CANDIDATES))
+        scored = []
+        for key in candidates:
+            tokens, grams, record = self._documents[key]
+            score = 2 * len(query_grams & grams) / (len(query_grams) + len(grams))
+            # Exact, prefix and substring hits outrank fuzzy ones of similar overlap
+            for term in terms:
+                if term in tokens:
+                    score += 1.0
+                elif any(token.startswith(term) for token in tokens):
+                    score += 0.5
+                elif any(term in token for token in tokens):
+                    score += 0.25
+            if score >= min_score:
+                scored.append((round(score, 4), key, record))
+        return heapq.nlargest(limit, scored, key=lambda match: match[:2])
+
+class TenantSearch:
+    # One trigram index per searchable table, loaded on first use and kept in
+    # step with insert/update/delete_record through record_change_listeners:
+    # a known key re-reads that one row, an unknown one (bulk writes) reloads
+    # the table on the next search.
+    def __init__(self, source=None):
+        self.source = source
+        self._indexes = {table_name: TrigramIndex() for table_name in SEARCH_FIELDS}
+        self._stale = set(SEARCH_FIELDS)
+        self._lock = threading.Lock()
+        record_change_listeners.append(self.record_changed)
+
+    def _select(self, table_name):
+        columns = (PRIMARY_KEYS[table_name],) + SEARCH_FIELDS[table_name]
+        return f"SELECT {', '.join(columns)} FROM {table_name}"
+
+    def _record(self, table_name, row):
+        return dict(zip((PRIMARY_KEYS[table_name],) + SEARCH_FIELDS[table_name], row))
+
+    def load(self, table_name):
+        index = TrigramIndex()
+        fields = SEARCH_FIELDS[table_name]
+        with get_cursor(self.source) as cursor:
+            cursor.execute(self._select(table_name))
+            while rows := cursor.fetchmany(DEFAULT_PAGE_SIZE):
+                for row in rows:
+                    index.add(row[0], self._record(table_name, row), fields)
+        with self._lock:
+            self._indexes[table_name] = index
+            self._stale.discard(table_name)
+
+    def record_changed(self, table_name, key):
+        if table_name not in SEARCH_FIELDS:
+            return
+        # A stale table is reloaded in full by the next search, so re-reading
+        # one of its rows now would be wasted
+        with self._lock:
+            if key is None or table_name in self._stale:
+                self._stale.add(table_name)
+                return
+        key = int(key)
+        # Runs after the writer's commit, so a failed read must not reach the
+        # writer; the table is reloaded on the next search instead
+        try:
+            with get_cursor(self.source) as cursor:
+                cursor.execute(f"{self._select(table_name)} WHERE {PRIMARY_KEYS[table_name]} = %s", (key,))
+                rows = cursor.fetchall()
+        except mysql.connector.Error as e:
+            logging.error(f"Error re-reading {table_name} {key}: {e}")
+            rows = None
+        with self._lock:
+            if rows is None:
+                self._stale.add(table_name)
+            elif rows:
+                self._indexes[table_name].add(key, self._record(table_name, rows[0]), SEARCH_FIELDS[table_name])
+            else:
+                self._indexes[table_name].remove(key)
+
+    def search(self, query, tables=None, limit=20):
+        # Returns up to limit {"table", "key", "score", "record"} matches, best first
+        tables = tables or tuple(SEARCH_FIELDS)
+        for table_name in tables:
+            if table_name in self._stale:
+                self.load(table_name)
+        matches = []
+        with self._lock:
+            for table_name in tables:
+                for score, key, record in self._indexes[table_name].search(query, limit):
+                    matches.append({"table": table_name, "key": key, "score": score, "record": record})
+        matches.sort(key=lambda match: match["score"], reverse=True)
+        return matches[:limit]
+
+def create_fulltext_indexes(connection):
+    created = []
+    cursor = connection.cursor()
+    try:
+        for table_name, indexes in FULLTEXT_INDEXES.items():
+            present = existing_indexes(connection, table_name)
+            for name, columns in indexes.items():
+                if name not in present:
+                    cursor.execute(f"CREATE FULLTEXT INDEX {name} ON {table_name} ({', '.join(columns)}) WITH PARSER ngram")
+                    created.append(name)
+    finally:
+        cursor.close()
+    return created
+
+def fulltext_search(connection, query, tables=None, limit=20):
+    # Server-side search over the FULLTEXT indexes, for one-off lookups where
+    # loading a TenantSearch index would read whole tables; relevance comes
+    # from MySQL's MATCH ... AGAINST score
+    matches = []
+    for table_name in tables or tuple(SEARCH_FIELDS):
+        fields = SEARCH_FIELDS[table_name]
+        columns = (PRIMARY_KEYS[table_name],) + fields
+        match = f"MATCH ({', '.join(fields)}) AGAINST (%s IN NATURAL LANGUAGE MODE)"
+        with get_cursor(connection) as cursor:
+            cursor.execute(f"SELECT {', '.join(columns)}, {match} AS score FROM {table_name} "
+                           f"WHERE {match} ORDER BY score DESC LIMIT %s", (query, query, limit))
+            for row in cursor.fetchall():
+                matches.append({"table": table_name, "key": row[0], "score": round(float(row[-1]), 4),
+                                "record": dict(zip(columns, row[:-1]))})
+    matches.sort(key=lambda match: match["score"], reverse=True)
+    return matches[:limit]
+
+def main():
+    parser = argparse.ArgumentParser(description="Search tenants by name or phone and parking by vehicle.")
+    parser.add_argument("query", nargs="?")
+    parser.add_argument("--table", choices=("tenants", "vehicles"), help="limit the search to one table")
+    parser.add_argument("--limit", type=int, default=20)
+    parser.add_argument("--trigram", action="store_true",
+                        help="rank with the typo-tolerant in-memory index (loads the searched tables)")
+    parser.add_argument("--setup", action="store_true", help="create the FULLTEXT indexes the default search uses")
+    args = parser.parse_args()
+
+    pool = get_pool()
+    try:
+        if args.setup:
+            with connect_to_database(pool) as connection:
+                if connection:
+                    print(f"Created: {', '.join(create_fulltext_indexes(connection)) or 'nothing'}")
+        if not args.query:
+            return
+        tables = {"tenants": (TABLE_TENANT_OWNER,), "vehicles": (TABLE_PARKING,)}.get(args.table)
+        if args.trigram:
+            matches = TenantSearch(pool).search(args.query, tables, args.limit)
+        else:
+            matches = fulltext_search(pool, args.query, tables, args.limit)
+        for match in matches:
+            print(f"{match['score']:>7.3f}  {match['table']}  {match['record']}")
+        if not matches:
+            print("No matches found.")
+    except mysql.connector.Error as e:
+        logging.error(e)
+        if e.errno == errorcode.ER_FT_MATCHING_KEY_NOT_FOUND:
+            logging.error("Create the FULLTEXT indexes with --setup, or search with --trigram.")
+        raise SystemExit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,38 @@
+# Tests run against the SQLite stand-in in benchmarks/sqlite_backend.py, one
+# fresh database file per test, so no MySQL server is needed.
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import apartment
+from benchmarks.sqlite_backend import SQLitePool, create_schema
+from benchmarks.suite import load
+
+@pytest.fixture
+def pool(tmp_path, monkeypatch):
+    pool = SQLitePool(str(tmp_path / "apartment.db"), size=2)
+    with pool.connection() as connection:
+        create_schema(connection)
+    monkeypatch.setattr(apartment, "_pool", pool)
+    monkeypatch.setattr(apartment, "AUDIT_ENABLED", False)
+    apartment.query_cache.clear()
+    yield pool
+    pool.close()
+
+@pytest.fixture
+def loaded(pool):
+    # 200 apartments and tenants, 100 parking spaces from the benchmark generator
+    with pool.connection() as connection:
+        load(connection, 200, 0)
+    return pool
+
+@pytest.fixture
+def audited(loaded, monkeypatch):
+    from audit import create_audit_tables
+    with loaded.connection() as connection:
+        create_audit_tables(connection)
+    monkeypatch.setattr(apartment, "AUDIT_ENABLED", True)
+    return loaded
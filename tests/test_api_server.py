@@ -0,0 +1,59 @@
+import json
+import threading
+from urllib.error import HTTPError
+from urllib.request import Request, urlopen
+
+import pytest
+
+import apartment
+from api_server import ApiServer
+
+@pytest.fixture
+def api(loaded):
+    listeners = list(apartment.table_change_listeners)
+    server = ApiServer(("127.0.0.1", 0), loaded)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{server.server_address[1]}"
+    server.shutdown()
+    server.server_close()
+    apartment.table_change_listeners[:] = listeners
+
+def call(url, method="GET", payload=None):
+    data = None if payload is None else json.dumps(payload).encode()
+    request = Request(url, data, {"Content-Type": "application/json"}, method=method)
+    try:
+        with urlopen(request, timeout=10) as response:
+            return response.status, json.loads(response.read())
+    except HTTPError as e:
+        return e.code, json.loads(e.read())
+
+@pytest.mark.parametrize("query", ["limit=0", "limit=-5", "limit=ten", "after=x"])
+def test_bad_page_parameters_are_client_errors(api, query):
+    status, body = call(f"{api}/tables/Parking?{query}")
+    assert status == 400
+    assert "error" in body
+
+@pytest.mark.parametrize("query", ["limit=0", "offset=-1", "limit=abc"])
+def test_bad_search_windows_are_client_errors(api, query):
+    assert call(f"{api}/apartments/search?bedrooms=2&{query}")[0] == 400
+
+def test_pages_chain_through_the_table(api):
+    seen = []
+    status, body = call(f"{api}/tables/Parking?limit=30")
+    while True:
+        assert status == 200
+        seen += [row["parking_id"] for row in body["rows"]]
+        if body["next"] is None:
+            break
+        status, body = call(f"{api}/tables/Parking?limit=30&after={body['next']}")
+    assert seen == list(range(1, 101))
+
+def test_writes_report_ids_and_counts(api):
+    space = {"parking_space_number": 9001, "vehicle_details": "NEW1", "availability_status": "Occupied"}
+    status, body = call(f"{api}/tables/Parking", "POST", space)
+    assert (status, body) == (201, {"id": 101})
+    assert call(f"{api}/tables/Parking/101", "PATCH", {"vehicle_details": "NEW2"}) == (200, {"updated": 1})
+    assert call(f"{api}/tables/Parking/101")[1]["vehicle_details"] == "NEW2"
+    assert call(f"{api}/tables/Parking/101", "DELETE") == (200, {"deleted": 1})
+    assert call(f"{api}/tables/Parking/101", "DELETE") == (404, {"deleted": 0})
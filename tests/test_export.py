@@ -0,0 +1,39 @@
+import csv
+import json
+
+import pytest
+
+from apartment import TABLE_APARTMENT_UNIT, TABLE_PARKING, get_table_columns
+from export import export_table
+
+def test_csv_export_writes_every_row(loaded, tmp_path):
+    path = str(tmp_path / "parking.csv")
+    assert export_table(loaded, TABLE_PARKING, path, page_size=7) == 100
+    with open(path, newline="") as source:
+        rows = list(csv.reader(source))
+    assert rows[0] == list(get_table_columns(loaded, TABLE_PARKING))
+    assert [int(row[0]) for row in rows[1:]] == list(range(1, 101))
+
+def test_jsonl_export_applies_the_filter(loaded, tmp_path):
+    path = str(tmp_path / "units.jsonl")
+    count = export_table(loaded, TABLE_APARTMENT_UNIT, path, where="bedrooms = %s", params=(2,))
+    with open(path) as source:
+        rows = [json.loads(line) for line in source]
+    assert count == len(rows) > 0
+    assert all(row["bedrooms"] == 2 for row in rows)
+
+@pytest.mark.parametrize("fmt", ["csv", "jsonl"])
+def test_empty_export_still_writes_the_file(loaded, tmp_path, fmt):
+    path = str(tmp_path / f"none.{fmt}")
+    assert export_table(loaded, TABLE_PARKING, path, where="parking_id < %s", params=(0,)) == 0
+    with open(path) as source:
+        lines = source.read().splitlines()
+    assert lines == ([",".join(get_table_columns(loaded, TABLE_PARKING))] if fmt == "csv" else [])
+
+def test_empty_parquet_export_keeps_the_columns(loaded, tmp_path):
+    pyarrow_parquet = pytest.importorskip("pyarrow.parquet")
+    path = str(tmp_path / "none.parquet")
+    assert export_table(loaded, TABLE_PARKING, path, where="parking_id < %s", params=(0,)) == 0
+    table = pyarrow_parquet.read_table(path)
+    assert table.num_rows == 0
+    assert table.column_names == list(get_table_columns(loaded, TABLE_PARKING))
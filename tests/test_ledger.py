@@ -0,0 +1,89 @@
+from decimal import Decimal
+
+import pytest
+
+from ledger import (
+    create_ledger_tables,
+    fetch,
+    monthly_statements,
+    normalize_period,
+    rebuild_balances,
+    record_charge,
+    record_payment,
+    tenant_balance,
+    tenants_in_arrears,
+)
+
+# SQLite hands DECIMAL columns back as floats
+def money(value):
+    return Decimal(str(value)).quantize(Decimal("0.01"))
+
+# (tenant, period, charge or payment, amount); periods arrive out of order and
+# unpadded, the way a clerk catching up on old months would enter them
+ENTRIES = [
+    (1, "2026-02", "charge", "1200"),
+    (1, "2026-03", "charge", "1200"),
+    (1, "2026-1", "charge", "1150"),
+    (1, "2026-02", "payment", "1000"),
+    (1, "2025-12", "payment", "300"),
+    (2, "2026-10", "charge", "900"),
+    (2, "2026-9", "charge", "900"),
+    (2, "2026-10", "payment", "1800"),
+    (3, "2026-01", "payment", "50"),
+]
+
+@pytest.fixture
+def ledger(loaded):
+    with loaded.connection() as connection:
+        create_ledger_tables(connection)
+    for tenant_id, period, kind, amount in ENTRIES:
+        record = record_charge if kind == "charge" else record_payment
+        record(loaded, tenant_id, period, amount)
+    return loaded
+
+def expected_statement(tenant_id, period):
+    signed = [(normalize_period(p), Decimal(a) if kind == "charge" else -Decimal(a))
+              for t, p, kind, a in ENTRIES if t == tenant_id]
+    opening = sum((amount for p, amount in signed if p < period), Decimal("0"))
+    charges = sum((amount for p, amount in signed if p == period and amount > 0), Decimal("0"))
+    payments = sum((-amount for p, amount in signed if p == period and amount < 0), Decimal("0"))
+    return opening, charges, payments, opening + charges - payments
+
+def statement_row(statement):
+    return tuple(money(statement[key]) for key in ("opening_balance", "charges", "payments", "closing_balance"))
+
+@pytest.mark.parametrize("period", ["2025-12", "2026-01", "2026-02", "2026-03", "2026-09", "2026-10", "2026-11"])
+def test_statements_match_the_entries(ledger, period):
+    statements = {row["tenant_id"]: row for row in monthly_statements(ledger, period)}
+    # A tenant has a statement once they have any entry up to the period
+    active = {t for t, p, _, _ in ENTRIES if normalize_period(p) <= period}
+    assert set(statements) == active
+    for tenant_id in active:
+        assert statement_row(statements[tenant_id]) == expected_statement(tenant_id, period)
+
+def test_unpadded_periods_are_stored_padded(ledger):
+    periods = {period for (period,) in fetch(ledger, "SELECT DISTINCT period FROM RentLedger")}
+    assert periods == {"2025-12", "2026-01", "2026-02", "2026-03", "2026-09", "2026-10"}
+    assert monthly_statements(ledger, "2026-1") == monthly_statements(ledger, "2026-01")
+
+def test_running_balances(ledger):
+    assert money(tenant_balance(ledger, 1)["balance"]) == Decimal("2250.00")
+    assert money(tenant_balance(ledger, 1)["paid"]) == Decimal("1300.00")
+    assert money(tenant_balance(ledger, 2)["balance"]) == Decimal("0.00")
+    assert money(tenant_balance(ledger, 4)["balance"]) == Decimal("0.00")
+    assert [row["tenant_id"] for row in tenants_in_arrears(ledger)] == [1]
+
+def test_rebuild_reproduces_the_incremental_balances(ledger):
+    def summaries():
+        return (fetch(ledger, "SELECT tenant_id, charged, paid, balance FROM TenantBalance ORDER BY tenant_id"),
+                fetch(ledger, "SELECT * FROM TenantPeriodBalance ORDER BY tenant_id, period"))
+    incremental = summaries()
+    rebuild_balances(ledger)
+    assert summaries() == incremental
+
+@pytest.mark.parametrize("period", ["2026-13", "2026", "26-01", "2026-01-05", ""])
+def test_invalid_periods_are_rejected(ledger, period):
+    with pytest.raises(ValueError):
+        record_charge(ledger, 1, period, "10")
+    with pytest.raises(ValueError):
+        monthly_statements(ledger, period)
@@ -0,0 +1,69 @@
+import pytest
+
+import apartment
+from apartment import TABLE_APARTMENT_UNIT, TABLE_PARKING, delete_record, find_apartments, insert_record, update_record
+from snapshot import SNAPSHOT_TABLES, Snapshot, build_snapshot
+
+# SQLite returns dates as strings and the snapshot as dates, so rows are
+# compared by their text
+def text(rows):
+    return [tuple(map(str, row)) for row in rows]
+
+def table_rows(pool, table_name):
+    return text(apartment.iter_table_rows(pool, table_name))
+
+@pytest.fixture
+def path(tmp_path):
+    return str(tmp_path / "apartment.snapshot")
+
+SEARCHES = [
+    ({}, None, False, None, 0),
+    ({"bedrooms": (2, 3)}, None, False, 25, 0),
+    ({"bedrooms": 1, "occupancy_status": ["Vacant", "Reserved"]}, None, True, 10, 5),
+    ({"occupancy_status": "Vacant", "floor_number": (3, 8)}, None, False, 5, 0),
+    ({"square_footage": (800, None)}, "square_footage", True, 40, 10),
+    ({}, "floor_number", False, 15, 100),
+]
+
+@pytest.mark.parametrize("filters, order_by, descending, limit, offset", SEARCHES)
+def test_search_matches_the_database(audited, path, filters, order_by, descending, limit, offset):
+    assert build_snapshot(audited, path) is None
+    with Snapshot(path) as snapshot:
+        expected = text(find_apartments(audited, filters, order_by, descending, limit, offset, cached=False))
+        assert expected
+        assert text(snapshot.search(filters, order_by, descending, limit, offset)) == expected
+
+def test_get_and_rows_match_the_database(audited, path):
+    build_snapshot(audited, path)
+    with Snapshot(path) as snapshot:
+        for table_name in SNAPSHOT_TABLES:
+            assert text(snapshot.rows(table_name)) == table_rows(audited, table_name)
+        assert str(snapshot.get(TABLE_PARKING, 7)) == str(next(apartment.iter_table_rows(
+            audited, TABLE_PARKING, "parking_id = %s", (7,))))
+        assert snapshot.get(TABLE_PARKING, 10 ** 6) is None
+
+def test_logged_changes_are_replayed(audited, path):
+    build_snapshot(audited, path)
+    parking_id = insert_record(audited, TABLE_PARKING, {
+        "parking_space_number": 9001, "vehicle_details": "NEW1", "availability_status": "Occupied"}).lastrowid
+    update_record(audited, TABLE_APARTMENT_UNIT, "unit_number", 3, {"occupancy_status": "Maintenance"})
+    delete_record(audited, TABLE_PARKING, "parking_id", 5)
+    assert build_snapshot(audited, path) == 3
+    with Snapshot(path) as snapshot:
+        for table_name in SNAPSHOT_TABLES:
+            assert text(snapshot.rows(table_name)) == table_rows(audited, table_name)
+        assert snapshot.get(TABLE_PARKING, parking_id).vehicle_details == "NEW1"
+        assert snapshot.get(TABLE_PARKING, 5) is None
+        assert [row.unit_number for row in snapshot.search({"occupancy_status": "Maintenance"})] == \
+            [row.unit_number for row in find_apartments(audited, {"occupancy_status": "Maintenance"}, cached=False)]
+    # Nothing new to replay
+    assert build_snapshot(audited, path) == 0
+
+def test_unlogged_writes_force_a_rebuild(audited, path, monkeypatch):
+    build_snapshot(audited, path)
+    monkeypatch.setattr(apartment, "AUDIT_ENABLED", False)
+    insert_record(audited, TABLE_PARKING, {
+        "parking_space_number": 9002, "vehicle_details": "NEW2", "availability_status": "Occupied"})
+    assert build_snapshot(audited, path) is None
+    with Snapshot(path) as snapshot:
+        assert text(snapshot.rows(TABLE_PARKING)) == table_rows(audited, TABLE_PARKING)
@@ -0,0 +1,76 @@
+import pytest
+
+import apartment
+from apartment import (
+    TABLE_APARTMENT_UNIT,
+    TABLE_PARKING,
+    WriteResult,
+    delete_record,
+    find_apartments,
+    insert_record,
+    record_change_listeners,
+    unit_of_work,
+    update_record,
+)
+
+def space(number, vehicle="None", status="Available"):
+    return {"parking_space_number": number, "vehicle_details": vehicle, "availability_status": status}
+
+def test_each_insert_keeps_its_own_id(pool):
+    # Both inserts run the same prepared statement on the pool's one idle
+    # connection; the first result must not change when the second runs
+    first = insert_record(pool, TABLE_PARKING, space(1))
+    second = insert_record(pool, TABLE_PARKING, space(2))
+    assert isinstance(first, WriteResult)
+    assert (first.lastrowid, second.lastrowid) == (1, 2)
+    assert first.rowcount == 1
+
+def test_update_and_delete_report_rows_changed(pool):
+    parking_id = insert_record(pool, TABLE_PARKING, space(1)).lastrowid
+    assert update_record(pool, TABLE_PARKING, "parking_id", parking_id, {"vehicle_details": "CAR1"}).rowcount == 1
+    assert update_record(pool, TABLE_PARKING, "parking_id", 999, {"vehicle_details": "CAR1"}).rowcount == 0
+    assert delete_record(pool, TABLE_PARKING, "parking_id", parking_id).rowcount == 1
+
+def test_listeners_get_the_inserted_key(pool, monkeypatch):
+    seen = []
+    monkeypatch.setattr(apartment, "record_change_listeners", record_change_listeners + [lambda *args: seen.append(args)])
+    insert_record(pool, TABLE_PARKING, space(1))
+    parking_id = insert_record(pool, TABLE_PARKING, space(2)).lastrowid
+    update_record(pool, TABLE_PARKING, "parking_id", parking_id, {"vehicle_details": "CAR2"})
+    assert seen == [(TABLE_PARKING, 1), (TABLE_PARKING, 2), (TABLE_PARKING, 2)]
+
+def test_failed_write_returns_none_outside_a_unit_and_raises_inside(pool):
+    insert_record(pool, TABLE_PARKING, space(1))
+    assert insert_record(pool, TABLE_PARKING, {**space(2), "parking_id": 1}) is None
+    with pytest.raises(apartment.mysql.connector.IntegrityError):
+        with unit_of_work(pool):
+            insert_record(pool, TABLE_PARKING, space(3))
+            insert_record(pool, TABLE_PARKING, {**space(4), "parking_id": 1})
+    # The unit rolled back, including its first insert
+    assert [row.parking_space_number for row in apartment.iter_table_rows(pool, TABLE_PARKING)] == [1]
+
+def test_writes_in_a_unit_return_results_too(pool):
+    with unit_of_work(pool):
+        first = insert_record(pool, TABLE_PARKING, space(1))
+        second = insert_record(pool, TABLE_PARKING, space(2))
+    assert (first.lastrowid, second.lastrowid) == (1, 2)
+
+@pytest.mark.parametrize("limit, offset", [(0, 0), (-1, 0), (5, -1)])
+def test_bad_page_windows_are_value_errors(loaded, limit, offset):
+    with pytest.raises(ValueError):
+        list(find_apartments(loaded, {}, limit=limit, offset=offset))
+
+def test_search_pages_follow_the_requested_order(loaded):
+    rows = list(find_apartments(loaded, {"bedrooms": (2, None)}, "square_footage", True, limit=30))
+    assert len(rows) == 30
+    keys = [(row.square_footage, row.unit_number) for row in rows]
+    assert keys == sorted(keys, reverse=True)
+    assert all(row.bedrooms >= 2 for row in rows)
+    assert list(find_apartments(loaded, {"bedrooms": (2, None)}, "square_footage", True, limit=10, offset=20)) == rows[20:]
+
+def test_cache_drops_pages_read_before_an_invalidation(pool):
+    cache = apartment.QueryCache(ttl=30)
+    generation = cache.generation(TABLE_APARTMENT_UNIT)
+    cache.invalidate(TABLE_APARTMENT_UNIT)
+    cache.put(TABLE_APARTMENT_UNIT, "query", (), ("unit_number",), [(1,)], generation)
+    assert cache.get(TABLE_APARTMENT_UNIT, "query", ()) is None